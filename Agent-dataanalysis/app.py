@@ -1,81 +1,158 @@
-from flask import Flask, request, render_template, send_from_directory
-import pandas as pd
+from flask import Flask, Response, jsonify, request, render_template
+from concurrent.futures import ThreadPoolExecutor
 import os
 import re
-import traceback
-import matplotlib.pyplot as plt
-from langchain_ollama import OllamaLLM
+import sys
 
-app = Flask(__name__)
+# Shared modules (pooled Ollama client, caches, ...) live in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pooled_llm import PooledOllama
+from ollama_client import OllamaError
+from completion_cache import get_cache
+from sse_stream import SSE_HEADERS, sse_event, stream_events
+from dataset_store import DatasetStore
+from code_executor import get_executor
+from execution_cache import cached_run, get_execution_cache
+from plot_store import PlotStore, send_plot
+from schema_summary import get_schema_cache, summarize_schema
+from job_queue import JobQueue, QueueFull, job_key, queue_full_response, register_job_routes
+from tracing import get_tracer
+
+app = Flask(__name__, static_folder=None)  # /static/ is served by serve_static, from STATIC_FOLDER
 UPLOAD_FOLDER = "uploads"
 STATIC_FOLDER = "static"
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(STATIC_FOLDER, exist_ok=True)
+datasets = DatasetStore(UPLOAD_FOLDER)  # Uploads parsed once, stored as Feather under their content hash
+plots = PlotStore(STATIC_FOLDER)  # Charts stored under their content hash, so concurrent users never collide
 
-llm = OllamaLLM(model="tinyllama")
+llm = PooledOllama(model="tinyllama", temperature=0)  # Greedy, so repeated questions hit the completion cache
+CODE_BLOCK_PATTERN = r"```(?:python)?\n(.*?)```"
+NO_CODE_MESSAGE = "(No code found in LLM response)"
+code_executor = ThreadPoolExecutor(max_workers=4)  # Waits on worker jobs while tokens keep streaming
+trace_config = {"callbacks": get_tracer().callbacks("data_app")}  # LLM spans when AGENT_TRACING=1
+# At most OLLAMA_NUM_PARALLEL generations at once; the same question on the same dataset shares one
+jobs = JobQueue(name="data-jobs")
 
 def extract_code_blocks(text):
     """Extract code between triple backticks"""
-    matches = re.findall(r"```(?:python)?\n(.*?)```", text, re.DOTALL)
+    matches = re.findall(CODE_BLOCK_PATTERN, text, re.DOTALL)
     return matches
 
-def run_code(code, df):
-    """Run code and capture stdout/stderr, exposing `df`, `pd`, and `plt`."""
-    import io, contextlib, traceback
-    output = io.StringIO()
-    # Anything you put in this dict will be visible to the exec-ed code
-    globals_dict = {
-        "df": df,          # ← the DataFrame from the CSV upload
-        "pd": pd,          # ← so the LLM can still import if it wants
-        "plt": plt         # ← for plots
-    }
+def build_prompt(prompt, schema):
+    """Prefix the user's prompt with the dataset's columns (if any), the most relevant first.
+
+    The catalog stays within SCHEMA_TOKEN_BUDGET tokens however wide the table is.
+    """
+    if schema is None:
+        return prompt
+    return (
+        f"Here is the dataset (in a DataFrame named `df`):\n\n{summarize_schema(schema, prompt)}"
+        "\n\nThe dataset is already loaded into a variable named `df`."
+        "\nAvoid reading and using `pd.read_csv()` or referencing files like 'dataset.csv'."
+        f"\n\n{prompt}"
+    )
+
+def run_code(code, dataset_id):
+    """Run code in a worker process and capture stdout/stderr, exposing `df`, `pd`, `plt` and `sns`.
+
+    The worker memory-maps the dataset's Feather file instead of receiving a pickled DataFrame,
+    and renders every figure the code leaves open. Images (saved or rendered) are stored in
+    STATIC_FOLDER under content-hash names. Repeated snippets on the same dataset are answered
+    from the execution cache. Returns {"output": text, "plots": [urls]}.
+    """
+    dataset_path = datasets.data_path(dataset_id) if dataset_id else None
+    result = cached_run(get_execution_cache(), get_executor(), code, dataset_path=dataset_path)
+    output = result["stdout"] + result["stderr"]
+    if result["error"] and result["error"] not in output:
+        output += result["error"]
+    return {"output": output, "plots": [f"/static/{name}" for name in plots.store(result["artifacts"])]}
+
+def resolve_dataset():
+    """Stores a new upload, or looks up the `dataset_id` of an earlier one.
+
+    Returns (dataset_id, schema); both None when the request has no dataset.
+    """
+    file = request.files.get("file")
+    if file and file.filename:
+        dataset_id = datasets.put(file.stream)
+    else:
+        dataset_id = request.form.get("dataset_id") or None
+    if not datasets.exists(dataset_id):
+        return None, None
+    return dataset_id, datasets.schema(dataset_id)
+
+def analysis_events(csv_prompt, dataset_id):
+    """The job's (event, data) pairs; the first code block runs as soon as it closes."""
+    if dataset_id:
+        yield "dataset", {"id": dataset_id}
     try:
-        with contextlib.redirect_stdout(output):
-            exec(code, globals_dict)
-    except Exception:
-        output.write(traceback.format_exc())
-    return output.getvalue()
+        tokens = llm.stream(csv_prompt, trace_config)
+        yield from stream_events(tokens, CODE_BLOCK_PATTERN, lambda code: run_code(code, dataset_id),
+                                 code_executor, NO_CODE_MESSAGE)
+    except OllamaError as e:
+        yield "error", {"error": str(e)}
+
+def prepare_job():
+    """Coalescing key and work for the request's prompt and dataset.
+
+    The upload is stored here, while the request body is still available.
+    """
+    prompt = request.form.get("prompt", "")
+    dataset_id, schema = resolve_dataset()
+    csv_prompt = build_prompt(prompt, schema)
+    return job_key(llm.model, csv_prompt, dataset_id), lambda: analysis_events(csv_prompt, dataset_id)
 
 @app.route("/", methods=["GET", "POST"])
 def index():
     response = ""
     code_result = ""
+    plot_urls = []
+    dataset_id = None
     if request.method == "POST":
-        prompt = request.form.get("prompt", "")
-        file = request.files.get("file")
-
-        if file:
-            df = pd.read_csv(file)
-            summary = df.describe(include="all").to_string()
-            preview = df.head(5).to_string()
-            csv_prompt = (
-             f"Here is a preview of the dataset (in a DataFrame named `df`):\n\n{preview}"
-            f"\n\nSummary stats:\n{summary}"
-            "\n\nThe dataset is already loaded into a variable named `df`."
-            "\nAvoid reading and using `pd.read_csv()` or referencing files like 'dataset.csv'."
-            f"\n\n{prompt}"
-            )
-            
-        else:
-            csv_prompt = prompt
-
-        # Ask LLaMA
-        llm_response = llm.invoke(csv_prompt)
-
-        # Extract and run code
-        code_blocks = extract_code_blocks(llm_response)
-        if code_blocks:
-            code_result = run_code(code_blocks[0], df)
-        else:
-            code_result = "(No code found in LLM response)"
-
-        response = llm_response
-
-    return render_template("index.html", response=response, result=code_result)
+        try:
+            job, _ = jobs.submit(*prepare_job())
+        except QueueFull as e:
+            return queue_full_response(e)
+        for _ in jobs.follow(job):  # Wait for the job, shared with any identical question
+            pass
+        dataset_id = job.result.get("dataset", {}).get("id")
+        done = job.result.get("done")
+        response = done["response"] if done else ""
+        code_result = done["output"] if done else job.error
+        plot_urls = done.get("plots", []) if done else []
+
+    return render_template("index.html", response=response, result=code_result, plots=plot_urls,
+                           dataset_id=dataset_id)
+
+@app.route("/stream", methods=["POST"])
+def stream():
+    """Stream the job's events as Server-Sent Events; 429 when the queue is full."""
+    try:
+        job, _ = jobs.submit(*prepare_job())
+    except QueueFull as e:
+        return queue_full_response(e)
+    return Response((sse_event(event, data) for event, data in jobs.follow(job)),
+                    mimetype="text/event-stream", headers=SSE_HEADERS)
+
+# POST /jobs and GET /jobs/<id>, for clients that poll instead of holding a stream open
+register_job_routes(app, jobs, prepare_job)
+
+# /metrics in Prometheus format, plus request metrics when AGENT_TRACING=1
+get_tracer().instrument_flask(app, "data_app", collectors={"completion_cache": lambda: get_cache().stats(),
+                                                           "execution_cache": lambda: get_execution_cache().stats(),
+                                                           "sandbox": lambda: dict(get_executor().stats),
+                                                           "schema_cache": lambda: get_schema_cache().stats(),
+                                                           "plots": plots.stats,
+                                                           "jobs": jobs.stats})
+
+@app.route("/cache/stats")
+def cache_stats():
+    return jsonify(dict(get_cache().stats(), execution=get_execution_cache().stats()))
 
 @app.route("/static/<filename>")
 def serve_static(filename):
-    return send_from_directory(STATIC_FOLDER, filename)
+    return send_plot(STATIC_FOLDER, filename)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,142 @@
+# agent_sessions.py
+"""Per-user agent sessions with idle eviction under a memory cap.
+
+Each session owns whatever state its factory builds (an agent, a dataset path,
+...) plus a dedicated `code_executor` worker whose namespace persists between
+tool calls, so variables computed in one step are reused in the next instead
+of recomputed. Sessions are independent and may be used from many threads at
+once. Sessions idle for longer than `idle_ttl`, and the least recently used idle
+sessions whenever the total worker memory exceeds `memory_cap_mb` (or there are
+more than `max_sessions`), are closed. A session that is in use is never evicted.
+"""
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from code_executor import ExecutionService, get_executor
+
+# --- Configuration ---
+DEFAULT_MEMORY_CAP_MB = 4096  # Total resident memory of all session workers
+DEFAULT_IDLE_TTL = 15 * 60  # Seconds before an unused session is closed
+DEFAULT_MAX_SESSIONS = 16
+
+
+class _Entry:
+    def __init__(self, key: str):
+        self.key = key
+        self.state = None
+        self.busy = 0
+        self.last_used = time.monotonic()
+
+
+class SessionManager:
+    """Creates sessions on first use with `create(key)` and evicts idle ones.
+
+    `key` is unique per session instance (a session that was evicted and comes
+    back gets a new one); pass it as `session=` to `ExecutionService.run`.
+    """
+
+    def __init__(self, create: Callable[[str], Any], executor: Optional[ExecutionService] = None,
+                 memory_cap_mb: int = DEFAULT_MEMORY_CAP_MB, idle_ttl: float = DEFAULT_IDLE_TTL,
+                 max_sessions: int = DEFAULT_MAX_SESSIONS):
+        self.create = create
+        self.executor = executor or get_executor()
+        self.memory_cap_mb = memory_cap_mb
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self._sessions: Dict[str, _Entry] = {}
+        self._creating: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._counter = itertools.count(1)
+        self.evicted = 0
+
+    def _acquire(self, session_id: str) -> _Entry:
+        while True:
+            with self._lock:
+                entry = self._sessions.get(session_id)
+                if entry is not None:
+                    entry.busy += 1
+                    return entry
+                pending = self._creating.get(session_id)
+                if pending is None:
+                    pending = self._creating[session_id] = threading.Event()
+                    break
+            pending.wait()  # Another thread is creating this session
+        try:
+            entry = _Entry(f"{session_id}-{next(self._counter)}")
+            entry.state = self.create(entry.key)  # Outside the lock: building an agent can be slow
+            entry.busy = 1
+            with self._lock:
+                self._sessions[session_id] = entry
+            return entry
+        finally:
+            with self._lock:
+                del self._creating[session_id]
+            pending.set()
+
+    @contextmanager
+    def session(self, session_id: str):
+        """Yields the session's state, creating it on first use; evicts idle sessions afterwards."""
+        entry = self._acquire(session_id)
+        try:
+            yield entry.state
+        finally:
+            with self._lock:
+                entry.busy -= 1
+                entry.last_used = time.monotonic()
+            self.evict()
+
+    def close(self, session_id: str):
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+        if entry is not None:
+            self._discard(entry)
+
+    def _discard(self, entry: _Entry):
+        self.executor.close_session(entry.key)
+        if hasattr(entry.state, "close"):
+            entry.state.close()
+
+    def memory_usage(self) -> Dict[str, int]:
+        """Resident bytes of each session's worker."""
+        with self._lock:
+            keys = {session_id: entry.key for session_id, entry in self._sessions.items()}
+        return {session_id: self.executor.session_memory(key) for session_id, key in keys.items()}
+
+    def evict(self) -> List[str]:
+        """Closes expired sessions, then idle ones in LRU order while over the caps."""
+        now = time.monotonic()
+        with self._lock:
+            idle = sorted((entry.last_used, session_id) for session_id, entry in self._sessions.items()
+                          if entry.busy == 0)
+            total = len(self._sessions)
+        victims = [session_id for last_used, session_id in idle if now - last_used > self.idle_ttl]
+        remaining = [session_id for _, session_id in idle if session_id not in victims]
+        total -= len(victims)
+        if remaining:
+            memory = self.memory_usage()
+            used = sum(size for session_id, size in memory.items() if session_id not in victims)
+            cap = self.memory_cap_mb * 1024 * 1024
+            while remaining and (total > self.max_sessions or used > cap):
+                session_id = remaining.pop(0)
+                victims.append(session_id)
+                used -= memory.get(session_id, 0)
+                total -= 1
+        with self._lock:
+            # Skip sessions that were picked up again since the scan
+            victims = [session_id for session_id in victims
+                       if session_id in self._sessions and self._sessions[session_id].busy == 0]
+            entries = [self._sessions.pop(session_id) for session_id in victims]
+            self.evicted += len(victims)
+        for entry in entries:
+            self._discard(entry)
+        return victims
+
+    def stats(self) -> Dict[str, int]:
+        memory = self.memory_usage()
+        with self._lock:
+            busy = sum(1 for entry in self._sessions.values() if entry.busy)
+            return {"sessions": len(self._sessions), "busy": busy,
+                    "memory_bytes": sum(memory.values()), "evicted": self.evicted}
@@ -0,0 +1,152 @@
+# ann_index.py
+"""Inverted-file (IVF) approximate nearest-neighbour index in NumPy.
+
+Vectors are clustered with k-means into `nlist` cells; a query is compared
+against the centroids and only the vectors in the `nprobe` closest cells are
+scored exactly. `nprobe` is the recall/latency knob: `nprobe == nlist` is exact
+search. IVF was chosen over HNSW because its hot loop is a handful of large
+matrix products, which NumPy does well, while HNSW's graph walk would run in
+the Python interpreter.
+
+Vectors are expected to be L2-normalized so that the inner product is the
+cosine similarity. See `benchmarks/ann_recall.py` for recall-vs-latency numbers.
+"""
+import json
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from vector_store import top_k_indices
+
+DEFAULT_NPROBE = 8
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 64  # Training points per centroid; more barely improves the clustering
+
+
+def default_nlist(n: int) -> int:
+    """Rule of thumb: about 4 * sqrt(n) cells."""
+    return max(1, int(4 * np.sqrt(n)))
+
+
+def train_kmeans(vectors: np.ndarray, nlist: int, iterations: int = KMEANS_ITERATIONS,
+                 seed: int = 0) -> np.ndarray:
+    """Spherical k-means on a sample of `vectors`; returns normalized centroids."""
+    rng = np.random.default_rng(seed)
+    n = vectors.shape[0]
+    nlist = min(nlist, n)
+    sample_size = min(n, nlist * KMEANS_SAMPLE_PER_LIST)
+    sample = np.asarray(vectors[rng.choice(n, sample_size, replace=False)], dtype=np.float32)
+    centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+        counts = np.bincount(assignment, minlength=nlist)
+        empty = counts == 0
+        # Re-seed empty cells with random sample points so every cell stays useful
+        sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = sums / np.where(norms == 0, 1, norms)
+    return centroids.astype(np.float32)
+
+
+class IVFIndex:
+    """IVF index over integer ids with incremental insertion and on-disk persistence."""
+
+    def __init__(self, centroids: np.ndarray, nprobe: int = DEFAULT_NPROBE, trained_size: int = 0):
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.nprobe = nprobe
+        self.trained_size = trained_size  # Vectors the centroids were trained on; used to decide retraining
+        dim = self.centroids.shape[1]
+        self.list_vectors: List[np.ndarray] = [np.zeros((0, dim), dtype=np.float32)
+                                               for _ in range(self.nlist)]
+        self.list_ids: List[np.ndarray] = [np.zeros(0, dtype=np.int64) for _ in range(self.nlist)]
+
+    @property
+    def nlist(self) -> int:
+        return self.centroids.shape[0]
+
+    def __len__(self) -> int:
+        return sum(ids.size for ids in self.list_ids)
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, ids: Optional[np.ndarray] = None, nlist: Optional[int] = None,
+              nprobe: int = DEFAULT_NPROBE, seed: int = 0) -> "IVFIndex":
+        vectors = np.asarray(vectors, dtype=np.float32)
+        ids = np.arange(vectors.shape[0]) if ids is None else np.asarray(ids, dtype=np.int64)
+        index = cls(train_kmeans(vectors, nlist or default_nlist(vectors.shape[0]), seed=seed),
+                    nprobe=nprobe, trained_size=vectors.shape[0])
+        index.add(vectors, ids)
+        return index
+
+    # --- Updates ---
+    def assign(self, vectors: np.ndarray) -> np.ndarray:
+        return np.argmax(np.asarray(vectors, dtype=np.float32) @ self.centroids.T, axis=1)
+
+    def add(self, vectors: np.ndarray, ids: np.ndarray):
+        """Inserts vectors into their nearest cells (centroids are not retrained)."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        ids = np.asarray(ids, dtype=np.int64)
+        assignment = self.assign(vectors)
+        order = np.argsort(assignment, kind="stable")
+        cells, starts = np.unique(assignment[order], return_index=True)
+        ends = np.append(starts[1:], order.size)
+        for cell, start, end in zip(cells, starts, ends):
+            rows = order[start:end]
+            self.list_vectors[cell] = np.concatenate([self.list_vectors[cell], vectors[rows]])
+            self.list_ids[cell] = np.concatenate([self.list_ids[cell], ids[rows]])
+
+    def remap(self, mapping: np.ndarray):
+        """Renumbers ids through `mapping[old_id] -> new_id`; ids mapped to -1 are removed."""
+        for cell in range(self.nlist):
+            new_ids = mapping[self.list_ids[cell]]
+            keep = new_ids >= 0
+            self.list_vectors[cell] = np.asarray(self.list_vectors[cell])[keep]
+            self.list_ids[cell] = new_ids[keep]
+
+    # --- Search ---
+    def search(self, query: np.ndarray, k: int, nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns (ids, scores) of the approximate top-k by inner product, best first."""
+        query = np.asarray(query, dtype=np.float32)
+        cells = top_k_indices(self.centroids @ query, min(nprobe or self.nprobe, self.nlist))
+        cells = [c for c in cells if self.list_ids[c].size]
+        if not cells:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        ids = np.concatenate([self.list_ids[c] for c in cells])
+        scores = np.concatenate([self.list_vectors[c] @ query for c in cells])
+        best = top_k_indices(scores, k)
+        return ids[best], scores[best]
+
+    # --- Persistence ---
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        arrays = {
+            "centroids.npy": self.centroids,
+            "offsets.npy": np.cumsum([0] + [ids.size for ids in self.list_ids]),
+            "vectors.npy": np.concatenate(self.list_vectors),
+            "ids.npy": np.concatenate(self.list_ids),
+        }
+        # Write beside and swap in: the current files may be memory-mapped by this index
+        for name, array in arrays.items():
+            path = os.path.join(directory, name)
+            with open(path + ".tmp", "wb") as f:
+                np.save(f, array)
+            os.replace(path + ".tmp", path)
+        with open(os.path.join(directory, "config.json"), "w") as f:
+            json.dump({"nprobe": self.nprobe, "trained_size": self.trained_size}, f)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "IVFIndex":
+        """Loads an index; with `mmap` the cell contents are views into memory-mapped files."""
+        mode = "r" if mmap else None
+        with open(os.path.join(directory, "config.json")) as f:
+            config = json.load(f)
+        index = cls(np.load(os.path.join(directory, "centroids.npy")), nprobe=config["nprobe"],
+                    trained_size=config.get("trained_size", 0))
+        offsets = np.load(os.path.join(directory, "offsets.npy"))
+        vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode=mode)
+        ids = np.load(os.path.join(directory, "ids.npy"), mmap_mode=mode)
+        index.list_vectors = [vectors[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+        index.list_ids = [np.asarray(ids[start:end]) for start, end in zip(offsets[:-1], offsets[1:])]
+        return index
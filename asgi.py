@@ -0,0 +1,189 @@
+# asgi.py
+"""ASGI serving mode for the two Flask apps.
+
+    uvicorn asgi:create_coding_app --factory --port 5050
+    uvicorn asgi:create_data_app --factory --port 5050   # from Agent-dataanalysis/
+
+Under `app.run()` every open request holds a server thread, so a few slow
+generations starve everything else, including status polls. Here the event
+loop owns the connections:
+- `GET /jobs/<id>` (with `?since=` and `?wait=` long polling) is answered on
+  the loop itself, so any number of pollers costs no threads;
+- every other request runs the Flask app on a bounded thread pool
+  (`ASGI_THREADS`), and response bodies such as `/stream` are relayed to the
+  client chunk by chunk as the app produces them.
+
+Generations still go through the app's `JobQueue`, which bounds them to the
+backend's parallelism, answers 429 when full and coalesces identical prompts.
+The bridge needs no third-party package; any ASGI server can host it.
+"""
+import asyncio
+import importlib.util
+import io
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+from urllib.parse import parse_qs
+
+from job_queue import MAX_POLL_WAIT, JobQueue
+
+# --- Configuration ---
+ASGI_THREADS = int(os.environ.get("ASGI_THREADS", "64"))  # Flask handlers and response bodies in flight
+POLL_INTERVAL = 0.05  # Seconds between checks of a long-polled job
+DATA_APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Agent-dataanalysis", "app.py")
+
+
+class FlaskASGI:
+    """Serves a WSGI (Flask) app over ASGI, with native async job polling."""
+
+    def __init__(self, wsgi_app, jobs: JobQueue, threads: int = ASGI_THREADS):
+        self.wsgi_app = wsgi_app
+        self.jobs = jobs
+        self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="asgi")
+
+    async def __call__(self, scope: Dict[str, Any], receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            path = scope["path"]
+            if scope["method"] == "GET" and path.startswith("/jobs/") and "/" not in path[len("/jobs/"):]:
+                await self._job_status(scope, send, path[len("/jobs/"):])
+            else:
+                await self._wsgi(scope, receive, send)
+        # Websockets are not served
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self._pool.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    # --- Native routes ---
+    async def _job_status(self, scope: Dict[str, Any], send, job_id: str):
+        """`GET /jobs/<id>`: same answer as the Flask route, but long polls wait on the event loop."""
+        job = self.jobs.get(job_id)
+        if job is None:
+            await self._send_json(send, 404, {"error": "unknown or expired job"})
+            return
+        query = parse_qs(scope["query_string"].decode("latin-1"))
+        try:
+            since = int(query.get("since", ["0"])[0])
+            wait = min(float(query.get("wait", ["0"])[0]), MAX_POLL_WAIT)
+        except ValueError:
+            since, wait = 0, 0.0
+        deadline = asyncio.get_running_loop().time() + wait
+        while not job.done and len(job.text) <= since and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(POLL_INTERVAL)
+        await self._send_json(send, 200, self.jobs.snapshot(job, since))
+
+    @staticmethod
+    async def _send_json(send, status: int, body: Dict[str, Any]):
+        payload = json.dumps(body).encode("utf-8")
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json"),
+                                (b"content-length", str(len(payload)).encode())]})
+        await send({"type": "http.response.body", "body": payload})
+
+    # --- WSGI bridge ---
+    async def _wsgi(self, scope: Dict[str, Any], receive, send):
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        loop = asyncio.get_running_loop()
+        started: List[Tuple[str, List[Tuple[str, str]]]] = []
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [(status, headers)]
+
+        environ = wsgi_environ(scope, bytes(body))
+        chunks = await loop.run_in_executor(self._pool, self.wsgi_app, environ, start_response)
+        iterator = iter(chunks)
+        try:
+            # Headers go out with the first chunk, so the app can still set them while it starts
+            first = await loop.run_in_executor(self._pool, next, iterator, None)
+            status, headers = started[0]
+            await send({"type": "http.response.start", "status": int(status.split(" ", 1)[0]),
+                        "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]})
+            chunk = first
+            while chunk is not None:
+                if chunk:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                chunk = await loop.run_in_executor(self._pool, next, iterator, None)
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            if hasattr(chunks, "close"):
+                await loop.run_in_executor(self._pool, chunks.close)
+
+
+def wsgi_environ(scope: Dict[str, Any], body: bytes) -> Dict[str, Any]:
+    """The PEP 3333 environ for an ASGI HTTP scope."""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),  # PEP 3333: unquoted bytes as latin-1
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope["headers"]:
+        name, value = name.decode("latin-1"), value.decode("latin-1")
+        if name == "content-type":
+            environ["CONTENT_TYPE"] = value
+        elif name != "content-length":
+            key = "HTTP_" + name.upper().replace("-", "_")
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+# --- App factories ---
+def create_coding_app() -> FlaskASGI:
+    import coding_assistant_tinyllama_webapp as webapp
+    return FlaskASGI(webapp.app, webapp.jobs)
+
+
+def create_data_app() -> FlaskASGI:
+    spec = importlib.util.spec_from_file_location("data_analysis_app", DATA_APP_PATH)
+    app_module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = app_module  # Flask finds templates/ next to the module through sys.modules
+    spec.loader.exec_module(app_module)
+    return FlaskASGI(app_module.app, app_module.jobs)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve a web app over ASGI (needs uvicorn).")
+    parser.add_argument("app", choices=["coding", "data"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5050)
+    args = parser.parse_args()
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit("uvicorn is not installed: pip install uvicorn (or run the app with any other ASGI server)")
+    factory = create_coding_app if args.app == "coding" else create_data_app
+    uvicorn.run(factory(), host=args.host, port=args.port)
@@ -0,0 +1,122 @@
+# async_tools.py
+"""Concurrent tool calls within one agent step.
+
+The agents' tools are plain synchronous functions. `AgentExecutor.invoke` runs
+them one after another, so "weather in London and New York" pays for two tool
+latencies in a row. Two changes fix that:
+- `ReActStreamParser(multi_action=True)` returns every Action/Action Input pair of
+  a step, not just the first.
+- `AgentExecutor.ainvoke` already runs the actions of a step together with
+  `asyncio.gather`, and keeps the observations in action order, which is what the
+  next prompt is built from.
+
+`ToolRunner` gives every tool a coroutine with a per-tool timeout. Native
+`coroutine`s are awaited directly. Sync `func`s run on a bounded thread pool that
+the agents share, with the caller's context variables. A call that times out
+becomes an observation saying so, rather than an error that ends the run. The
+worker thread is not interrupted and finishes in the background.
+`ParallelAgentExecutor` is an `AgentExecutor` whose `invoke` (and `run`) drive
+that async path.
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain.agents import AgentExecutor
+from langchain_core.tools import BaseTool
+
+# --- Configuration ---
+DEFAULT_WORKERS = 8
+DEFAULT_TOOL_TIMEOUT = 30.0  # Seconds; per-tool values override it
+
+
+class ToolRunner:
+    """Turns tools into coroutines bounded by a timeout, running sync ones on a shared pool."""
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, timeout: Optional[float] = DEFAULT_TOOL_TIMEOUT,
+                 timeouts: Optional[Dict[str, float]] = None):
+        self.timeout = timeout
+        self.timeouts = dict(timeouts or {})
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tool")
+        self._lock = threading.Lock()
+        self._counters = {"calls": 0, "timeouts": 0, "errors": 0, "running": 0, "max_concurrent": 0}
+
+    def _count(self, key: str, delta: int = 1):
+        with self._lock:
+            self._counters[key] += delta
+            if key == "running":
+                self._counters["max_concurrent"] = max(self._counters["max_concurrent"], self._counters["running"])
+
+    def wrap(self, tool: BaseTool) -> BaseTool:
+        """A copy of `tool` whose async path is bounded by its timeout (sync tools go to the pool)."""
+        func, native = getattr(tool, "func", None), getattr(tool, "coroutine", None)
+        if func is None and native is None:
+            return tool  # A custom BaseTool: its own `_arun` applies
+        timeout = self.timeouts.get(tool.name, self.timeout)
+
+        async def coroutine(*args: Any, **kwargs: Any) -> Any:
+            if native is not None:
+                call = native(*args, **kwargs)
+            else:
+                context = contextvars.copy_context()
+                call = asyncio.get_running_loop().run_in_executor(
+                    self._pool, functools.partial(context.run, func, *args, **kwargs))
+            self._count("calls")
+            self._count("running")
+            try:
+                return await asyncio.wait_for(call, timeout)
+            except asyncio.TimeoutError:
+                self._count("timeouts")
+                return f"{tool.name} timed out after {timeout:g} seconds."
+            except Exception:
+                self._count("errors")
+                raise
+            finally:
+                self._count("running", -1)
+
+        return tool.model_copy(update={"coroutine": coroutine})
+
+    def wrap_all(self, tools: Sequence[BaseTool]) -> List[BaseTool]:
+        return [self.wrap(tool) for tool in tools]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
+
+
+class ParallelAgentExecutor(AgentExecutor):
+    """`AgentExecutor` whose sync entry points take the async path, so one step's actions run together."""
+
+    def invoke(self, input: Dict[str, Any], config: Optional[dict] = None, **kwargs: Any) -> Dict[str, Any]:
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.ainvoke(input, config, **kwargs))
+        return super().invoke(input, config, **kwargs)  # Called from inside an event loop: stay sequential
+
+
+def parallelize(agent_executor: AgentExecutor, runner: Optional["ToolRunner"] = None) -> ParallelAgentExecutor:
+    """`agent_executor` as a `ParallelAgentExecutor` with its tools wrapped by `runner`."""
+    runner = runner or get_tool_runner()
+    fields = {name: getattr(agent_executor, name) for name in AgentExecutor.model_fields if name != "tools"}
+    return ParallelAgentExecutor(**fields, tools=runner.wrap_all(agent_executor.tools))
+
+
+# --- Shared runner ---
+_shared_runner: Optional[ToolRunner] = None
+_shared_lock = threading.Lock()
+
+
+def get_tool_runner() -> ToolRunner:
+    """Returns the process-wide tool runner."""
+    global _shared_runner
+    with _shared_lock:
+        if _shared_runner is None:
+            _shared_runner = ToolRunner()
+        return _shared_runner
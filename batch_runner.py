@@ -0,0 +1,234 @@
+# batch_runner.py
+"""Offline batch evaluation: a JSONL file of queries through an agent, in parallel.
+
+    python batch_runner.py --agent rag --input queries.jsonl --output results.jsonl --concurrency 8
+
+Each input line is `{"id": ..., "query": ...}` or a bare JSON string. `id`
+defaults to the line number. Queries are read lazily and at most `2 *
+concurrency` are in flight, so memory stays flat however long the file is.
+All workers share one pooled Ollama client, sized to the concurrency. For the
+backend to actually serve that many at once, set `OLLAMA_NUM_PARALLEL` to
+match.
+
+Every finished query is appended to the output file straight away and flushed;
+the output is the checkpoint. A re-run with the same output skips ids that
+already succeeded and retries the ones that failed (for an id, the last line
+wins). Result lines carry the id, input line number, output or error, latency,
+LLM calls, estimated prompt and completion tokens, and the retrieved sources.
+
+Built-in agents: `rag` (`rag_agent.py`) and `data` (`data_anaylsis_agent.py`,
+a fresh session per query, closed when it finishes). `--agent module:factory` loads any other:
+`factory(llm)` returns `run(query, callbacks) -> str | {"output", "sources"}`.
+"""
+import argparse
+import importlib
+import itertools
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from ollama_client import DEFAULT_KEEP_ALIVE, DEFAULT_POOL_SIZE, OLLAMA_BASE_URL, OLLAMA_MODEL, get_client
+from summary_memory import estimate_tokens
+
+# --- Configuration ---
+DEFAULT_CONCURRENCY = 4
+INFLIGHT_PER_WORKER = 2  # Queued queries per worker, so workers never wait for the reader
+
+Runner = Callable[[str, List[BaseCallbackHandler]], Any]
+
+
+class QueryMeter(BaseCallbackHandler):
+    """LLM calls and estimated prompt/completion tokens of one query."""
+
+    def __init__(self):
+        self.llm_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], **kwargs: Any) -> None:
+        with self._lock:
+            self.llm_calls += 1
+            self.prompt_tokens += sum(estimate_tokens(p) for p in prompts)
+
+    def on_llm_end(self, response, **kwargs: Any) -> None:
+        text = "".join(g.text for gens in response.generations for g in gens)
+        with self._lock:
+            self.completion_tokens += estimate_tokens(text)
+
+
+# --- Agents ---
+def rag_agent(llm) -> Runner:
+    """RetrievalQA over the persistent index `rag_agent.py` uses; sources are the retrieved documents."""
+    from langchain.chains import RetrievalQA
+    import rag_agent as rag
+    from rag_index import document_source
+
+    _, embeddings = rag.get_tinyllama_1b()
+    index = rag.get_index(embeddings)
+    rag.load_corpus(index)
+    qa_chain = RetrievalQA.from_chain_type(llm=llm, chain_type="stuff", retriever=index.as_retriever(),
+                                           return_source_documents=True)
+
+    def run(query: str, callbacks: List[BaseCallbackHandler]) -> Dict[str, Any]:
+        response = qa_chain.invoke({"query": query}, {"callbacks": callbacks})
+        sources = list(dict.fromkeys(document_source(doc) for doc in response["source_documents"]))
+        return {"output": response["result"], "sources": sources}
+    return run
+
+
+def data_agent(llm) -> Runner:
+    """The CSV analysis agent; every query gets a fresh session (and execution worker), closed afterwards.
+
+    Queries must not see each other's variables or a `df` an earlier query reassigned.
+    """
+    import data_anaylsis_agent as data
+
+    sessions = data.make_session_manager(llm, data.get_CSV_data())
+    counter = itertools.count(1)
+
+    def run(query: str, callbacks: List[BaseCallbackHandler]) -> Dict[str, Any]:
+        session_id = f"batch-{next(counter)}"
+        try:
+            with sessions.session(session_id) as session:
+                response = session.ask(query, callbacks=callbacks)
+        finally:
+            sessions.close(session_id)
+        return {"output": response["output"], "sources": []}
+    return run
+
+
+AGENTS: Dict[str, Callable[[Any], Runner]] = {"rag": rag_agent, "data": data_agent}
+
+
+def load_agent(name: str) -> Callable[[Any], Runner]:
+    if name in AGENTS:
+        return AGENTS[name]
+    module, _, attr = name.partition(":")
+    if not attr:
+        raise ValueError(f"Unknown agent {name!r}: use one of {sorted(AGENTS)} or module:factory")
+    return getattr(importlib.import_module(module), attr)
+
+
+# --- Input and checkpoint ---
+def read_queries(path: str) -> Iterator[Tuple[int, str, str]]:
+    """(line number, id, query) for every non-blank input line, read lazily."""
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = {"query": item}
+            yield line_no, str(item.get("id", line_no)), item["query"]
+
+
+def completed_ids(path: str) -> Set[str]:
+    """Ids whose latest line in an earlier run's output succeeded."""
+    done: Set[str] = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # A line cut short by a crash
+            if record.get("error"):
+                done.discard(record["id"])
+            else:
+                done.add(record["id"])
+    return done
+
+
+# --- Runner ---
+def run_one(run: Runner, line_no: int, query_id: str, query: str) -> Dict[str, Any]:
+    meter = QueryMeter()
+    started = time.perf_counter()
+    record: Dict[str, Any] = {"id": query_id, "line": line_no, "query": query}
+    try:
+        result = run(query, [meter])
+        if not isinstance(result, dict):
+            result = {"output": result}
+        record.update(output=str(result.get("output", "")), sources=result.get("sources", []), error=None)
+    except Exception as e:
+        record.update(output=None, sources=[], error=f"{type(e).__name__}: {e}")
+    record.update(latency=time.perf_counter() - started, llm_calls=meter.llm_calls,
+                  prompt_tokens=meter.prompt_tokens, completion_tokens=meter.completion_tokens)
+    return record
+
+
+def run_batch(run: Runner, input_path: str, output_path: str, concurrency: int = DEFAULT_CONCURRENCY,
+              limit: Optional[int] = None, progress_every: int = 100) -> Dict[str, Any]:
+    """Runs every not-yet-completed query of `input_path`, appending results to `output_path`."""
+    done = completed_ids(output_path)
+    summary = {"submitted": 0, "ok": 0, "errors": 0, "skipped": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    latencies: List[float] = []  # One float per query; fine for nightly volumes
+    started = time.perf_counter()
+    with open(output_path, "a", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch") as pool:
+        pending = set()
+
+        def drain(block_until: int):
+            nonlocal pending
+            while len(pending) > block_until:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    record = future.result()
+                    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    out.flush()
+                    summary["errors" if record["error"] else "ok"] += 1
+                    summary["prompt_tokens"] += record["prompt_tokens"]
+                    summary["completion_tokens"] += record["completion_tokens"]
+                    latencies.append(record["latency"])
+                    finished_count = summary["ok"] + summary["errors"]
+                    if progress_every and finished_count % progress_every == 0:
+                        rate = finished_count / (time.perf_counter() - started)
+                        print(f"{finished_count} done ({summary['errors']} errors), {rate:.2f} queries/s")
+
+        for line_no, query_id, query in read_queries(input_path):
+            if query_id in done:
+                summary["skipped"] += 1
+                continue
+            if limit is not None and summary["submitted"] >= limit:
+                break
+            pending.add(pool.submit(run_one, run, line_no, query_id, query))
+            summary["submitted"] += 1
+            drain(concurrency * INFLIGHT_PER_WORKER)  # Bounded window: the reader never runs ahead
+        drain(0)
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    pick = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else 0.0
+    summary.update(seconds=elapsed, queries_per_sec=len(latencies) / elapsed if elapsed else 0.0,
+                   p50_latency=pick(0.50), p95_latency=pick(0.95))
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a JSONL file of queries through an agent in parallel.")
+    parser.add_argument("--agent", default="rag", help=f"One of {sorted(AGENTS)} or module:factory")
+    parser.add_argument("--input", required=True, help="JSONL queries: {\"id\": ..., \"query\": ...} per line")
+    parser.add_argument("--output", required=True, help="JSONL results; also the checkpoint for resuming")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--limit", type=int, default=None, help="Stop after submitting this many queries")
+    parser.add_argument("--model", default=OLLAMA_MODEL)
+    parser.add_argument("--base-url", default=OLLAMA_BASE_URL)
+    args = parser.parse_args()
+
+    from pooled_llm import PooledOllama
+
+    # Create the shared client first so its connection pool fits the concurrency
+    get_client(args.base_url, args.model, keep_alive=DEFAULT_KEEP_ALIVE,
+               pool_size=max(DEFAULT_POOL_SIZE, args.concurrency))
+    llm = PooledOllama(model=args.model, base_url=args.base_url, temperature=0)
+    run = load_agent(args.agent)(llm)
+    summary = run_batch(run, args.input, args.output, concurrency=args.concurrency, limit=args.limit)
+    print(json.dumps(summary, indent=2))
+    if args.agent == "data":
+        from code_executor import get_executor
+        get_executor().shutdown()
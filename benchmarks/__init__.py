@@ -0,0 +1,4 @@
+"""Benchmarks for the agents and their supporting infrastructure.
+
+Run from the repository root, e.g. `python -m benchmarks.ann_recall`.
+"""
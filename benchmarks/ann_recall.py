@@ -0,0 +1,95 @@
+# benchmarks/ann_recall.py
+"""Recall-vs-latency benchmark of the IVF index against exact search.
+
+Builds a synthetic, clustered set of normalized embeddings (real sentence
+embeddings are clustered too, which is what makes IVF work), then reports
+recall@k and per-query latency for a sweep of `nprobe` values.
+
+    python -m benchmarks.ann_recall --n 1000000 --dim 256 --nprobe 1 4 16 64
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from ann_index import IVFIndex, default_nlist
+from vector_store import normalize_rows, top_k_indices
+
+
+def synthetic_embeddings(n: int, dim: int, clusters: int, spread: float = 1.4, seed: int = 0) -> np.ndarray:
+    """Gaussian mixture around random unit centres, normalized to the unit sphere."""
+    rng = np.random.default_rng(seed)
+    centres = normalize_rows(rng.standard_normal((clusters, dim)).astype(np.float32))
+    vectors = np.empty((n, dim), dtype=np.float32)
+    for start in range(0, n, 100_000):  # Generate in blocks to keep peak memory down
+        end = min(start + 100_000, n)
+        labels = rng.integers(0, clusters, end - start)
+        noise = rng.standard_normal((end - start, dim)).astype(np.float32) * (spread / np.sqrt(dim))
+        vectors[start:end] = centres[labels] + noise
+    return normalize_rows(vectors)
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q) * 1000)
+
+
+def run(n: int, dim: int, queries: int, k: int, nlist: int, nprobes, clusters: int, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed + 1)
+    vectors = synthetic_embeddings(n, dim, clusters, seed=seed)
+    # Queries are perturbed corpus points, so every query has genuinely close neighbours
+    picks = rng.integers(0, n, queries)
+    query_vectors = normalize_rows(vectors[picks] + 0.05 * rng.standard_normal((queries, dim)).astype(np.float32))
+
+    exact_ids, exact_times = [], []
+    for q in query_vectors:
+        started = time.perf_counter()
+        exact_ids.append(set(top_k_indices(vectors @ q, k).tolist()))
+        exact_times.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    index = IVFIndex.build(vectors, nlist=nlist)
+    build_seconds = time.perf_counter() - started
+
+    results = {
+        "n": n, "dim": dim, "k": k, "nlist": index.nlist, "queries": queries,
+        "build_seconds": build_seconds,
+        "exact": {"p50_ms": percentile_ms(exact_times, 50), "p95_ms": percentile_ms(exact_times, 95)},
+        "ivf": [],
+    }
+    for nprobe in nprobes:
+        times, hits = [], 0
+        for q, truth in zip(query_vectors, exact_ids):
+            started = time.perf_counter()
+            ids, _ = index.search(q, k, nprobe=nprobe)
+            times.append(time.perf_counter() - started)
+            hits += len(truth & set(ids.tolist()))
+        results["ivf"].append({
+            "nprobe": nprobe, "recall": hits / (k * queries),
+            "p50_ms": percentile_ms(times, 50), "p95_ms": percentile_ms(times, 95),
+        })
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="IVF recall vs latency against exact search.")
+    parser.add_argument("--n", type=int, default=200_000, help="Number of vectors")
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=None, help="IVF cells (default 4*sqrt(n))")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--clusters", type=int, default=1000, help="Clusters in the synthetic data")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    results = run(args.n, args.dim, args.queries, args.k, args.nlist or default_nlist(args.n),
+                  args.nprobe, args.clusters)
+    print(f"n={results['n']} dim={results['dim']} nlist={results['nlist']} "
+          f"build={results['build_seconds']:.1f}s k={results['k']}")
+    print(f"{'exact':>8}  recall=1.000  p50={results['exact']['p50_ms']:.2f}ms  p95={results['exact']['p95_ms']:.2f}ms")
+    for row in results["ivf"]:
+        print(f"nprobe={row['nprobe']:<3} recall={row['recall']:.3f}  p50={row['p50_ms']:.2f}ms  p95={row['p95_ms']:.2f}ms")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
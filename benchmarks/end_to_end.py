@@ -0,0 +1,380 @@
+# benchmarks/end_to_end.py
+"""End-to-end latency and throughput of the agents and web apps, against the mock Ollama server.
+
+Every workload runs the real code: `rag_agent.py`, `weather_agent.py` and
+`data_anaylsis_agent.py` in-process, and both Flask apps behind a local
+threaded server, with requests over HTTP to their `/stream` endpoints. Only
+the model is replaced. The mock is scripted (`scripted_response`) so every run
+takes the same path. Prefill (`--prompt-token-delay`) and decoding
+(`--token-delay`) are simulated per token.
+
+For each workload `--requests` distinct queries are sent `--concurrency` at a
+time, after `--warmup` queries that are not measured. The completion and
+execution caches are cleared before the measured run. Reported per workload:
+- time to first token (TTFT);
+- end-to-end p50/p95/p99 latency;
+- requests/sec;
+- agent steps (LLM calls) per query, and backend calls per query;
+- peak RSS of this process.
+
+Code execution worker processes are not included in the RSS. Everything the apps
+write (caches, index, uploads, plots, logs) goes to a temporary directory.
+
+    python -m benchmarks.end_to_end --json results.json
+    python -m benchmarks.end_to_end --workloads rag weather --concurrency 8 --compare results.json
+"""
+import argparse
+import contextlib
+import http.client
+import importlib.util
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from mock_ollama_server import start_mock_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_APP_PATH = os.path.join(ROOT, "Agent-dataanalysis", "app.py")
+DATA_APP_DATASET = os.path.join(ROOT, "Agent-dataanalysis", "dataset.csv")
+CITIES = ["London", "New York", "Paris", "Tokyo", "Berlin", "Madrid", "Oslo", "Rome"]
+RSS_SAMPLE_INTERVAL = 0.01  # Seconds
+
+
+# --- Scripted model ---
+def scripted_response(prompt: str) -> str:
+    """A deterministic completion for every prompt shape the workloads produce."""
+    if "Final Answer" in prompt and "\nQuestion: " in prompt:  # A ReAct step
+        question = prompt.rsplit("\nQuestion: ", 1)[1]
+        observations = re.findall(r"\nObservation: ?(.*)", question)
+        if observations:
+            return f" I now know the final answer.\nFinal Answer: {observations[-1].strip()}"
+        first_line = question.splitlines()[0]
+        if "python_repl_pandas" in prompt:
+            age = re.search(r"\d+", first_line)
+            return (" I should compute this with pandas.\nAction: python_repl_pandas\n"
+                    f"Action Input: print(df[df['Age'] > {age.group() if age else 0}]['Salary'].mean())\n")
+        city = re.search(r"\b(?:in|for)\s+([A-Z][a-z]+(?: [A-Z][a-z]+)*)", first_line)
+        if city and "get_weather" in prompt:
+            return f" I should look up the weather.\nAction: get_weather\nAction Input: {city.group(1)}\n"
+        return " I know this one.\nFinal Answer: Cats spend about seventy percent of their lives asleep."
+    if prompt.startswith("Use the following pieces of context"):  # RetrievalQA "stuff" prompt
+        return " Based on the context, Paris is the capital of France and Everest is the highest mountain."
+    if prompt.startswith("Progressively summarize"):  # Rolling-summary memory
+        return "The user asked for several small Python snippets and ran them."
+    number = re.findall(r"\d+", prompt.rstrip().rsplit("\n", 1)[-1]) or ["1"]
+    if "Here is the dataset" in prompt:
+        return f"Here is the code:\n```python\nprint(df.head({int(number[-1]) % 10 + 1}))\n```\n"
+    return f"Here is an example:\n```python\nprint({number[-1]} ** 2)\n```\n"
+
+
+# --- Measurement ---
+class RssSampler:
+    """Peak resident set size of this process while the block runs, sampled on a thread."""
+
+    def __init__(self, interval: float = RSS_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def current_mb() -> float:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+        except OSError:
+            import resource
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Peak so far; kB on Linux
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_mb = max(self.peak_mb, self.current_mb())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, self.current_mb())
+
+
+def make_meter():
+    """A `batch_runner.QueryMeter` that also records when the first token arrived."""
+    from batch_runner import QueryMeter
+
+    class FirstTokenMeter(QueryMeter):
+        def __init__(self):
+            super().__init__()
+            self.started = time.perf_counter()
+            self.ttft = None
+
+        def on_llm_new_token(self, token: str, **kwargs) -> None:
+            if self.ttft is None:
+                self.ttft = time.perf_counter() - self.started
+
+    return FirstTokenMeter()
+
+
+def agent_call(run):
+    """Adapts a `batch_runner` runner `(query, callbacks)` to a timed workload call."""
+    def call(query: str) -> dict:
+        meter = make_meter()
+        run(query, [meter])
+        return {"ttft": meter.ttft, "steps": meter.llm_calls}
+    return call
+
+
+@contextlib.contextmanager
+def serve(app):
+    """Runs a Flask app on a threaded local server for the duration of the block; yields its URL."""
+    from werkzeug.serving import make_server
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)  # No access log line per request
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}"
+    finally:
+        server.shutdown()
+
+
+def post_sse(url: str, path: str, form: dict) -> dict:
+    """POSTs a form to a Server-Sent Events endpoint and reads the stream to the end."""
+    parsed = urllib.parse.urlsplit(url)
+    conn = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=300)
+    started = time.perf_counter()
+    try:
+        conn.request("POST", path, urllib.parse.urlencode(form),
+                     {"Content-Type": "application/x-www-form-urlencoded"})
+        response = conn.getresponse()
+        if response.status != 200:
+            raise RuntimeError(f"HTTP {response.status}")
+        ttft = None
+        for line in response:
+            if line.startswith(b"event: token") and ttft is None:
+                ttft = time.perf_counter() - started
+            elif line.startswith(b"event: error"):
+                raise RuntimeError(response.readline().decode().strip())
+        return {"ttft": ttft, "steps": None}
+    finally:
+        conn.close()
+
+
+# --- Workloads ---
+# Each is a context manager yielding `call(query) -> {"ttft", "steps"}`, plus a function building query i.
+@contextlib.contextmanager
+def rag_workload():
+    import rag_agent
+    from batch_runner import rag_agent as rag_runner
+    llm, _ = rag_agent.get_tinyllama_1b()
+    yield agent_call(rag_runner(llm))
+
+
+def rag_query(i: int) -> str:
+    topics = ["What is the capital of France?", "Which is the highest mountain in the world?",
+              "What is Python used for?", "What does the Earth revolve around?"]
+    return f"{topics[i % len(topics)]} (question {i})"
+
+
+@contextlib.contextmanager
+def weather_workload():
+    import weather_agent  # Builds the routed agent (and runs its demo question once)
+
+    def run(query, callbacks):
+        return weather_agent.routed_agent.invoke({"input": query}, {"callbacks": callbacks})
+    yield agent_call(run)
+
+
+def weather_query(i: int) -> str:
+    city = CITIES[i % len(CITIES)]
+    return [f"What is the weather like in {city}?",  # Routed straight to the tool
+            f"Should I pack an umbrella for {city}, trip {i}?",
+            f"Tell me a fun fact about the number {i}."][i % 3]
+
+
+@contextlib.contextmanager
+def data_agent_workload():
+    import data_anaylsis_agent
+    from batch_runner import data_agent
+    yield agent_call(data_agent(data_anaylsis_agent.get_tinyllama_1b()))
+
+
+def data_agent_query(i: int) -> str:
+    return f"What is the average Salary of people older than {18 + i}?"
+
+
+@contextlib.contextmanager
+def coding_app_workload():
+    import coding_assistant_tinyllama_webapp as webapp
+    with serve(webapp.app) as url:
+        yield lambda query: post_sse(url, "/stream", {"prompt": query})
+
+
+def coding_app_query(i: int) -> str:
+    return f"Write Python code that prints {i} squared."
+
+
+@contextlib.contextmanager
+def data_app_workload():
+    spec = importlib.util.spec_from_file_location("data_analysis_app", DATA_APP_PATH)
+    app_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(app_module)
+    with open(DATA_APP_DATASET, "rb") as f:
+        dataset_id = app_module.datasets.put(f)  # Uploaded once, like a user's first request
+    with serve(app_module.app) as url:
+        yield lambda query: post_sse(url, "/stream", {"prompt": query, "dataset_id": dataset_id})
+
+
+def data_app_query(i: int) -> str:
+    return f"Show the first rows of the dataset, request {i}."
+
+
+WORKLOADS = {
+    "rag": (rag_workload, rag_query),
+    "weather": (weather_workload, weather_query),
+    "data_agent": (data_agent_workload, data_agent_query),
+    "coding_app": (coding_app_workload, coding_app_query),
+    "data_app": (data_app_workload, data_app_query),
+}
+
+
+def reset_caches():
+    from completion_cache import get_cache
+    from execution_cache import get_execution_cache
+    get_cache().clear()
+    get_execution_cache().clear()
+
+
+def timed(call, query: str) -> dict:
+    started = time.perf_counter()
+    try:
+        result, error = call(query), None
+    except Exception as e:
+        result, error = {}, f"{type(e).__name__}: {e}"
+    return {"latency": time.perf_counter() - started, "ttft": result.get("ttft"),
+            "steps": result.get("steps"), "error": error}
+
+
+def percentiles_ms(samples) -> dict:
+    if not samples:
+        return None
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99]) * 1000
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99), "mean": float(np.mean(samples) * 1000)}
+
+
+def run_workload(name: str, server, requests: int, concurrency: int, warmup: int) -> dict:
+    workload, make_query = WORKLOADS[name]
+    with open(os.devnull, "w") as quiet, contextlib.redirect_stdout(quiet), workload() as call, \
+            ThreadPoolExecutor(max_workers=concurrency) as pool:
+        # Not measured: imports, per-thread sessions and execution workers, pooled connections
+        list(pool.map(lambda i: timed(call, make_query(requests + i)), range(warmup)))
+        reset_caches()
+        backend_before = sum(path == "/api/generate" for path, _ in list(server.requests))
+        with RssSampler() as rss:
+            started = time.perf_counter()
+            samples = list(pool.map(lambda i: timed(call, make_query(i)), range(requests)))
+            elapsed = time.perf_counter() - started
+        backend_calls = sum(path == "/api/generate" for path, _ in list(server.requests)) - backend_before
+    ok = [s for s in samples if s["error"] is None]
+    steps = [s["steps"] for s in ok if s["steps"] is not None]
+    return {
+        "requests": requests, "errors": len(samples) - len(ok),
+        "first_error": next((s["error"] for s in samples if s["error"]), None),
+        "seconds": elapsed, "requests_per_sec": len(ok) / elapsed if elapsed else 0.0,
+        "latency_ms": percentiles_ms([s["latency"] for s in ok]),
+        "ttft_ms": percentiles_ms([s["ttft"] for s in ok if s["ttft"] is not None]),
+        "steps_per_query": float(np.mean(steps)) if steps else backend_calls / requests,
+        "backend_calls_per_query": backend_calls / requests,
+        "peak_rss_mb": rss.peak_mb,
+    }
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+    except OSError:
+        return None
+    return out.stdout.strip() or None
+
+
+def report(results: dict, baseline: dict = None):
+    def change(new, old):
+        if old is None or new is None or not old:
+            return ""
+        return f" ({(new - old) / old * 100:+.0f}%)"
+
+    for name, r in results["workloads"].items():
+        old = (baseline or {}).get("workloads", {}).get(name, {})
+        lat, ttft = r["latency_ms"] or {}, r["ttft_ms"] or {}
+        old_lat, old_ttft = old.get("latency_ms") or {}, old.get("ttft_ms") or {}
+        print(f"{name:>11}: {r['requests_per_sec']:.2f} req/s{change(r['requests_per_sec'], old.get('requests_per_sec'))}  "
+              f"p50 {lat.get('p50', 0):.0f} ms{change(lat.get('p50'), old_lat.get('p50'))}  "
+              f"p95 {lat.get('p95', 0):.0f} ms{change(lat.get('p95'), old_lat.get('p95'))}  "
+              f"p99 {lat.get('p99', 0):.0f} ms  "
+              f"TTFT p50 {ttft.get('p50', 0):.0f} ms{change(ttft.get('p50'), old_ttft.get('p50'))}  "
+              f"steps {r['steps_per_query']:.2f}{change(r['steps_per_query'], old.get('steps_per_query'))}  "
+              f"RSS {r['peak_rss_mb']:.0f} MB{change(r['peak_rss_mb'], old.get('peak_rss_mb'))}"
+              + (f"  errors {r['errors']}: {r['first_error']}" if r["errors"] else ""))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of the agents and web apps on a mock Ollama.")
+    parser.add_argument("--workloads", nargs="+", choices=sorted(WORKLOADS), default=list(WORKLOADS))
+    parser.add_argument("--requests", type=int, default=24, help="Measured queries per workload")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=None,
+                        help="Unmeasured queries per workload (default: --concurrency, one per worker thread)")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="Simulated seconds per generated token")
+    parser.add_argument("--prompt-token-delay", type=float, default=0.0005, help="Simulated prefill seconds per prompt token")
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("--compare", help="Earlier --json results to show changes against")
+    args = parser.parse_args()
+    args.warmup = args.concurrency if args.warmup is None else args.warmup
+    # Resolved before changing into the work directory
+    output = os.path.abspath(args.json) if args.json else None
+    compare = os.path.abspath(args.compare) if args.compare else None
+
+    server = start_mock_server(responses=scripted_response, token_delay=args.token_delay,
+                               prompt_token_delay=args.prompt_token_delay)
+    workdir = tempfile.mkdtemp(prefix="e2e-bench-")
+    # Before any repo module is imported: they read these at import time
+    os.environ.update(OLLAMA_BASE_URL=server.base_url,
+                      COMPLETION_CACHE_PATH=os.path.join(workdir, "completions.sqlite"),
+                      EMBEDDING_CACHE_PATH=os.path.join(workdir, "embeddings.sqlite"),
+                      RAG_INDEX_DIR=os.path.join(workdir, "rag_index"))
+    os.environ.pop("RAG_CORPUS_DIR", None)
+    sys.path.insert(0, ROOT)
+    os.chdir(workdir)  # Logs, uploads, plots and sample CSVs land here
+
+    results = {"commit": git_commit(), "python": sys.version.split()[0],
+               "config": {k: getattr(args, k) for k in ("requests", "concurrency", "warmup",
+                                                        "token_delay", "prompt_token_delay")},
+               "workloads": {}}
+    try:
+        for name in args.workloads:
+            results["workloads"][name] = run_workload(name, server, args.requests, args.concurrency, args.warmup)
+    finally:
+        server.shutdown()
+        if "code_executor" in sys.modules:
+            sys.modules["code_executor"].get_executor().shutdown()
+    baseline = None
+    if compare:
+        with open(compare) as f:
+            baseline = json.load(f)
+        print(f"Compared with {args.compare} (commit {baseline.get('commit')}):")
+    report(results, baseline)
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,132 @@
+# benchmarks/react_early_stop.py
+"""Generated tokens and wall time per ReAct step, with and without early stopping.
+
+Runs the weather agent's example queries against the mock Ollama server. The
+mock is scripted with TinyLlama's usual habits: it keeps going after a complete
+`Action Input`, puts an `Action` and a `Final Answer` in the same step, and
+makes up the next `Question` after answering. Decoding is simulated at
+`--token-delay` seconds per token.
+
+"before" is `create_react_agent` with LangChain's output parser and the
+`\\nObservation` stop sequence. "after" adds `ReActStreamParser`, both as the
+early-stop hook and as the output parser.
+
+    python -m benchmarks.react_early_stop --token-delay 0.02
+"""
+import argparse
+import json
+import re
+import time
+
+from langchain.agents import AgentExecutor, Tool, create_react_agent
+from langchain_core.prompts import PromptTemplate
+
+from mock_ollama_server import start_mock_server
+from pooled_llm import PooledOllama
+from react_stream import ReActStreamParser, StepMeter
+
+QUERIES = ["What is the weather like in London?", "What is the weather like in Tokyo?",
+           "Tell me a fun fact about cats."]
+
+PROMPT = PromptTemplate.from_template("""
+You are a helpful AI assistant. You have access to the following tools:
+
+{tools}
+
+Use the following format:
+
+Question: the input question you must answer
+Thought: you should always think about what to do
+Action: the action to take, should be one of [{tool_names}]
+Action Input: the input to the action
+Observation: the result of the action
+... (this Thought/Action/Action Input/Observation can repeat N times)
+Thought: I now know the final answer
+Final Answer: the final answer to the original input question
+
+Begin!
+
+Question: {input}
+Thought:{agent_scratchpad}
+""")
+
+
+def get_current_weather(location: str) -> str:
+    if "london" in location.lower():
+        return "It's cloudy with a chance of rain in London, 15°C."
+    return f"Weather information for {location} is not available."
+
+
+def tinyllama_like(prompt: str) -> str:
+    """Scripted completions with the format slips TinyLlama makes on this prompt."""
+    question = prompt.rsplit("Question: ", 1)[1].splitlines()[0]
+    observations = re.findall(r"\nObservation: ?(.*)", prompt.split("Begin!", 1)[1])
+    city = question.rsplit(" in ", 1)[-1].rstrip("?") if " in " in question else None
+    ramble = ("\n\nQuestion: What is the weather like in Paris?\nThought: I should look up the weather in Paris "
+              "with the get_weather tool, since it gives the current conditions for a city.\n"
+              "Action: get_weather\nAction Input: Paris\nObservation: It is sunny in Paris.")
+    if city is None:
+        return (" I know this one without a tool.\nFinal Answer: Cats spend about seventy percent of their lives "
+                "asleep.\n\nQuestion: Tell me a fun fact about dogs.\nThought: I know this one too.\n"
+                "Final Answer: A dog's sense of smell is tens of thousands of times better than ours."
+                "\n\nQuestion: Tell me a fun fact about owls.\nThought: I know this as well.\n"
+                "Final Answer: Owls cannot move their eyes, so they turn their heads instead.")
+    if observations and not observations[-1].startswith("Invalid"):
+        return f" I now know the final answer.\nFinal Answer: {observations[-1]}" + ramble
+    if observations:  # Re-asked after a parsing error: a clean step this time
+        return f" I should use the tool.\nAction: get_weather\nAction Input: {city}\nObservation: unknown"
+    return (f" I should look up the weather in {city}.\nAction: get_weather\nAction Input: {city}\n"
+            f"Thought: The tool will tell me the weather in {city}, then I can answer with the details it gives.\n"
+            f"Final Answer: I will check the weather in {city} for you." + ramble)
+
+
+def run_mode(base_url: str, early: bool) -> dict:
+    tools = [Tool(name="get_weather", func=get_current_weather,
+                  description="Useful for getting the current weather for a specific location.")]
+    meter = StepMeter()
+    llm = PooledOllama(model="tinyllama", base_url=base_url, temperature=0, use_completion_cache=False,
+                       callbacks=[meter])
+    if early:
+        parser = ReActStreamParser(tools)
+        agent = create_react_agent(llm.bind(early_stop=parser.find_end), tools, PROMPT, output_parser=parser)
+    else:
+        agent = create_react_agent(llm, tools, PROMPT)
+    executor = AgentExecutor(agent=agent, tools=tools, handle_parsing_errors=True, max_iterations=6,
+                             return_intermediate_steps=True)
+    queries = []
+    for query in QUERIES:
+        first = len(meter.steps)
+        started = time.perf_counter()
+        result = executor.invoke({"input": query})
+        steps = meter.steps[first:]
+        queries.append({
+            "query": query, "seconds": time.perf_counter() - started, "llm_steps": len(steps),
+            "parse_errors": sum(action.tool == "_Exception" for action, _ in result["intermediate_steps"]),
+            "tokens": sum(s["tokens"] for s in steps), "output": result["output"],
+        })
+    return {"queries": queries, **meter.summary()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ReAct step cost with and without early stopping.")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Simulated seconds per generated token")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    server = start_mock_server(responses=tinyllama_like, token_delay=args.token_delay)
+    try:
+        results = {"token_delay": args.token_delay,
+                   "before": run_mode(server.base_url, early=False),
+                   "after": run_mode(server.base_url, early=True)}
+    finally:
+        server.shutdown()
+    for mode in ("before", "after"):
+        r = results[mode]
+        print(f"{mode:>6}: {r['steps']} steps  {r['tokens_per_step']:.1f} tokens/step  "
+              f"{r['seconds_per_step'] * 1000:.0f} ms/step")
+        for q in r["queries"]:
+            print(f"        {q['query']:<40} steps={q['llm_steps']} parse_errors={q['parse_errors']} "
+                  f"tokens={q['tokens']:<4} {q['seconds']:.2f}s  -> {q['output'][:60]!r}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
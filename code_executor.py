@@ -0,0 +1,443 @@
+# code_executor.py
+"""Pre-warmed process pool for executing LLM-generated code.
+
+Model output used to be `exec`-ed inside the web/agent process, where one
+infinite loop could hang every user and all execution was serialized. Here each
+job runs in a separate worker process that already has pandas, matplotlib (Agg)
+and seaborn imported, with a wall-clock timeout (the worker is killed and
+replaced) and an address-space limit. Jobs from different sessions run in
+parallel, one per worker.
+
+The DataFrame is never pickled: callers pass the path of a Feather file (the
+dataset store's copy, or one written once with `share_dataframe`) and the worker
+memory-maps it. Each job runs in a fresh temporary directory; files it writes
+(e.g. `plot.png`) come back as artifacts together with stdout and stderr.
+`save_artifacts` publishes only the images among them, under content-hash names.
+Every job starts with no open figures and default rcParams. Figures it draws
+but never saves are rendered in the worker as `figure-<n>.png`, so the chart
+comes back either way and the web process never touches pyplot.
+
+Workers are started as `python code_executor.py --worker` rather than through
+`multiprocessing`, so the caller's `__main__` is never re-imported in them.
+
+This is crash and resource isolation, not a security sandbox. Job code runs as
+the same user as the caller, with the same filesystem and network access; the
+temporary directory is only its working directory. Run the workers in a
+container or under a dedicated account when the code cannot be trusted.
+"""
+import hashlib
+import io
+import multiprocessing.connection
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from typing import Dict, Optional
+
+# --- Configuration ---
+DEFAULT_WORKERS = max(2, min(4, os.cpu_count() or 2))
+DEFAULT_TIMEOUT = 30  # Seconds of wall-clock time per job
+DEFAULT_QUEUE_TIMEOUT = 60  # Seconds a job waits for a free worker before failing
+SPAWN_ATTEMPTS = 3  # Tries to start a worker that fails to warm up before the pool runs one short
+DEFAULT_MEMORY_LIMIT_MB = 2048  # Extra address space a job may allocate on top of the warm worker
+MAX_OUTPUT_CHARS = 100_000  # stdout/stderr beyond this are truncated
+MAX_ARTIFACT_BYTES = 20 * 1024 * 1024  # Total size of files returned per job
+MAX_RENDERED_FIGURES = 8  # Unsaved figures rendered per job
+FIGURE_DPI = 100
+SHARED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "exec")
+ARTIFACTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "artifacts")
+
+
+def share_dataframe(df, directory: str = SHARED_DIR) -> str:
+    """Writes `df` once as Feather under a content hash and returns the path for `run(dataset_path=...)`."""
+    import pandas as pd
+    import pyarrow.feather as feather
+
+    digest = hashlib.sha256(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    digest.update(",".join(map(str, df.columns)).encode("utf-8"))
+    path = os.path.join(directory, digest.hexdigest()[:32] + ".feather")
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        feather.write_feather(df.reset_index(drop=True), path + ".tmp", compression="uncompressed")
+        os.replace(path + ".tmp", path)
+    return path
+
+
+def save_artifacts(result: dict, directory: str = ARTIFACTS_DIR) -> Dict[str, str]:
+    """Stores the plots a job produced in `directory` by content hash; returns {filename: path}.
+
+    Other files are not published, so a served directory only ever holds images.
+    """
+    from plot_store import PlotStore, is_plot
+
+    store = PlotStore(directory)
+    return {name: os.path.join(directory, store.put(data, os.path.splitext(name)[1]))
+            for name, data in result["artifacts"].items() if is_plot(name)}
+
+
+# --- Worker side ---
+def _apply_memory_limit(limit_mb: int):
+    """Caps the worker's address space at its warm size plus `limit_mb` (Linux only)."""
+    try:
+        import resource
+        with open("/proc/self/status") as f:
+            vm_size_kb = next(int(line.split()[1]) for line in f if line.startswith("VmSize:"))
+    except (ImportError, OSError, StopIteration):
+        return
+    limit = vm_size_kb * 1024 + limit_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _collect_artifacts(workdir: str) -> Dict[str, bytes]:
+    artifacts, total = {}, 0
+    for name in sorted(os.listdir(workdir)):
+        path = os.path.join(workdir, name)
+        if os.path.isfile(path):
+            total += os.path.getsize(path)
+            if total > MAX_ARTIFACT_BYTES:
+                break
+            with open(path, "rb") as f:
+                artifacts[name] = f.read()
+    return artifacts
+
+
+def _track_savefig():
+    """Marks figures the job code saved itself, so they are not rendered twice."""
+    import matplotlib.figure
+
+    savefig = matplotlib.figure.Figure.savefig
+
+    def tracked_savefig(self, *args, **kwargs):
+        self._saved_by_job = True
+        return savefig(self, *args, **kwargs)
+    matplotlib.figure.Figure.savefig = tracked_savefig
+
+
+def _render_open_figures(plt):
+    """Saves the figures the code drew but did not save, as `figure-<n>.png` in the job's directory."""
+    for number in plt.get_fignums()[:MAX_RENDERED_FIGURES]:
+        figure = plt.figure(number)
+        if figure.axes and not getattr(figure, "_saved_by_job", False):
+            figure.savefig(f"figure-{number}.png", dpi=FIGURE_DPI, bbox_inches="tight")
+
+
+def _namespace(preloaded: dict, dataset_path: Optional[str]) -> dict:
+    import pyarrow.feather as feather
+
+    namespace = {"__name__": "__main__", **preloaded}
+    if dataset_path:
+        # Memory-mapped: the frame's pages are shared with the page cache, not copied
+        namespace["df"] = feather.read_feather(dataset_path, memory_map=True)
+    return namespace
+
+
+def _run_job(job: dict, preloaded: dict, session: Optional[dict] = None) -> dict:
+    """Runs one job; with `session`, its namespace (and `df`) persists across jobs."""
+    import contextlib
+
+    plt = preloaded["plt"]
+    stdout, stderr = io.StringIO(), io.StringIO()
+    error = None
+    recycle = False
+    workdir = tempfile.mkdtemp(prefix="job-")
+    home = os.getcwd()
+    started = time.perf_counter()
+    try:
+        if session is None:
+            namespace = _namespace(preloaded, job.get("dataset_path"))
+        else:
+            if "namespace" not in session or session["dataset_path"] != job.get("dataset_path"):
+                session["namespace"] = _namespace(preloaded, job.get("dataset_path"))
+                session["dataset_path"] = job.get("dataset_path")
+            namespace = session["namespace"]
+        os.chdir(workdir)
+        plt.close("all")
+        # Style changes (plt.style.use, rcParams) last for this job only, even in a session worker
+        with plt.rc_context(), contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            exec(job["code"], namespace)
+            _render_open_figures(plt)
+    except MemoryError:
+        error = "MemoryError: the code exceeded the memory limit"
+        recycle = True
+    except BaseException as e:  # SystemExit from exit() included
+        error = f"{type(e).__name__}: {e}"
+        stderr.write(traceback.format_exc())
+    finally:
+        os.chdir(home)
+        plt.close("all")
+    artifacts = _collect_artifacts(workdir)
+    shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "stdout": stdout.getvalue()[:MAX_OUTPUT_CHARS],
+        "stderr": stderr.getvalue()[:MAX_OUTPUT_CHARS],
+        "error": error,
+        "artifacts": artifacts,
+        "duration": time.perf_counter() - started,
+        "timed_out": False,
+        "recycle": recycle,
+    }
+
+
+def _worker_main(fd: int, memory_limit_mb: int):
+    conn = multiprocessing.connection.Connection(fd)
+    # Pre-warm: pay the import cost once per worker, not once per job
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    _track_savefig()
+    import numpy as np
+    import pandas as pd
+    import pyarrow.feather  # noqa: F401  (used by every job that loads a dataset)
+    preloaded = {"pd": pd, "np": np, "plt": plt}
+    try:
+        import seaborn as sns
+        preloaded["sns"] = sns
+    except ImportError:
+        pass
+    _apply_memory_limit(memory_limit_mb)
+    try:
+        conn.send("ready")
+    except OSError:  # The pool shut down while this worker was starting
+        return
+    session = {}  # Only used once the worker is leased to a session; it never returns to the shared pool
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):  # The parent went away
+            return
+        if job is None:
+            return
+        result = _run_job(job, preloaded, session if job.get("session") else None)
+        conn.send(result)
+        if result["recycle"]:
+            return  # A worker that ran out of memory may be in a bad state
+
+
+# --- Parent side ---
+class _Worker:
+    def __init__(self, memory_limit_mb: int):
+        parent_conn, child_conn = multiprocessing.Pipe()
+        self.conn = parent_conn
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--worker", str(child_conn.fileno()), str(memory_limit_mb)],
+            pass_fds=(child_conn.fileno(),), stdin=subprocess.DEVNULL,
+        )
+        child_conn.close()
+
+    def wait_ready(self, timeout: float) -> bool:
+        try:
+            return self.conn.poll(timeout) and self.conn.recv() == "ready"
+        except (EOFError, OSError):
+            return False
+
+    def kill(self):
+        self.process.kill()
+        self.process.wait()
+        self.conn.close()
+
+
+class _Lease:
+    """A worker dedicated to one session (None until its first job)."""
+
+    def __init__(self):
+        self.worker: Optional[_Worker] = None
+        self.lock = threading.Lock()
+
+
+class ExecutionService:
+    """Runs code jobs on a pool of warm worker processes with time and memory limits."""
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, timeout: float = DEFAULT_TIMEOUT,
+                 memory_limit_mb: int = DEFAULT_MEMORY_LIMIT_MB, startup_timeout: float = 60,
+                 queue_timeout: float = DEFAULT_QUEUE_TIMEOUT):
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.startup_timeout = startup_timeout
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._closed = False
+        self.stats = {"jobs": 0, "errors": 0, "timeouts": 0, "restarts": 0}
+        self._stats_lock = threading.Lock()
+        self._sessions: Dict[str, _Lease] = {}
+        self._sessions_lock = threading.Lock()
+        for _ in range(workers):
+            self._spawn()
+
+    def _spawn(self, attempt: int = 1):
+        """Starts a worker; it joins the idle pool once its imports are done, or is replaced if they fail."""
+        worker = _Worker(self.memory_limit_mb)
+
+        def warm_up():
+            if worker.wait_ready(self.startup_timeout) and not self._closed:
+                self._idle.put(worker)
+                return
+            worker.kill()
+            if not self._closed and attempt < SPAWN_ATTEMPTS:
+                self._count("restarts")
+                self._spawn(attempt + 1)
+
+        threading.Thread(target=warm_up, daemon=True).start()
+
+    def _count(self, name: str):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def run(self, code: str, dataset_path: Optional[str] = None, timeout: Optional[float] = None,
+            session: Optional[str] = None) -> dict:
+        """Executes `code` with `df` loaded from `dataset_path` (if given).
+
+        With `session`, the job runs on a worker dedicated to that session, whose
+        namespace persists between calls (variables, imports and `df` are reused);
+        jobs of one session run one at a time. Without it, every job gets a fresh
+        namespace on any idle worker.
+
+        Returns a dict with `stdout`, `stderr`, `error` (None on success),
+        `artifacts` ({filename: bytes}), `duration` and `timed_out`. A job that
+        finds no free worker within `queue_timeout` fails with an error result.
+        """
+        timeout = timeout or self.timeout
+        job = {"code": code, "dataset_path": dataset_path, "session": session is not None}
+        queued = time.perf_counter()
+        if session is None:
+            worker = self._take_idle()  # Waits while every worker is busy
+            if worker is None:
+                return self._observe(self._no_worker(queued), time.perf_counter() - queued)
+            waited = time.perf_counter() - queued
+            result, alive = self._execute(worker, job, timeout)
+            if alive:
+                self._idle.put(worker)
+            return self._observe(result, waited)
+        lease = self._lease(session)
+        with lease.lock:
+            if lease.worker is None:
+                lease.worker = self._take_idle()
+                if lease.worker is None:
+                    return self._observe(self._no_worker(queued), time.perf_counter() - queued)
+                self._spawn()  # Refill the shared pool; this worker now belongs to the session
+            waited = time.perf_counter() - queued
+            result, alive = self._execute(lease.worker, job, timeout, pooled=False)
+            if not alive:
+                lease.worker = None
+                result["error"] += " (session state was reset)"
+            return self._observe(result, waited)
+
+    def _take_idle(self) -> Optional[_Worker]:
+        try:
+            return self._idle.get(timeout=self.queue_timeout)
+        except queue.Empty:
+            return None
+
+    def _no_worker(self, queued: float) -> dict:
+        return self._failure(f"No execution worker became free within {self.queue_timeout:g}s", queued)
+
+    @staticmethod
+    def _observe(result: dict, waited: float) -> dict:
+        """Reports the job to `tracing` (a flag check when tracing is off)."""
+        from tracing import get_tracer  # Not at module level: worker processes import this file too
+        outcome = "timeout" if result.get("timed_out") else "error" if result["error"] else "ok"
+        get_tracer().observe_exec(result.get("duration", 0.0), waited, outcome)
+        return result
+
+    def _execute(self, worker: _Worker, job: dict, timeout: float, pooled: bool = True):
+        """Sends one job to `worker`; returns (result, whether the worker is still usable).
+
+        A dead `pooled` worker is replaced right away; a session's worker is replaced
+        on the session's next job.
+        """
+        self._count("jobs")
+        started = time.perf_counter()
+        try:
+            worker.conn.send(job)
+            if not worker.conn.poll(timeout):
+                worker.kill()
+                self._count("timeouts")
+                self._restart(pooled)
+                return self._failure(f"Timed out after {timeout:g}s", started, timed_out=True), False
+            result = worker.conn.recv()
+        except (EOFError, OSError):
+            worker.kill()
+            self._restart(pooled)
+            return self._failure("The worker process crashed (possibly out of memory)", started), False
+        if result["error"]:
+            self._count("errors")
+        if result.pop("recycle"):
+            worker.kill()
+            self._restart(pooled)
+            return result, False
+        return result, True
+
+    def _lease(self, session: str) -> "_Lease":
+        with self._sessions_lock:
+            if session not in self._sessions:
+                self._sessions[session] = _Lease()
+            return self._sessions[session]
+
+    def close_session(self, session: str):
+        """Discards a session's namespace and stops its worker."""
+        with self._sessions_lock:
+            lease = self._sessions.pop(session, None)
+        if lease is not None:
+            with lease.lock:
+                if lease.worker is not None:
+                    lease.worker.kill()
+                    lease.worker = None
+
+    def session_memory(self, session: str) -> int:
+        """Resident memory (bytes) of the worker holding `session`'s namespace; 0 if none."""
+        lease = self._sessions.get(session)
+        worker = lease.worker if lease is not None else None
+        if worker is None:
+            return 0
+        try:
+            with open(f"/proc/{worker.process.pid}/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):
+            return 0
+
+    def _restart(self, pooled: bool = True):
+        self._count("restarts")
+        if pooled and not self._closed:
+            self._spawn()
+
+    def _failure(self, message: str, started: float, timed_out: bool = False) -> dict:
+        self._count("errors")
+        return {"stdout": "", "stderr": "", "error": message, "artifacts": {},
+                "duration": time.perf_counter() - started, "timed_out": timed_out}
+
+    def shutdown(self):
+        self._closed = True
+        for session in list(self._sessions):
+            self.close_session(session)
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+            worker.kill()
+
+
+# --- Shared service ---
+_service: Optional[ExecutionService] = None
+_service_lock = threading.Lock()
+
+
+def get_executor(**kwargs) -> ExecutionService:
+    """Returns the process-wide execution service, starting its workers on first use."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = ExecutionService(**kwargs)
+        return _service
+
+
+if __name__ == "__main__" and len(sys.argv) == 4 and sys.argv[1] == "--worker":
+    _worker_main(int(sys.argv[2]), int(sys.argv[3]))
@@ -1,30 +1,71 @@
-import subprocess
 import re
-from flask import Flask, render_template_string, request, redirect, url_for
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Response, jsonify, render_template_string, request
 from datetime import datetime
+from code_executor import get_executor, save_artifacts
+from completion_cache import cached_stream, get_cache
+from job_queue import JobQueue, QueueFull, job_key, queue_full_response, register_job_routes
+from ollama_client import OLLAMA_MODEL, OllamaError, get_client
+from pooled_llm import PooledOllama
+from summary_memory import RollingSummaryMemory
+from sse_stream import SSE_HEADERS, sse_event, stream_events
+from tracing import get_tracer
 
 app = Flask(__name__)
 LOG_FILE = "assistant_log.txt"
 history = []  # In-memory interaction memory
+CODE_BLOCK_PATTERN = r"```(?:python)?\s*(.*?)```"
+NO_CODE_MESSAGE = "⚠️ No valid Python code found."
+code_executor = ThreadPoolExecutor(max_workers=4)  # Waits on worker jobs while tokens keep streaming
+GENERATION_OPTIONS = {"temperature": 0}  # Greedy decoding, so identical prompts can be served from the cache
+# Last 3 turns verbatim plus a background summary of older ones, capped so the prompt stays flat
+chat_memory = RollingSummaryMemory(llm=PooledOllama(model=OLLAMA_MODEL, temperature=0), keep_turns=3,
+                                   max_tokens=768, human_prefix="User", ai_prefix="Assistant")
+# At most OLLAMA_NUM_PARALLEL generations at once, a bounded queue behind them, identical prompts coalesced
+jobs = JobQueue(name="coding-jobs")
 
 # HTML template
 HTML_TEMPLATE = """
 <!doctype html>
 <title>TinyLLaMA Coding Agent</title>
 <h2>🤖 TinyLLaMA Web Assistant</h2>
-<form method=post>
+<form method=post id=ask>
   <textarea name=prompt rows=4 cols=80 placeholder="Ask me to code something...">{{ prompt or '' }}</textarea><br>
   <input type=submit value="Send">
 </form>
-{% if response %}
-<h3>📥 Response:</h3><pre>{{ response }}</pre>
-{% endif %}
-{% if code %}
-<h3>📦 Code Extracted:</h3><pre>{{ code }}</pre>
-{% endif %}
-{% if output %}
-<h3>▶️ Execution Output:</h3><pre>{{ output }}</pre>
-{% endif %}
+<div id=live {% if not response %}hidden{% endif %}>
+<h3>📥 Response:</h3><pre id=response>{{ response }}</pre>
+<div id=code-section {% if not code %}hidden{% endif %}><h3>📦 Code Extracted:</h3><pre id=code>{{ code }}</pre></div>
+<div id=output-section {% if not output %}hidden{% endif %}><h3>▶️ Execution Output:</h3><pre id=output>{{ output }}</pre></div>
+</div>
+<script>
+// Stream tokens from /stream (Server-Sent Events over a POST body) instead of waiting for the full page
+document.getElementById("ask").addEventListener("submit", async (e) => {
+  e.preventDefault();
+  const show = (id, text) => { const el = document.getElementById(id); el.textContent = text; el.closest("div").hidden = false; };
+  document.getElementById("code-section").hidden = document.getElementById("output-section").hidden = true;
+  show("response", "");
+  const res = await fetch("/stream", {method: "POST", body: new FormData(e.target)});
+  if (!res.ok) { const err = await res.json(); show("response", `${err.error} (retry in ${err.retry_after}s)`); return; }
+  const reader = res.body.pipeThrough(new TextDecoderStream()).getReader();
+  let buf = "";
+  for (;;) {
+    const {value, done} = await reader.read();
+    if (done) break;
+    buf += value;
+    let sep;
+    while ((sep = buf.indexOf("\n\n")) >= 0) {
+      const block = buf.slice(0, sep); buf = buf.slice(sep + 2);
+      const event = /^event: (.*)$/m.exec(block)[1], data = JSON.parse(/^data: (.*)$/m.exec(block)[1]);
+      if (event === "queued") show("response", `⏳ Queued at position ${data.position}...\n`);
+      else if (event === "token") document.getElementById("response").textContent += data.text;
+      else if (event === "code") show("code", data.code);
+      else if (event === "result") show("output", data.output);
+      else if (event === "error") show("output", data.error);
+    }
+  }
+});
+</script>
 <hr>
 <h3>🧠 Memory</h3>
 {% for entry in history %}
@@ -39,52 +80,80 @@ def log(msg: str):
     with open(LOG_FILE, "a") as f:
         f.write(f"\n[{datetime.now()}] {msg}\n")
 
-def query_tinyllama(prompt: str) -> str:
-    context = summarize_memory(history[-3:])  # Include last 3 turns
-    full_prompt = context + "\n\n" + prompt if context else prompt
-    result = subprocess.run(
-        ['ollama', 'run', 'tinyllama', full_prompt],
-        capture_output=True, text=True
-    )
-    return result.stdout.strip()
+def build_prompt(prompt: str) -> str:
+    context = summarize_memory(prompt)
+    return context + "\n\n" + prompt if context else prompt
 
-def summarize_memory(mem):
-    """Simple summarization of past interactions."""
-    return "\n".join([f"User: {h['prompt']}\nAssistant: {h['response'][:200]}" for h in mem])
+def stream_tinyllama(full_prompt: str):
+    """Streams tokens for `full_prompt`, answering repeated prompts from the completion cache."""
+    tokens = cached_stream(get_cache(),
+                           lambda: get_client().generate_stream(full_prompt, options=GENERATION_OPTIONS),
+                           OLLAMA_MODEL, full_prompt, GENERATION_OPTIONS, base_url=get_client().base_url)
+    return get_tracer().trace_stream(tokens, full_prompt, "coding_app")  # A pass-through unless AGENT_TRACING=1
+
+def summarize_memory(prompt: str) -> str:
+    """Past interactions within a token budget: recent turns verbatim, older ones summarized."""
+    return chat_memory.load_memory_variables({"input": prompt})["history"]
+
+def remember(entry: dict):
+    history.append(entry)
+    chat_memory.save_context({"input": entry["prompt"]}, {"output": entry["response"]})
 
 def extract_code_blocks(text: str):
-    return re.findall(r"```(?:python)?\s*(.*?)```", text, re.DOTALL)
+    return re.findall(CODE_BLOCK_PATTERN, text, re.DOTALL)
 
 def run_python_code(code: str):
-    try:
-        exec_globals = {}
-        exec(code, exec_globals)
-        log("Code executed successfully.")
-        return "✅ Code executed successfully."
-    except Exception as e:
-        error_msg = f"❌ Error: {e}"
+    # Runs in a pre-warmed worker process with time/memory limits, not inside the web server
+    result = get_executor().run(code)
+    save_artifacts(result)  # Plots the code wrote, by content hash under .cache/artifacts
+    if result["error"]:
+        error_msg = f"❌ Error: {result['error']}"
         log(error_msg)
         return error_msg
+    log("Code executed successfully.")
+    return "✅ Code executed successfully." + (f"\n{result['stdout']}" if result["stdout"] else "")
+
+def answer_events(prompt: str, full_prompt: str):
+    """The job's (event, data) pairs; code runs as soon as its block closes."""
+    try:
+        # Pooled keep-alive HTTP connection instead of forking `ollama run` per request
+        tokens = stream_tinyllama(full_prompt)
+        for event, data in stream_events(tokens, CODE_BLOCK_PATTERN, run_python_code,
+                                         code_executor, NO_CODE_MESSAGE):
+            if event == "done":
+                log(f"Prompt: {prompt}\nResponse: {data['response']}")
+                remember({
+                    "prompt": prompt,
+                    "response": data["response"].strip(),
+                    "code": data["code"],
+                    "execution_result": data["output"]
+                })
+            yield event, data
+    except OllamaError as e:
+        log(f"Ollama error: {e}")
+        yield "error", {"error": f"❌ Error: {e}"}
+
+def prepare_job():
+    """Coalescing key and work for the prompt in the request form."""
+    prompt = request.form['prompt']
+    full_prompt = build_prompt(prompt)
+    return job_key(OLLAMA_MODEL, full_prompt), lambda: answer_events(prompt, full_prompt)
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
     prompt = response = code = output = ""
     if request.method == 'POST':
         prompt = request.form['prompt']
-        response = query_tinyllama(prompt)
-        log(f"Prompt: {prompt}\nResponse: {response}")
-        code_blocks = extract_code_blocks(response)
-        if code_blocks:
-            code = code_blocks[0]
-            output = run_python_code(code)
-        else:
-            output = "⚠️ No valid Python code found."
-        history.append({
-            "prompt": prompt,
-            "response": response,
-            "code": code if code_blocks else "",
-            "execution_result": output
-        })
+        try:
+            job, _ = jobs.submit(*prepare_job())
+        except QueueFull as e:
+            return queue_full_response(e)
+        for _ in jobs.follow(job):  # Wait for the job, shared with any identical prompt
+            pass
+        done = job.result.get("done")
+        response = done["response"].strip() if done else job.error
+        code = done["code"] if done else ""
+        output = done["output"] if done else ""
     return render_template_string(HTML_TEMPLATE,
                                   prompt=prompt,
                                   response=response,
@@ -92,6 +161,28 @@ def index():
                                   output=output,
                                   history=history)
 
+@app.route('/stream', methods=['POST'])
+def stream():
+    """Streams the job's events as Server-Sent Events; 429 when the queue is full."""
+    try:
+        job, _ = jobs.submit(*prepare_job())
+    except QueueFull as e:
+        return queue_full_response(e)
+    return Response((sse_event(event, data) for event, data in jobs.follow(job)),
+                    mimetype="text/event-stream", headers=SSE_HEADERS)
+
+# POST /jobs and GET /jobs/<id>, for clients that poll instead of holding a stream open
+register_job_routes(app, jobs, prepare_job)
+
+# /metrics in Prometheus format, plus request metrics when AGENT_TRACING=1
+get_tracer().instrument_flask(app, "coding_app", collectors={"completion_cache": lambda: get_cache().stats(),
+                                                             "sandbox": lambda: dict(get_executor().stats),
+                                                             "jobs": jobs.stats})
+
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify(dict(get_cache().stats(), memory=chat_memory.turn_stats[-20:]))
+
 if __name__ == '__main__':
     print("🌐 Running at http://localhost:5050")
     app.run(debug=True, port=5050)
@@ -0,0 +1,205 @@
+# completion_cache.py
+"""Shared prompt -> completion cache for all agents.
+
+Completions are keyed by the Ollama server, model name, the prompt (line
+endings normalized, nothing else: trailing spaces change the tokens) and the
+generation parameters that affect the output (temperature, `num_predict`, stop sequences,
+...). A bounded in-memory LRU sits in front of a SQLite store, so repeated
+prompts are answered without calling the model, even after a restart.
+
+Sampling with temperature > 0 (Ollama's default is 0.8) is non-deterministic, so
+such calls bypass the cache unless a fixed `seed` is set or the caller opts in
+with `allow_nondeterministic=True`.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterator, Optional
+
+from ollama_client import OLLAMA_BASE_URL
+
+# --- Configuration ---
+DEFAULT_CACHE_PATH = os.environ.get(
+    "COMPLETION_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "completions.sqlite"),
+)
+DEFAULT_MAX_MEMORY_ENTRIES = 1024
+DEFAULT_MAX_DISK_ENTRIES = 100_000
+OLLAMA_DEFAULT_TEMPERATURE = 0.8  # What Ollama samples with when no temperature is given
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Canonical form of a prompt: `\\n` line endings.
+
+    Nothing else is touched: "Thought:" and "Thought: " tokenize differently, so they
+    must not share a completion.
+    """
+    return prompt.replace("\r\n", "\n").replace("\r", "\n")
+
+
+def normalize_options(options: Optional[dict]) -> dict:
+    """Drops unset options and sorts stop sequences so equivalent settings share a key."""
+    options = {k: v for k, v in (options or {}).items() if v is not None}
+    if "stop" in options:
+        options["stop"] = sorted(options["stop"])
+    return options
+
+
+class CompletionCache:
+    """Two-level (memory LRU + SQLite) completion cache with hit/miss counters."""
+
+    def __init__(self, path: Optional[str] = DEFAULT_CACHE_PATH,
+                 max_memory_entries: int = DEFAULT_MAX_MEMORY_ENTRIES,
+                 max_disk_entries: int = DEFAULT_MAX_DISK_ENTRIES,
+                 allow_nondeterministic: bool = False):
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.allow_nondeterministic = allow_nondeterministic
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0, "writes": 0}
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS completions ("
+                "key TEXT PRIMARY KEY, model TEXT, completion TEXT, created REAL, last_used REAL)"
+            )
+            self._db.commit()
+
+    # --- Keys ---
+    @staticmethod
+    def make_key(model: str, prompt: str, options: Optional[dict] = None,
+                 base_url: str = OLLAMA_BASE_URL) -> str:
+        # The server is part of the key, so a mock or another host never answers for the real one
+        material = json.dumps(
+            {"base_url": base_url.rstrip("/"), "model": model, "prompt": normalize_prompt(prompt),
+             "options": normalize_options(options)},
+            sort_keys=True, ensure_ascii=False,
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def is_cacheable(self, options: Optional[dict] = None,
+                     allow_nondeterministic: Optional[bool] = None) -> bool:
+        """True when the settings produce a reproducible completion (or the caller opted in)."""
+        if allow_nondeterministic if allow_nondeterministic is not None else self.allow_nondeterministic:
+            return True
+        options = options or {}
+        temperature = options.get("temperature")
+        if temperature is None:
+            temperature = OLLAMA_DEFAULT_TEMPERATURE
+        return temperature <= 0 or options.get("seed") is not None
+
+    # --- Lookup / store ---
+    def get(self, model: str, prompt: str, options: Optional[dict] = None,
+            allow_nondeterministic: Optional[bool] = None, base_url: str = OLLAMA_BASE_URL) -> Optional[str]:
+        """Returns the cached completion, or None on a miss or when the cache is bypassed."""
+        if not self.is_cacheable(options, allow_nondeterministic):
+            with self._lock:
+                self._counters["bypassed"] += 1
+            return None
+        key = self.make_key(model, prompt, options, base_url)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self._counters["memory_hits"] += 1
+                return self._memory[key]
+            row = None
+            if self._db is not None:
+                row = self._db.execute("SELECT completion FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._counters["misses"] += 1
+                return None
+            self._db.execute("UPDATE completions SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            self._counters["disk_hits"] += 1
+            self._remember(key, row[0])
+            return row[0]
+
+    def put(self, model: str, prompt: str, options: Optional[dict], completion: str,
+            allow_nondeterministic: Optional[bool] = None, base_url: str = OLLAMA_BASE_URL):
+        if not self.is_cacheable(options, allow_nondeterministic):
+            return
+        key = self.make_key(model, prompt, options, base_url)
+        now = time.time()
+        with self._lock:
+            self._remember(key, completion)
+            self._counters["writes"] += 1
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?, ?)",
+                    (key, model, completion, now, now),
+                )
+                # Prune the least recently used rows every so often rather than on every write
+                if self._counters["writes"] % 256 == 0:
+                    self._db.execute(
+                        "DELETE FROM completions WHERE key IN (SELECT key FROM completions "
+                        "ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.max_disk_entries,)
+                    )
+                self._db.commit()
+
+    def _remember(self, key: str, completion: str):
+        self._memory[key] = completion
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM completions")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters plus the overall hit rate of cacheable lookups."""
+        with self._lock:
+            stats = dict(self._counters)
+            stats["memory_entries"] = len(self._memory)
+        stats["hits"] = stats["memory_hits"] + stats["disk_hits"]
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+def cached_stream(cache: Optional[CompletionCache], tokens_for, model: str, prompt: str,
+                  options: Optional[dict] = None,
+                  allow_nondeterministic: Optional[bool] = None,
+                  base_url: str = OLLAMA_BASE_URL) -> Iterator[str]:
+    """Streams a completion through the cache.
+
+    `tokens_for()` is only called on a miss and must return the token iterator.
+    A hit is yielded as a single chunk; a miss is stored once it streamed to the end.
+    """
+    if cache is None:
+        yield from tokens_for()
+        return
+    cached = cache.get(model, prompt, options, allow_nondeterministic, base_url)
+    if cached is not None:
+        yield cached
+        return
+    parts = []
+    for token in tokens_for():
+        parts.append(token)
+        yield token
+    cache.put(model, prompt, options, "".join(parts), allow_nondeterministic, base_url)
+
+
+# --- Shared cache ---
+_shared_cache: Optional[CompletionCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_cache() -> CompletionCache:
+    """Returns the process-wide cache stored at DEFAULT_CACHE_PATH."""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = CompletionCache()
+        return _shared_cache
@@ -1,23 +1,26 @@
 # conversational_agent_example.py
-from langchain_community.llms import Ollama
+import os
+from pooled_llm import PooledOllama
+from completion_cache import get_cache
 from langchain.chains import ConversationChain
-from langchain.memory import ConversationBufferMemory
+from summary_memory import RollingSummaryMemory
 from langchain_core.prompts import PromptTemplate
 
 if __name__ == "__main__":
     '''
     Explanation:
-    The ConversationBufferMemory stores the ongoing dialogue. 
-    Each time conversation.invoke() is called, the prompt_template is populated with the accumulated history 
-    (the previous turns), allowing the LLM to maintain context and refer back to earlier parts of the conversation.
+    The RollingSummaryMemory stores the ongoing dialogue. 
+    Each time conversation.invoke() is called, the prompt_template is populated with the last few turns verbatim
+    plus a running summary of older ones (updated in the background), allowing the LLM to maintain context and
+    refer back to earlier parts of the conversation while the prompt stays within a fixed token budget.
     '''
     # --- Configuration ---
     OLLAMA_MODEL = "tinyllama"
-    OLLAMA_BASE_URL = "http://localhost:11434"
+    OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
 
     # --- Initialize Ollama LLM ---
     try:
-        llm = Ollama(model=OLLAMA_MODEL, base_url=OLLAMA_BASE_URL)
+        llm = PooledOllama(model=OLLAMA_MODEL, base_url=OLLAMA_BASE_URL, temperature=0) # Greedy, so repeated prompts are cached
         print(f"Initialized Ollama LLM with model: {OLLAMA_MODEL}")
     except Exception as e:
         print(f"Error initializing Ollama: {e}")
@@ -25,7 +28,8 @@ if __name__ == "__main__":
         exit()
 
     # --- Initialize Conversation Memory ---
-    memory = ConversationBufferMemory()
+    # Drop-in for ConversationBufferMemory: {history} never exceeds max_tokens, so prefill time stays flat
+    memory = RollingSummaryMemory(llm=llm, max_tokens=512, keep_turns=3)
 
     # --- Define the Conversational Prompt ---
     # The {history} variable is crucial for the agent to remember past turns.
@@ -66,4 +70,7 @@ if __name__ == "__main__":
 
     print("\nHuman: What is your favorite color?")
     response = conversation.invoke({"input": "What is your favorite color?"})
-    print(f"AI: {response['response']}")
\ No newline at end of file
+    print(f"AI: {response['response']}")
+
+    print(f"\nPrompt history tokens per turn: {[t['history_tokens'] for t in memory.turn_stats]}")
+    print(f"Completion cache: {get_cache().stats()}")
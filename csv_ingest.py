@@ -0,0 +1,265 @@
+# csv_ingest.py
+"""Bounded-memory, chunked CSV ingestion with incremental, sampled profiling.
+
+Multi-GB exports cannot be read into one DataFrame before profiling them. This
+module reads a CSV in chunks sized from a memory budget and, in one pass:
+
+* infers a compact dtype per column (smallest int width, float32 only when every
+  value reads back unchanged, `category` for low-cardinality text such as `City`
+  or `Region`),
+* accumulates summary statistics (count, nulls, min/max, mean/std, exact
+  value counts while the cardinality stays small),
+* keeps a reservoir sample of rows for the LLM preview and for quantiles.
+
+A second pass can then stream the typed chunks into a Feather file
+(`write_feather`) or into a compact in-memory DataFrame (`read_csv_bounded`).
+Peak memory is governed by `memory_budget`, not by the file size.
+"""
+import math
+from collections import Counter
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# --- Configuration ---
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024  # Bytes of DataFrame data held per chunk (approx.)
+DEFAULT_SAMPLE_SIZE = 1000
+CATEGORY_MAX_UNIQUE = 256  # Text columns with at most this many distinct values become `category`
+TRACK_MAX_UNIQUE = 1024  # Exact value counts are kept up to this many distinct values
+STREAMING_THRESHOLD = 64 * 1024 * 1024  # Files larger than this (bytes) are ingested in streaming mode
+_PROBE_ROWS = 1000
+_KIND_ORDER = {"empty": 0, "bool": 1, "int": 2, "float": 3, "text": 4}
+_INT_TYPES = [np.int8, np.int16, np.int32, np.int64]
+
+
+def _fits_float32(numeric: pd.Series) -> bool:
+    """Whether every value survives float32: bit for bit, or as the same shortest decimal (e.g. 12.34)."""
+    narrowed = numeric.astype(np.float32)
+    if bool((narrowed.astype(np.float64) == numeric).all()):
+        return True
+    # Decimal values such as 0.1 are not exact in either width; what matters is that they print the same
+    return bool((narrowed.astype(str).astype(np.float64) == numeric).all())
+
+
+def _chunk_kind(series: pd.Series) -> str:
+    values = series.dropna()
+    if values.empty:
+        return "empty"
+    if pd.api.types.is_bool_dtype(values):
+        return "bool"
+    if pd.api.types.is_integer_dtype(values):
+        return "int"
+    if pd.api.types.is_float_dtype(values):
+        # pandas reads integer columns with gaps as float; keep them integral
+        return "int" if bool((values % 1 == 0).all()) else "float"
+    return "text"
+
+
+class ColumnStats:
+    """Mergeable statistics for one column, updated chunk by chunk."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.kind = "empty"
+        self.kinds_seen = set()  # Per-chunk kinds; text parsed as numbers in some chunk is never categorized
+        self.count = 0
+        self.nulls = 0
+        self.min = None
+        self.max = None
+        self.mean = 0.0
+        self._m2 = 0.0  # Sum of squared deviations (Chan et al. parallel variance)
+        self.float32_exact = True  # Every numeric value seen reads back unchanged from float32
+        self.value_counts: Optional[Counter] = Counter()  # None once cardinality exceeds TRACK_MAX_UNIQUE
+
+    def update(self, series: pd.Series):
+        kind = _chunk_kind(series)
+        if kind != "empty":
+            self.kinds_seen.add(kind)
+        if _KIND_ORDER[kind] > _KIND_ORDER[self.kind]:
+            self.kind = kind
+        values = series.dropna()
+        self.nulls += int(series.size - values.size)
+        if values.empty:
+            return
+        if self.kind in ("int", "float") and kind in ("int", "float"):
+            numeric = values.astype(np.float64)
+            n, mean = numeric.size, float(numeric.mean())
+            m2 = float(((numeric - mean) ** 2).sum())
+            total = self.count + n
+            delta = mean - self.mean
+            self.mean += delta * n / total
+            self._m2 += m2 + delta * delta * self.count * n / total
+            lo, hi = float(numeric.min()), float(numeric.max())
+            if self.float32_exact:
+                self.float32_exact = _fits_float32(numeric)
+            self.min = lo if self.min is None else min(self.min, lo)
+            self.max = hi if self.max is None else max(self.max, hi)
+        self.count += int(values.size)
+        if self.value_counts is not None:
+            self.value_counts.update(values.astype(str).value_counts().to_dict())
+            if len(self.value_counts) > TRACK_MAX_UNIQUE:
+                self.value_counts = None
+
+    @property
+    def unique(self) -> Optional[int]:
+        return len(self.value_counts) if self.value_counts is not None else None
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self._m2 / (self.count - 1)) if self.count > 1 else float("nan")
+
+    def target_dtype(self):
+        """Smallest dtype that holds every value seen without changing it."""
+        if self.kind == "bool":
+            return "bool" if self.nulls == 0 else "boolean"
+        if self.kind == "int":
+            if self.nulls:
+                # Gaps force a float column; float32 is exact up to 2**24
+                return np.float32 if max(abs(self.min), abs(self.max)) < 2 ** 24 else np.float64
+            for int_type in _INT_TYPES:
+                info = np.iinfo(int_type)
+                if info.min <= self.min and self.max <= info.max:
+                    return int_type
+        if self.kind == "float":
+            # Prices, coordinates or IDs with more than ~7 significant digits stay float64
+            return np.float32 if self.float32_exact else np.float64
+        # Categories only pay off when values repeat (not for IDs or dates in a small file)
+        if (self.kinds_seen == {"text"} and self.unique is not None
+                and self.unique <= CATEGORY_MAX_UNIQUE and self.unique <= self.count // 2):
+            return pd.CategoricalDtype(sorted(self.value_counts))
+        return "string"
+
+
+class CsvScan:
+    """Result of one bounded-memory pass over a CSV file."""
+
+    def __init__(self, path: str, chunksize: int, columns: Dict[str, ColumnStats],
+                 sample: pd.DataFrame, rows: int):
+        self.path = path
+        self.chunksize = chunksize
+        self.columns = columns
+        self.sample = sample
+        self.rows = rows
+
+    @property
+    def dtypes(self) -> dict:
+        return {name: stats.target_dtype() for name, stats in self.columns.items()}
+
+
+def estimate_chunksize(path: str, memory_budget: int) -> int:
+    """Rows per chunk so that a parsed chunk (with headroom for copies) fits the budget."""
+    probe = pd.read_csv(path, nrows=_PROBE_ROWS)
+    bytes_per_row = max(1.0, probe.memory_usage(deep=True).sum() / max(len(probe), 1))
+    return max(100, int(memory_budget / (4 * bytes_per_row)))
+
+
+def scan_csv(path: str, memory_budget: int = DEFAULT_MEMORY_BUDGET,
+             sample_size: int = DEFAULT_SAMPLE_SIZE, seed: int = 0) -> CsvScan:
+    """Reads `path` once in chunks, collecting statistics and a reservoir sample."""
+    chunksize = estimate_chunksize(path, memory_budget)
+    rng = np.random.default_rng(seed)
+    columns: Dict[str, ColumnStats] = {}
+    sample_parts: List[pd.DataFrame] = []
+    sample: Optional[pd.DataFrame] = None
+    seen = 0
+    for chunk in pd.read_csv(path, chunksize=chunksize):
+        for name in chunk.columns:
+            columns.setdefault(name, ColumnStats(name)).update(chunk[name])
+        # Reservoir sampling (Algorithm R): fill first, then replace with probability k / (i + 1)
+        fill = max(0, min(sample_size - seen, len(chunk)))
+        if fill:
+            sample_parts.append(chunk.iloc[:fill].astype(object))
+        if fill < len(chunk):
+            if sample is None:
+                sample = pd.concat(sample_parts, ignore_index=True)
+            positions = np.arange(seen + fill, seen + len(chunk))
+            slots = rng.integers(0, positions + 1)
+            # Only ~k/i of the rows are kept, so this loop stays short even for huge chunks
+            for offset in np.nonzero(slots < sample_size)[0]:
+                sample.iloc[slots[offset]] = chunk.iloc[fill + offset].astype(object)
+        seen += len(chunk)
+    if sample is None:
+        sample = pd.concat(sample_parts, ignore_index=True) if sample_parts else pd.DataFrame(columns=list(columns))
+    return CsvScan(path, chunksize, columns, sample, seen)
+
+
+def iter_typed_chunks(scan: CsvScan) -> Iterator[pd.DataFrame]:
+    """Second pass: yields chunks already parsed into the compact dtypes."""
+    yield from pd.read_csv(scan.path, chunksize=scan.chunksize, dtype=scan.dtypes)
+
+
+def arrow_schema(scan: CsvScan):
+    import pyarrow as pa
+
+    fields = []
+    for name, dtype in scan.dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype):
+            arrow_type = pa.dictionary(pa.int32(), pa.string())
+        elif dtype in ("bool", "boolean"):
+            arrow_type = pa.bool_()
+        elif dtype == "string":
+            arrow_type = pa.string()
+        else:
+            arrow_type = pa.from_numpy_dtype(np.dtype(dtype))
+        fields.append(pa.field(str(name), arrow_type))
+    return pa.schema(fields)
+
+
+def write_feather(scan: CsvScan, out_path: str):
+    """Streams the typed chunks into an uncompressed Feather (Arrow IPC) file."""
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+
+    schema = arrow_schema(scan)
+    with ipc.new_file(out_path, schema) as writer:
+        for chunk in iter_typed_chunks(scan):
+            chunk.columns = [str(c) for c in chunk.columns]
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+def read_csv_bounded(path: str, memory_budget: int = DEFAULT_MEMORY_BUDGET) -> Tuple[pd.DataFrame, dict]:
+    """Loads a large CSV chunk by chunk into compact dtypes; returns (df, profile)."""
+    scan = scan_csv(path, memory_budget)
+    df = pd.concat(iter_typed_chunks(scan), ignore_index=True)
+    return df, profile_from_scan(scan)
+
+
+def _format_number(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return np.nan
+    return value
+
+
+def profile_from_scan(scan: CsvScan) -> dict:
+    """A `describe(include="all")`-style profile built from the incremental statistics.
+
+    Quartiles, and `top` for high-cardinality columns, are estimated from the sample.
+    """
+    rows = {}
+    for name, stats in scan.columns.items():
+        unique = stats.unique if stats.unique is not None else f">{TRACK_MAX_UNIQUE}"
+        row = {"count": stats.count, "nulls": stats.nulls, "unique": unique}
+        if stats.value_counts:
+            top, freq = stats.value_counts.most_common(1)[0]
+            row.update(top=top, freq=freq)
+        elif name in scan.sample and not scan.sample[name].dropna().empty:
+            top = scan.sample[name].dropna().astype(str).value_counts()
+            row.update(top=top.index[0], freq=f"~{top.iloc[0]}/{len(scan.sample)} sampled")
+        if stats.kind in ("int", "float"):
+            quartiles = pd.to_numeric(scan.sample[name], errors="coerce").quantile([0.25, 0.5, 0.75])
+            row.update(mean=stats.mean, std=_format_number(stats.std), min=stats.min,
+                       **{"25%": quartiles[0.25], "50%": quartiles[0.5], "75%": quartiles[0.75]},
+                       max=stats.max)
+        rows[name] = row
+    order = ["count", "nulls", "unique", "top", "freq", "mean", "std", "min", "25%", "50%", "75%", "max"]
+    summary = pd.DataFrame(rows).reindex(order).dropna(how="all")
+    dtypes = scan.dtypes
+    return {
+        "rows": scan.rows,
+        "columns": [str(c) for c in scan.columns],
+        "dtypes": {str(name): str(dtype) if not isinstance(dtype, pd.CategoricalDtype) else "category"
+                   for name, dtype in dtypes.items()},
+        "preview": scan.sample.head(5).to_string(),
+        "summary": summary.to_string() + f"\n(quartiles estimated from a {len(scan.sample)}-row sample)",
+    }
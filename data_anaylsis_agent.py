@@ -2,9 +2,18 @@ import pandas as pd
 import os
 import matplotlib.pyplot as plt # Import matplotlib for plotting
 import seaborn as sns # Import seaborn for enhanced plotting
-from langchain_community.chat_models import ChatOllama
+from pooled_llm import PooledOllama
+from completion_cache import get_cache
+from csv_ingest import DEFAULT_MEMORY_BUDGET, STREAMING_THRESHOLD, read_csv_bounded
+from code_executor import get_executor, save_artifacts, share_dataframe
+from agent_sessions import SessionManager
+from execution_cache import cached_run, get_execution_cache
+from prefix_cache import get_context_store, prefix_session
+from react_stream import ReActStreamParser, StepMeter
+from schema_summary import get_schema_cache, schema_from_dataframe, summarize_schema
+from tracing import get_tracer
 from langchain.agents import AgentExecutor, initialize_agent, AgentType
-from langchain.tools import tool
+from langchain.tools import StructuredTool
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder # Keep MessagesPlaceholder for reference if needed, though not directly used by initialize_agent's default prompt
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
@@ -12,13 +21,13 @@ from langchain_core.output_parsers import StrOutputParser
 # --- Configuration ---
 CSV_FILE_PATH = "sample_data.csv"
 OLLAMA_MODEL = "tinyllama" # Ensure this model is pulled in Ollama (e.g., ollama pull tinyllama)
-
-# Define df globally so it can be accessed by the tool
-df = None
+CSV_MEMORY_BUDGET = int(os.environ.get("CSV_MEMORY_BUDGET", DEFAULT_MEMORY_BUDGET)) # Bytes per chunk for large CSVs
+SESSION_OUTPUT_DIR = "session_outputs" # Plots of each session go to their own subdirectory
+SESSION_MEMORY_CAP_MB = int(os.environ.get("SESSION_MEMORY_CAP_MB", 4096)) # Idle sessions are evicted above this
+SESSION_IDLE_TTL = int(os.environ.get("SESSION_IDLE_TTL", 15 * 60)) # Seconds
 
 def get_CSV_data():
     """Loads or creates a sample CSV file and returns its DataFrame."""
-    global df # Declare intent to modify the global df
     if not os.path.exists(CSV_FILE_PATH):
         print(f"Creating sample CSV file: {CSV_FILE_PATH}")
         sample_data = {
@@ -32,17 +41,25 @@ def get_CSV_data():
         print("Sample CSV created successfully.")
     else:
         try:
-            df = pd.read_csv(CSV_FILE_PATH)
+            if os.path.getsize(CSV_FILE_PATH) > STREAMING_THRESHOLD:
+                # Chunked read with downcast dtypes, so a multi-GB export fits in memory
+                df, _ = read_csv_bounded(CSV_FILE_PATH, CSV_MEMORY_BUDGET)
+            else:
+                df = pd.read_csv(CSV_FILE_PATH)
             print(f"Successfully loaded CSV into DataFrame. Columns: {df.columns.tolist()}")
         except Exception as e:
             print(f"Error loading CSV file '{CSV_FILE_PATH}': {e}")
             exit()
     return df
 
+STEP_METER = StepMeter() # Generated tokens and wall time per agent step
+
 def get_tinyllama_1b():
-    """Initializes and returns the ChatOllama LLM."""
+    """Initializes and returns the pooled Ollama LLM."""
     try:
-        llm = ChatOllama(model=OLLAMA_MODEL)
+        llm = PooledOllama(model=OLLAMA_MODEL, temperature=0, # Greedy, so repeated steps are cached
+                           reuse_context=True, # Later ReAct steps only prefill the new scratchpad lines
+                           callbacks=[STEP_METER])
         print(f"Successfully connected to Ollama with model: {OLLAMA_MODEL}")
     except Exception as e:
         print(f"Error connecting to Ollama or loading model '{OLLAMA_MODEL}': {e}")
@@ -51,55 +68,56 @@ def get_tinyllama_1b():
     return llm
 
 # --- 4. Define a Custom Tool for Pandas DataFrame Operations with Plotting ---
-@tool
-def python_repl_pandas(code: str) -> str:
-    """Executes pandas, matplotlib, and seaborn code on a global DataFrame named 'df' and returns the output.
+PYTHON_REPL_DESCRIPTION = """Executes pandas, matplotlib, and seaborn code on a DataFrame named 'df' and returns the output.
     The 'df' variable refers to the DataFrame loaded from the CSV file.
-    Always print the results of your code execution to stdout.
-    If you generate a plot, you MUST save it to a file named 'plot.png' using `plt.savefig('plot.png')`
-    and then clear the current figure using `plt.clf()` to prepare for subsequent plots.
-    For example: print(df.head()) or print(df['Age'].mean()) or plt.hist(df['Age']); plt.savefig('age_hist.png'); plt.clf()
+    Variables you define are kept for later calls, so reuse earlier results instead of recomputing them.
+    Always print the results of your code execution to stdout. Plots are saved automatically.
+    For example: print(df.head()) or print(df['Age'].mean()) or plt.hist(df['Age'])
     """
-    try:
-        global df # Access the global DataFrame
-        # Redirect stdout to capture print statements
-        import io
-        import sys
-        old_stdout = sys.stdout
-        redirected_output = io.StringIO()
-        sys.stdout = redirected_output
-
-        # Pass df, pd, plt, and sns into the execution context for the LLM to use
-        exec(code, {'df': df, 'pd': pd, 'plt': plt, 'sns': sns})
-
-        sys.stdout = old_stdout # Restore stdout
-        output = redirected_output.getvalue()
-        return output if output else "Execution successful, no direct output (check if you used print())."
-    except Exception as e:
-        return f"Error executing code: {e}"
 
-# --- Main execution block ---
-if __name__ == "__main__":
-    # List of tools available to the agent
-    tools = [python_repl_pandas]
-    
-    # Initialize global df and llm
-    df = get_CSV_data()
-    llm = get_tinyllama_1b()
+def make_python_repl_pandas(session_key, df_path, output_dir, plots):
+    """Builds the tool for one session: its own df, persistent namespace and output capture.
 
-    # Get the schema of the DataFrame to include in the agent's prefix
-    df_schema_markdown = df.head().to_markdown(index=False)
-    
-    # Define a prefix to guide the LLM more effectively and explicitly
-    # This prefix will be passed to initialize_agent via agent_kwargs
-    agent_prefix = f"""You are an AI assistant specialized in analyzing tabular data using Pandas, and visualizing it with Matplotlib and Seaborn.
+    The paths of the plots each call saves are appended to `plots`.
+    """
+    def python_repl_pandas(code: str) -> str:
+        # Runs in the session's worker process (df, pd, plt, sns preloaded) with time and memory limits;
+        # side-effect-free snippets seen before on this dataset are answered from the execution cache
+        result = cached_run(get_execution_cache(), get_executor(), code, dataset_path=df_path, session=session_key)
+        plots.extend(save_artifacts(result, output_dir).values()) # Plots only, under content-hash names
+        if result["error"]:
+            return f"Error executing code: {result['error']}"
+        output = result["stdout"]
+        return output if output else "Execution successful, no direct output (check if you used print())."
+    return StructuredTool.from_function(python_repl_pandas, name="python_repl_pandas",
+                                        description=PYTHON_REPL_DESCRIPTION)
+
+class AnalysisSession:
+    """One user's agent, bound to its own copy of the data and its own exec namespace."""
+
+    def __init__(self, session_key, llm, df, output_dir):
+        self.key = session_key
+        self.output_dir = output_dir
+        self.plots = [] # Saved by the current question
+        # Written once per distinct dataset; each worker memory-maps it instead of unpickling a copy
+        df_path = share_dataframe(df)
+        python_repl_pandas = make_python_repl_pandas(session_key, df_path, output_dir, self.plots)
+        # List of tools available to the agent
+        tools = [python_repl_pandas]
+
+        # A token-budgeted column catalog for the agent's prefix, built once per dataset (keyed by its
+        # content hash). The prefix is shared by every question of the session, so columns keep table order.
+        df_schema = summarize_schema(get_schema_cache().get(df_path, lambda: schema_from_dataframe(df)))
+
+        # Define a prefix to guide the LLM more effectively and explicitly
+        # This prefix will be passed to initialize_agent via agent_kwargs
+        agent_prefix = f"""You are an AI assistant specialized in analyzing tabular data using Pandas, and visualizing it with Matplotlib and Seaborn.
         You have access to a Pandas DataFrame named 'df', which contains the data from 'sample_data.csv'.
         You must use the 'python_repl_pandas' tool to execute Python code for any data analysis or visualization tasks.
-        Always print the results of your code execution to stdout.
-        If you generate a plot, you MUST save it to a file named 'plot.png' using `plt.savefig('plot.png')` and then clear the current figure using `plt.clf()`.
+        Always print the results of your code execution to stdout. Plots are saved automatically.
 
         Here is the schema of the DataFrame:
-        {df_schema_markdown}
+        {df_schema}
 
         You should always follow this exact format for your responses:
 
@@ -115,19 +133,53 @@ if __name__ == "__main__":
         Begin!
         """
 
-    # --- Create the Agent Executor using initialize_agent ---
-    try:
-        agent_executor = initialize_agent(
+        # Ends generation as soon as a complete step has streamed (the code input may span
+        # several lines) and repairs common format slips instead of re-asking the model
+        react_parser = ReActStreamParser(tools, multiline_tools=["python_repl_pandas"])
+
+        # --- Create the Agent Executor using initialize_agent ---
+        self.agent_executor = initialize_agent(
             tools,
-            llm,
+            llm.bind(early_stop=react_parser.find_end),
             agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
             verbose=True, # Set verbose=True to see the agent's detailed reasoning steps
             handle_parsing_errors=True, # Good for debugging if the LLM output doesn't match expected format
-            agent_kwargs={"prefix": agent_prefix}, # Correctly pass the custom prefix here
-            # Crucial for smaller models: Add stop sequences to prevent malformed output
-            stop=["\nObservation:", "\nThought:", "\nFinal Answer:"]
+            agent_kwargs={"prefix": agent_prefix, "output_parser": react_parser}, # Correctly pass the custom prefix here
         )
-        print("Agent Executor created successfully using initialize_agent with custom prefix and stop sequences.")
+
+    def close(self):
+        get_execution_cache().forget_session(self.key)
+
+    def ask(self, query, callbacks=None):
+        """The agent's response, plus `plots`: the paths of the plots saved while answering."""
+        del self.plots[:]
+        with prefix_session(self.key): # Each session continues from its own KV context
+            # Per-step spans and metrics when AGENT_TRACING=1 (no handler otherwise)
+            callbacks = [*(callbacks or []), *get_tracer().callbacks("data_analysis_agent")]
+            response = self.agent_executor.invoke({"input": query}, {"callbacks": callbacks})
+        return dict(response, plots=list(self.plots))
+
+def make_session_manager(llm, df, output_root=SESSION_OUTPUT_DIR):
+    """Sessions over `df`; each one gets its own namespace and `output_root/<key>` for plots.
+
+    Any number of threads may call `with manager.session(user_id) as session: session.ask(...)` at once.
+    """
+    return SessionManager(lambda key: AnalysisSession(key, llm, df, os.path.join(output_root, key)),
+                          memory_cap_mb=SESSION_MEMORY_CAP_MB, idle_ttl=SESSION_IDLE_TTL)
+
+# --- Main execution block ---
+if __name__ == "__main__":
+    df = get_CSV_data()
+    get_executor() # Start warming the execution workers while the agent is built
+    get_tracer().serve_metrics() # /metrics when METRICS_PORT is set
+    llm = get_tinyllama_1b()
+
+    try:
+        # The interactive user is one session; its plots go to SESSION_OUTPUT_DIR/cli
+        sessions = make_session_manager(llm, df)
+        with sessions.session("cli"): # Builds the session's agent now, so setup errors show up before the first query
+            pass
+        print("Agent session created successfully using initialize_agent with a custom prefix.")
     except Exception as e:
         print(f"Error initializing agent: {e}")
         exit()
@@ -140,16 +192,20 @@ if __name__ == "__main__":
     while True:
         user_query = input("\nYour query: ")
         if user_query.lower() == 'exit':
+            print(f"Completion cache: {get_cache().stats()}")
+            print(f"Execution cache: {get_execution_cache().stats()}")
+            print(f"KV context reuse: {get_context_store().stats()}")
+            print(f"Agent steps: {STEP_METER.summary()}")
             print("Exiting Data Analysis Assistant. Goodbye!")
             break
 
         try:
-            response = agent_executor.invoke({"input": user_query})
+            with sessions.session("cli") as session:
+                response = session.ask(user_query)
             print(f"\nAgent's Final Answer: {response['output']}")
-            # Inform the user if a plot was likely generated
-            if "plot.png" in response['output'] or any("plot.png" in str(step) for step in response.get('intermediate_steps', [])):
-                 print("\nNote: If a plot was generated, check your script's directory for 'plot.png'.")
+            # Inform the user about the plots the tool saved
+            for path in response["plots"]:
+                print(f"\nNote: Plot saved to '{path}'.")
         except Exception as e:
             print(f"An error occurred while processing your query: {e}")
             print("Please try rephrasing your question or check the console for more details.")
-
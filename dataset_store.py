@@ -0,0 +1,130 @@
+# dataset_store.py
+"""Content-addressed store for uploaded datasets.
+
+An uploaded CSV is hashed while it is saved, parsed once, and stored as an
+uncompressed Feather (Arrow IPC) file named after the hash, next to a JSON
+profile with the preview and summary text the prompts need. Follow-up questions
+reference the dataset by that ID and load it memory-mapped in milliseconds
+instead of re-uploading and re-parsing the CSV. The profile also holds the
+column schema `schema_summary` fits into a prompt's token budget. Uploads above
+`csv_ingest.STREAMING_THRESHOLD` are converted chunk by chunk within a memory
+budget, with compact dtypes and a sampled profile.
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+from typing import IO, Optional
+
+import pandas as pd
+import pyarrow.feather as feather
+
+from csv_ingest import DEFAULT_MEMORY_BUDGET, STREAMING_THRESHOLD, profile_from_scan, scan_csv, write_feather
+from schema_summary import get_schema_cache, schema_from_dataframe, schema_from_scan
+
+DATASET_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+def describe_dataframe(df: pd.DataFrame) -> dict:
+    """The profile text put into data-analysis prompts, computed once per dataset."""
+    return {
+        "rows": int(len(df)),
+        "columns": [str(c) for c in df.columns],
+        "dtypes": {str(c): str(t) for c, t in df.dtypes.items()},
+        "preview": df.head(5).to_string(),
+        "summary": df.describe(include="all").to_string(),
+        "schema": schema_from_dataframe(df),
+    }
+
+
+class DatasetStore:
+    """Uploads keyed by the SHA-256 of their bytes, stored as Feather + profile JSON."""
+
+    def __init__(self, root: str, memory_budget: int = DEFAULT_MEMORY_BUDGET,
+                 streaming_threshold: int = STREAMING_THRESHOLD):
+        self.root = root
+        self.memory_budget = memory_budget
+        self.streaming_threshold = streaming_threshold
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _path(self, dataset_id: str, suffix: str) -> str:
+        if not DATASET_ID_RE.match(dataset_id or ""):
+            raise KeyError(f"Invalid dataset id: {dataset_id!r}")
+        return os.path.join(self.root, dataset_id + suffix)
+
+    def exists(self, dataset_id: str) -> bool:
+        try:
+            return os.path.exists(self._path(dataset_id, ".profile.json"))
+        except KeyError:
+            return False
+
+    def put(self, stream: IO[bytes]) -> str:
+        """Stores an uploaded CSV and returns its dataset ID (identical uploads share one ID)."""
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".csv")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                for block in iter(lambda: stream.read(1 << 20), b""):
+                    digest.update(block)
+                    tmp.write(block)
+            dataset_id = digest.hexdigest()[:32]
+            if not self.exists(dataset_id):
+                if os.path.getsize(tmp_path) > self.streaming_threshold:
+                    self._save_streaming(dataset_id, tmp_path)
+                else:
+                    self._save(dataset_id, pd.read_csv(tmp_path))
+            return dataset_id
+        finally:
+            os.remove(tmp_path)
+
+    def _save(self, dataset_id: str, df: pd.DataFrame):
+        data_path = self._path(dataset_id, ".feather")
+        profile_path = self._path(dataset_id, ".profile.json")
+        with self._lock:
+            # Uncompressed, so the file can be memory-mapped on load
+            feather.write_feather(df, data_path + ".tmp", compression="uncompressed")
+            os.replace(data_path + ".tmp", data_path)
+            with open(profile_path + ".tmp", "w") as f:
+                json.dump(describe_dataframe(df), f)
+            # The profile is written last, so `exists()` only sees complete datasets
+            os.replace(profile_path + ".tmp", profile_path)
+
+    def _save_streaming(self, dataset_id: str, csv_path: str):
+        """Converts a large CSV chunk by chunk, so memory use follows the budget, not the file."""
+        data_path = self._path(dataset_id, ".feather")
+        profile_path = self._path(dataset_id, ".profile.json")
+        scan = scan_csv(csv_path, self.memory_budget)
+        with self._lock:
+            write_feather(scan, data_path + ".tmp")
+            os.replace(data_path + ".tmp", data_path)
+            with open(profile_path + ".tmp", "w") as f:
+                json.dump(dict(profile_from_scan(scan), schema=schema_from_scan(scan)), f)
+            os.replace(profile_path + ".tmp", profile_path)
+
+    def data_path(self, dataset_id: str) -> str:
+        """The Feather file of a dataset, e.g. for handing it to `code_executor` workers."""
+        return self._path(dataset_id, ".feather")
+
+    def load(self, dataset_id: str) -> pd.DataFrame:
+        """Loads a dataset memory-mapped; every call returns a fresh DataFrame."""
+        return feather.read_feather(self.data_path(dataset_id), memory_map=True)
+
+    def profile(self, dataset_id: str) -> dict:
+        with open(self._path(dataset_id, ".profile.json")) as f:
+            return json.load(f)
+
+    def schema(self, dataset_id: str) -> dict:
+        """The dataset's column schema, kept in memory after the first call."""
+        def build():
+            # Profiles stored before schemas existed get one built from the data
+            return self.profile(dataset_id).get("schema") or schema_from_dataframe(self.load(dataset_id))
+        return get_schema_cache().get(dataset_id, build)
+
+    def get(self, dataset_id: Optional[str]):
+        """(DataFrame, profile) for a known ID, or (None, None)."""
+        if not dataset_id or not self.exists(dataset_id):
+            return None, None
+        return self.load(dataset_id), self.profile(dataset_id)
@@ -0,0 +1,172 @@
+# embedding_pipeline.py
+"""Batched, concurrent embedding pipeline with a persistent embedding cache.
+
+`BatchedEmbeddings` is a LangChain `Embeddings` implementation for RAG ingestion.
+Texts are de-duplicated, looked up in an on-disk cache keyed by a hash of
+(model, text), and only the misses are sent to Ollama's batch `/api/embed`
+endpoint, in batches of `batch_size` with up to `max_concurrency` requests in
+flight. Throughput (chunks/sec) and queue depth are tracked for sizing.
+
+Retrieval queries are mostly one-off, so `embed_query` reads the on-disk cache
+but never writes to it; repeated queries are served from a bounded in-memory LRU
+instead, and the SQLite file only grows with ingested documents.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from ollama_client import OLLAMA_BASE_URL, OLLAMA_MODEL, get_client
+
+# --- Configuration ---
+DEFAULT_EMBEDDING_CACHE_PATH = os.environ.get(
+    "EMBEDDING_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "embeddings.sqlite"),
+)
+DEFAULT_BATCH_SIZE = 32
+DEFAULT_MAX_CONCURRENCY = 4
+DEFAULT_QUERY_CACHE_SIZE = 1024  # Query vectors kept in memory only
+
+
+def embedding_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """SQLite store of float32 vectors keyed by `embedding_key(model, text)`."""
+
+    def __init__(self, path: str = DEFAULT_EMBEDDING_CACHE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+        self._db.commit()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self._lock:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?)",
+                [(key, array("f", vector).tobytes()) for key, vector in items.items()],
+            )
+            self._db.commit()
+
+
+class BatchedEmbeddings(Embeddings):
+    """Embeds texts in concurrent batches, memoizing every vector by (model, text)."""
+
+    def __init__(self, model: str = OLLAMA_MODEL, base_url: str = OLLAMA_BASE_URL,
+                 batch_size: int = DEFAULT_BATCH_SIZE, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 cache: Optional[EmbeddingCache] = None, use_cache: bool = True,
+                 query_cache_size: int = DEFAULT_QUERY_CACHE_SIZE):
+        self.model = model
+        self.base_url = base_url
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.cache = (cache or EmbeddingCache()) if use_cache else None
+        self.query_cache_size = query_cache_size
+        self._query_cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        # The client pool must allow as many connections as batches in flight
+        self.client = get_client(base_url, model, pool_size=max(max_concurrency, 1))
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="embed")
+        self._lock = threading.Lock()
+        self._counters = {"texts": 0, "cache_hits": 0, "duplicates": 0, "embedded": 0,
+                          "batches": 0, "queue_depth": 0, "max_queue_depth": 0, "in_flight": 0}
+        self._busy_seconds = 0.0
+
+    # --- Metrics ---
+    def _count(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                self._counters[name] += delta
+            self._counters["max_queue_depth"] = max(self._counters["max_queue_depth"],
+                                                    self._counters["queue_depth"])
+
+    def stats(self) -> Dict[str, float]:
+        """Counters plus chunks/sec over the time spent embedding cache misses."""
+        with self._lock:
+            stats = dict(self._counters)
+            busy = self._busy_seconds
+        stats["chunks_per_sec"] = stats["embedded"] / busy if busy else 0.0
+        return stats
+
+    # --- Embedding ---
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        self._count(queue_depth=-1, in_flight=1)
+        try:
+            return self.client.embed(batch, model=self.model)
+        finally:
+            self._count(in_flight=-1, batches=1, embedded=len(batch))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        texts = list(texts)
+        keys = [embedding_key(self.model, text) for text in texts]
+        vectors: Dict[str, List[float]] = self.cache.get_many(list(set(keys))) if self.cache else {}
+
+        # Each distinct missing text is embedded once, however often it repeats
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+        self._count(texts=len(texts), cache_hits=sum(1 for key in keys if key in vectors),
+                    duplicates=len(texts) - len(set(keys)))
+
+        if missing:
+            started = time.perf_counter()
+            missing_keys = list(missing)
+            batches = [missing_keys[i:i + self.batch_size] for i in range(0, len(missing_keys), self.batch_size)]
+            self._count(queue_depth=len(batches))
+            futures = [self._executor.submit(self._embed_batch, [missing[k] for k in batch]) for batch in batches]
+            computed = {}
+            for batch, future in zip(batches, futures):
+                computed.update(zip(batch, future.result()))
+            if self.cache:
+                self.cache.put_many(computed)
+            vectors.update(computed)
+            with self._lock:
+                self._busy_seconds += time.perf_counter() - started
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Like `embed_documents([text])[0]`, but memoized in the in-memory LRU, not on disk."""
+        key = embedding_key(self.model, text)
+        with self._lock:
+            vector = self._query_cache.get(key)
+            if vector is not None:
+                self._query_cache.move_to_end(key)
+        if vector is None and self.cache:
+            vector = self.cache.get_many([key]).get(key)  # e.g. a query that is also an indexed chunk
+        if vector is not None:
+            self._count(texts=1, cache_hits=1)
+        else:
+            self._count(texts=1, queue_depth=1)
+            started = time.perf_counter()
+            vector = self._embed_batch([text])[0]
+            with self._lock:
+                self._busy_seconds += time.perf_counter() - started
+        with self._lock:
+            self._query_cache[key] = vector
+            self._query_cache.move_to_end(key)
+            while len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+        return vector
@@ -0,0 +1,285 @@
+# execution_cache.py
+"""Memoized results of code execution in worker processes.
+
+TinyLlama keeps emitting the same snippets (`print(df.head())`,
+`df['Age'].mean()`, group-bys), within one ReAct loop and across users. Each
+run goes through the whole DataFrame again. This cache sits in front of
+`code_executor.ExecutionService.run`. It is keyed by the dataset's content hash
+plus an AST-normalized form of the code, so formatting and comments do not
+matter. Stored values are the captured stdout/stderr and produced plot files,
+kept in a byte-capped in-memory LRU.
+
+Only code that is safe to replay is memoized (see `check_memoizable`). Excluded:
+code that uses randomness, clocks or other outside state; code that writes
+files other than plots; and, in a persistent session namespace, code that binds
+names or mutates `df`, because later calls would depend on that. Once such a
+snippet has run in a session, its namespace may differ from a fresh one (e.g.
+`df = df[df.Age > 30]`), so that session bypasses the cache from then on.
+"""
+import ast
+import builtins
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from tracing import get_tracer
+
+# --- Configuration ---
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+PRELOADED_NAMES = {"df", "pd", "np", "plt", "sns"}  # What `code_executor` puts into every namespace
+PLOT_EXTENSIONS = (".png", ".jpg", ".jpeg", ".svg", ".pdf")
+NONDETERMINISTIC_MODULES = {
+    "random", "secrets", "uuid", "time", "datetime", "os", "sys", "subprocess", "socket", "shutil",
+    "pathlib", "glob", "tempfile", "requests", "urllib", "http", "threading", "multiprocessing", "sqlite3",
+}
+FORBIDDEN_CALLS = {"open", "input", "exec", "eval", "compile", "__import__", "globals", "locals", "vars",
+                   "breakpoint", "hash", "id", "setattr", "delattr"}
+NONDETERMINISTIC_ATTRS = {"random", "now", "today", "utcnow", "time", "perf_counter", "getenv", "environ"}
+WRITE_METHODS = {"to_csv", "to_excel", "to_parquet", "to_pickle", "to_feather", "to_hdf", "to_sql",
+                 "to_stata", "to_json", "to_html", "to_latex", "to_xml", "to_clipboard", "to_markdown",
+                 "to_string", "write", "write_text", "write_bytes", "dump", "save", "mkdir", "remove"}
+MUTATING_METHODS = {"insert", "pop", "update", "append", "extend", "clear", "setdefault", "sort",
+                    "reverse", "remove", "discard", "add", "rename_axis", "set_flags"}
+_DATASET_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+def normalize_code(code: str) -> str:
+    """Canonical source: parsed and unparsed, so whitespace and comments do not change the key."""
+    return ast.unparse(ast.parse(code))
+
+
+def _root_name(node: ast.AST) -> Optional[str]:
+    """`df` for `df.loc[0, 'a']`, `df['a'].b`, ...; None when the chain does not start at a name."""
+    while isinstance(node, (ast.Attribute, ast.Subscript, ast.Call)):
+        node = node.func if isinstance(node, ast.Call) else node.value
+    return node.id if isinstance(node, ast.Name) else None
+
+
+def _bound_names(tree: ast.AST) -> set:
+    """Every name the snippet binds, in any scope (an over-approximation is fine here)."""
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            names.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, ast.arg):
+            names.add(node.arg)
+        elif isinstance(node, ast.alias):
+            names.add((node.asname or node.name).split(".")[0])
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            names.add(node.name)
+    return names
+
+
+def _top_level_bindings(tree: ast.Module) -> set:
+    """Names a snippet leaves behind in the namespace it runs in."""
+    names = set()
+    stack = list(tree.body)
+    while stack:
+        node = stack.pop()
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+            continue  # Its body is a scope of its own
+        if isinstance(node, (ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp, ast.Lambda)):
+            continue
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            names.add(node.id)
+        elif isinstance(node, ast.alias):
+            names.add((node.asname or node.name).split(".")[0])
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            names.add(node.name)
+        stack.extend(ast.iter_child_nodes(node))
+    return names
+
+
+def check_memoizable(code: str, persistent: bool = False) -> Tuple[bool, str]:
+    """(True, "") when replaying the cached output of `code` is indistinguishable from running it.
+
+    With `persistent`, the code runs in a session namespace that outlives it, so it
+    also must not leave names behind or modify `df`, and must not read names that
+    earlier calls defined.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return False, "syntax error"
+    bound = _bound_names(tree)
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            modules = [alias.name for alias in node.names] if isinstance(node, ast.Import) else [node.module or ""]
+            for module in modules:
+                if module.split(".")[0] in NONDETERMINISTIC_MODULES:
+                    return False, f"imports {module}"
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            return False, "global statement"
+        elif isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load):
+            if node.id in FORBIDDEN_CALLS and node.id not in bound:
+                return False, f"uses {node.id}()"
+            if node.id not in bound and node.id not in PRELOADED_NAMES and not hasattr(builtins, node.id):
+                return False, f"reads {node.id} from an earlier call"
+        elif isinstance(node, ast.Attribute):
+            if node.attr in NONDETERMINISTIC_ATTRS:
+                return False, f"uses .{node.attr}"
+            if node.attr.startswith("read_"):
+                return False, "reads a file"
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+            method = node.func.attr
+            keywords = {k.arg for k in node.keywords}
+            if method in WRITE_METHODS and (node.args or keywords & {"path", "path_or_buf", "buf", "excel_writer", "file"}):
+                return False, f"writes a file with .{method}()"
+            if method == "sample" and "random_state" not in keywords:
+                return False, "samples without random_state"
+            if persistent and _root_name(node.func) in PRELOADED_NAMES:
+                if method in MUTATING_METHODS or any(
+                        k.arg == "inplace" and not (isinstance(k.value, ast.Constant) and not k.value.value)
+                        for k in node.keywords):
+                    return False, f"modifies {_root_name(node.func)} in place"
+    if persistent:
+        leftovers = _top_level_bindings(tree) - {"pd", "np", "plt", "sns"}
+        if leftovers:
+            return False, f"defines {', '.join(sorted(leftovers))}"
+        for node in ast.walk(tree):
+            targets = []
+            if isinstance(node, (ast.Assign, ast.Delete)):
+                targets = node.targets
+            elif isinstance(node, (ast.AugAssign, ast.AnnAssign)):
+                targets = [node.target]
+            for target in targets:
+                if isinstance(target, (ast.Attribute, ast.Subscript)) and _root_name(target) in PRELOADED_NAMES:
+                    return False, f"modifies {_root_name(target)}"
+    return True, ""
+
+
+def dataset_key(dataset_path: Optional[str]) -> str:
+    """Content identity of a dataset file.
+
+    `DatasetStore` and `share_dataframe` already name files after their content
+    hash; any other file falls back to path, size and modification time.
+    """
+    if not dataset_path:
+        return ""
+    stem = os.path.splitext(os.path.basename(dataset_path))[0]
+    if _DATASET_ID_RE.match(stem):
+        return stem
+    stat = os.stat(dataset_path)
+    return f"{os.path.abspath(dataset_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+class ExecutionCache:
+    """Byte-capped LRU of execution results keyed by (dataset hash, normalized code)."""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[dict, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "bypassed": 0, "writes": 0, "evictions": 0}
+        self._dirty_sessions = set()  # Sessions that ran non-memoizable code; their state is their own
+
+    @staticmethod
+    def make_key(code: str, dataset_path: Optional[str] = None) -> str:
+        material = dataset_key(dataset_path) + "\0" + normalize_code(code)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return dict(entry[0], artifacts=dict(entry[0]["artifacts"]))
+
+    def put(self, key: str, result: dict) -> bool:
+        """Stores a successful result whose only files are plots; returns whether it was stored."""
+        if result["error"] or any(not name.lower().endswith(PLOT_EXTENSIONS) for name in result["artifacts"]):
+            return False
+        value = {"stdout": result["stdout"], "stderr": result["stderr"], "error": None,
+                 "artifacts": dict(result["artifacts"]), "timed_out": False}
+        size = len(value["stdout"]) + len(value["stderr"]) + sum(map(len, value["artifacts"].values()))
+        if size > self.max_bytes:
+            return False
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            self._counters["writes"] += 1
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self._counters["evictions"] += 1
+        return True
+
+    def bypass(self):
+        with self._lock:
+            self._counters["bypassed"] += 1
+
+    def mark_dirty(self, session: str):
+        with self._lock:
+            self._dirty_sessions.add(session)
+
+    def is_dirty(self, session: str) -> bool:
+        with self._lock:
+            return session in self._dirty_sessions
+
+    def forget_session(self, session: str):
+        """Drops a closed session's dirty mark."""
+        with self._lock:
+            self._dirty_sessions.discard(session)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._counters, entries=len(self._entries), bytes=self._bytes)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+def cached_run(cache: Optional[ExecutionCache], executor, code: str, dataset_path: Optional[str] = None,
+               session: Optional[str] = None, **kwargs) -> dict:
+    """`executor.run(...)` through the cache; a hit has `cached=True` and `duration` 0.
+
+    A session that ran a non-memoizable snippet is marked dirty and never uses
+    the cache again: its namespace may no longer match the dataset.
+    """
+    if cache is None:
+        return executor.run(code, dataset_path=dataset_path, session=session, **kwargs)
+    persistent = session is not None
+    if (persistent and cache.is_dirty(session)) or not check_memoizable(code, persistent=persistent)[0]:
+        cache.bypass()
+        if persistent:
+            cache.mark_dirty(session)  # Before running: even a failed snippet may have changed state
+        return executor.run(code, dataset_path=dataset_path, session=session, **kwargs)
+    key = cache.make_key(code, dataset_path)
+    hit = cache.get(key)
+    if hit is not None:
+        get_tracer().observe_exec_cache_hit()
+        return dict(hit, duration=0.0, cached=True)
+    result = executor.run(code, dataset_path=dataset_path, session=session, **kwargs)
+    cache.put(key, result)
+    return result
+
+
+# --- Shared cache ---
+_shared_cache: Optional[ExecutionCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_execution_cache() -> ExecutionCache:
+    """Returns the process-wide execution cache."""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = ExecutionCache()
+        return _shared_cache
@@ -0,0 +1,215 @@
+# ingest.py
+"""Parallel, streaming document ingestion for the RAG agent.
+
+Walks a directory of text, Markdown, HTML and PDF-extracted text files and feeds
+them into the persistent RAG index in three stages:
+
+    walk (generator) -> load + split (process pool) -> embed + index (thread)
+
+Only a bounded number of files is ever in flight between stages, so memory stays
+flat however large the corpus is. Each worker hashes its file first and skips it
+when the hash matches the one the index recorded for that source. File hashes
+live in the index manifest and are written with every index update, so a
+crashed run resumes where it stopped. They are dropped together with the chunks,
+so a `sync`, `remove` or index reset never leaves a file marked as ingested.
+The manifest also records the directory each file was found under, so pruning
+only removes files of the directory being ingested, and several directories can
+share one index. Sources are paths relative to that directory, so the
+directories must not hold files at the same relative path.
+
+    python ingest.py ./corpus --workers 8
+"""
+import argparse
+import hashlib
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+# --- Configuration ---
+TEXT_EXTENSIONS = (".txt", ".text", ".md", ".markdown", ".rst", ".html", ".htm")
+DEFAULT_BATCH_FILES = 64  # Files per index update (and manifest write)
+DEFAULT_QUEUE_SIZE = 8  # Split results waiting for the embedding stage
+
+
+class _HTMLText(HTMLParser):
+    """Collects the visible text of an HTML document."""
+
+    SKIP = {"script", "style", "head", "noscript"}
+
+    def __init__(self):
+        super().__init__()
+        self.parts: List[str] = []
+        self._skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skipping += 1
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP and self._skipping:
+            self._skipping -= 1
+
+    def handle_data(self, data):
+        if not self._skipping and data.strip():
+            self.parts.append(data.strip())
+
+
+def html_to_text(html: str) -> str:
+    parser = _HTMLText()
+    parser.feed(html)
+    return "\n".join(parser.parts)
+
+
+def iter_files(root: str, extensions=TEXT_EXTENSIONS) -> Iterator[str]:
+    """Yields matching file paths under `root` in a stable order, without listing everything first."""
+    for directory, subdirs, files in os.walk(root):
+        subdirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(extensions):
+                yield os.path.join(directory, name)
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_and_split(path: str, source: str, known_hash: Optional[str], chunk_size: int,
+                   chunk_overlap: int) -> Tuple[str, str, Optional[List[str]]]:
+    """Worker: returns (source, file hash, chunk texts), or no chunks if the file is unchanged."""
+    file_hash = file_sha256(path)
+    if file_hash == known_hash:
+        return source, file_hash, None
+    with open(path, encoding="utf-8", errors="replace") as f:
+        text = f.read()
+    if path.lower().endswith((".html", ".htm")):
+        text = html_to_text(text)
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    return source, file_hash, splitter.split_text(text)
+
+
+def ingest_directory(root: str, index, workers: int = os.cpu_count() or 2,
+                     chunk_size: int = 500, chunk_overlap: int = 0,
+                     batch_files: int = DEFAULT_BATCH_FILES, queue_size: int = DEFAULT_QUEUE_SIZE,
+                     prune: bool = True) -> Dict[str, float]:
+    """Ingests every text file under `root` into `index` (a `rag_index.PersistentVectorIndex`).
+
+    With `prune`, files that were ingested from `root` before but no longer exist are removed.
+    """
+    root_key = os.path.abspath(root)
+    # Snapshot: the embed stage updates the manifest concurrently
+    known_hashes = {source: file_hash for source, file_hash in index.files.items()
+                    if index.roots.get(source) == root_key}
+    stats = {"files_seen": 0, "files_skipped": 0, "files_indexed": 0, "chunks": 0,
+             "added": 0, "removed": 0}
+    results: "queue.Queue" = queue.Queue(maxsize=queue_size)
+    errors: List[BaseException] = []
+    started = time.perf_counter()
+
+    def embed_stage():
+        """Consumes split files and embeds/indexes them in batches, with their file hashes."""
+        batch: Dict[str, List[Document]] = {}
+        hashes: Dict[str, str] = {}
+
+        def flush():
+            if not batch:
+                return
+            update = index.update_chunks(batch, file_hashes=hashes, root=root_key)
+            stats["added"] += update["added"]
+            stats["removed"] += update["removed"]
+            batch.clear()
+            hashes.clear()
+
+        try:
+            while True:
+                item = results.get()
+                if item is None:
+                    break
+                source, file_hash, texts = item
+                batch[source] = [Document(page_content=t, metadata={"source": source}) for t in texts]
+                hashes[source] = file_hash
+                stats["chunks"] += len(texts)
+                if len(batch) >= batch_files:
+                    flush()
+            flush()
+        except BaseException as e:
+            errors.append(e)
+            # Keep draining so the producer never blocks on a full queue
+            while results.get() is not None:
+                pass
+
+    consumer = threading.Thread(target=embed_stage, name="ingest-embed")
+    consumer.start()
+    seen = set()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            in_flight = deque()
+
+            def drain_one():
+                source, file_hash, texts = in_flight.popleft().result()
+                if texts is None:
+                    stats["files_skipped"] += 1
+                else:
+                    stats["files_indexed"] += 1
+                    results.put((source, file_hash, texts))  # Blocks while the embedder is behind
+
+            for path in iter_files(root):
+                source = os.path.relpath(path, root)
+                seen.add(source)
+                stats["files_seen"] += 1
+                in_flight.append(pool.submit(load_and_split, path, source, known_hashes.get(source),
+                                             chunk_size, chunk_overlap))
+                if len(in_flight) >= 2 * workers:
+                    drain_one()
+                if errors:
+                    break
+            while in_flight and not errors:
+                drain_one()
+    finally:
+        results.put(None)
+        consumer.join()
+    if errors:
+        raise errors[0]
+
+    if prune:
+        gone = [source for source, source_root in index.roots.items()
+                if source_root == root_key and source not in seen]
+        if gone:
+            stats["removed"] += index.remove(gone)["removed"]
+    elapsed = time.perf_counter() - started
+    stats["seconds"] = elapsed
+    stats["files_per_sec"] = stats["files_seen"] / elapsed if elapsed else 0.0
+    return stats
+
+
+if __name__ == "__main__":
+    import rag_agent
+
+    parser = argparse.ArgumentParser(description="Ingest a directory of documents into the RAG index.")
+    parser.add_argument("directory")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Splitter processes")
+    parser.add_argument("--batch-files", type=int, default=DEFAULT_BATCH_FILES)
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE)
+    parser.add_argument("--no-prune", action="store_true", help="Keep chunks of files that were deleted")
+    args = parser.parse_args()
+
+    _, embeddings = rag_agent.get_tinyllama_1b()
+    index = rag_agent.get_index(embeddings)
+    stats = ingest_directory(args.directory, index, workers=args.workers,
+                             chunk_size=rag_agent.CHUNK_SIZE, chunk_overlap=rag_agent.CHUNK_OVERLAP,
+                             batch_files=args.batch_files, queue_size=args.queue_size,
+                             prune=not args.no_prune)
+    print(f"Ingested {stats['files_indexed']} files ({stats['files_skipped']} unchanged), "
+          f"{stats['chunks']} chunks: {stats['added']} added, {stats['removed']} removed "
+          f"in {stats['seconds']:.1f}s ({stats['files_per_sec']:.1f} files/sec).")
@@ -0,0 +1,189 @@
+# intent_router.py
+"""Deterministic fast path in front of `AgentExecutor` for tool-only queries.
+
+"What is the weather like in London?" costs the ReAct loop two TinyLlama
+generations (Thought/Action, then Final Answer) to call a lookup that takes
+microseconds. `IntentRouter` looks at the query before any LLM call. Each `Route`
+belongs to one tool and matches in one of two ways:
+- regex `patterns`, matched against the whole query: a match is certain
+  (confidence 1.0), and its `input` group is the tool input;
+- `examples` utterances for a small TF-IDF nearest-neighbour classifier: the
+  confidence is the cosine similarity to the closest example, and `extract`
+  pulls the tool input out of the query. TF-IDF matches phrasing, not meaning
+  ("Is it safe in Rome?" is close to "Is it sunny in Rome?"), so a classifier
+  match also needs one of the route's `keywords` in the query, and compound
+  queries ("Is it sunny in Rome? Who was Caesar?") never take this path.
+
+`negatives` are example utterances that belong to the LLM. A query closest to
+one of them always falls through. This includes a pattern match, when the
+negative is at least as similar as the routing threshold.
+
+`RoutedAgent` wraps an agent executor. Confident matches (at or above the
+threshold, with an input) call the tool directly and fill the route's `template`.
+Everything else, and any tool error, goes to the ReAct loop unchanged.
+`stats()` counts routed and fallthrough requests.
+"""
+import math
+import re
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Pattern, Sequence, Tuple, Union
+
+import numpy as np
+from langchain_core.agents import AgentAction
+
+from vector_store import normalize_rows, tokenize
+
+# --- Configuration ---
+DEFAULT_THRESHOLD = 0.7  # Cosine similarity to the closest example
+# A second sentence or clause after the first: the tool would answer only part of the query
+_COMPOUND_RE = re.compile(r"[?!;]\s*\S|\.\s+\S|,?\s+(?:and|but|also|then)\s+"
+                          r"(?:what|who|whom|whose|how|why|when|where|which|is|are|was|were|do|does|did|can|"
+                          r"could|should|would|will|tell|explain|write|give|show)\b", re.I)
+_NEGATIVE = "__llm__"  # Label of the `negatives` examples
+
+
+def _terms(text: str) -> List[str]:
+    """Unigrams plus bigrams, so "weather in" and "weather like" carry more than "weather"."""
+    words = tokenize(text)
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class TfidfClassifier:
+    """Nearest-example classifier over sublinear TF-IDF vectors of short utterances."""
+
+    def __init__(self, examples: Sequence[Tuple[str, str]]):
+        self.labels = [label for label, _ in examples]
+        documents = [Counter(_terms(text)) for _, text in examples]
+        df = Counter(term for counts in documents for term in counts)
+        self.vocabulary = {term: i for i, term in enumerate(sorted(df))}
+        self.idf = np.array([math.log((1 + len(documents)) / (1 + df[t])) + 1 for t in sorted(df)],
+                            dtype=np.float32)
+        self.matrix = normalize_rows(np.stack([self._vector(counts) for counts in documents])) if documents \
+            else np.zeros((0, 0), dtype=np.float32)
+
+    def _vector(self, counts: Counter) -> np.ndarray:
+        vector = np.zeros(len(self.vocabulary), dtype=np.float32)
+        for term, tf in counts.items():
+            index = self.vocabulary.get(term)
+            if index is not None:
+                vector[index] = (1 + math.log(tf)) * self.idf[index]
+        return vector
+
+    def classify(self, text: str) -> Tuple[Optional[str], float]:
+        """(label of the closest example, cosine similarity); (None, 0.0) for unknown words only."""
+        if not self.labels:
+            return None, 0.0
+        query = self._vector(Counter(_terms(text)))
+        if not query.any():
+            return None, 0.0
+        scores = self.matrix @ (query / np.linalg.norm(query))
+        best = int(np.argmax(scores))
+        return self.labels[best], float(scores[best])
+
+
+class Route:
+    """How one tool is reached without the LLM, and how its result is phrased."""
+
+    def __init__(self, tool: str, patterns: Iterable[Union[str, Pattern]] = (), examples: Iterable[str] = (),
+                 extract: Optional[Callable[[str], Optional[str]]] = None, template: str = "{observation}",
+                 threshold: Optional[float] = None, keywords: Iterable[str] = ()):
+        self.tool = tool
+        self.patterns = [re.compile(p, re.I) if isinstance(p, str) else p for p in patterns]
+        self.examples = list(examples)
+        self.keywords = {word.lower() for word in keywords}  # Empty: no classifier routing at all
+        self.extract = extract
+        self.template = template
+        self.threshold = threshold
+
+    def match_pattern(self, query: str) -> Optional[str]:
+        """The `input` group of the first pattern matching the whole (stripped) query."""
+        for pattern in self.patterns:
+            match = pattern.fullmatch(query.strip())
+            if match:
+                value = match.groupdict().get("input", match.group(0))
+                return value.strip(" \t?.!,;:'\"") if value else None
+        return None
+
+    def mentions_keyword(self, query: str) -> bool:
+        return not self.keywords.isdisjoint(tokenize(query))
+
+    def tool_input(self, query: str) -> Optional[str]:
+        """Input for a classifier match: `extract(query)`, or the first pattern's group."""
+        return self.extract(query) if self.extract else self.match_pattern(query)
+
+
+class IntentRouter:
+    """Picks a route for a query, or None when the LLM should handle it."""
+
+    def __init__(self, routes: Sequence[Route], threshold: float = DEFAULT_THRESHOLD,
+                 negatives: Iterable[str] = ()):
+        self.routes = {route.tool: route for route in routes}
+        self.threshold = threshold
+        examples = [(route.tool, text) for route in routes for text in route.examples]
+        examples += [(_NEGATIVE, text) for text in negatives]
+        self.classifier = TfidfClassifier(examples)
+        self._lock = threading.Lock()
+        self._counters = {"requests": 0, "routed": 0, "fallthrough": 0, "tool_errors": 0}
+        self._per_route: Counter = Counter()
+
+    def route(self, query: str) -> Optional[Tuple[Route, str, float]]:
+        """(route, tool input, confidence) for a confident match, else None."""
+        label, confidence = self.classifier.classify(query)
+        if label == _NEGATIVE and confidence >= self.threshold:
+            return None  # Closer to something the LLM should answer, even if a pattern matches
+        for route in self.routes.values():
+            tool_input = route.match_pattern(query)
+            if tool_input:
+                return route, tool_input, 1.0
+        route = self.routes.get(label)
+        if route is None or not route.mentions_keyword(query) or _COMPOUND_RE.search(query.strip()):
+            return None
+        threshold = route.threshold if route.threshold is not None else self.threshold
+        if confidence < threshold:
+            return None
+        tool_input = route.tool_input(query)
+        return (route, tool_input, confidence) if tool_input else None
+
+    def record(self, outcome: str, tool: Optional[str] = None):
+        with self._lock:
+            self._counters["requests"] += outcome != "tool_errors"
+            self._counters[outcome] += 1
+            if outcome == "routed":
+                self._per_route[tool] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._counters, per_route=dict(self._per_route))
+        stats["routed_rate"] = stats["routed"] / stats["requests"] if stats["requests"] else 0.0
+        return stats
+
+
+class RoutedAgent:
+    """`agent_executor.invoke` with the router in front; results carry `routed`."""
+
+    def __init__(self, router: IntentRouter, agent_executor, input_key: str = "input"):
+        self.router = router
+        self.agent_executor = agent_executor
+        self.input_key = input_key
+        self.tools = {tool.name: tool for tool in agent_executor.tools}
+
+    def invoke(self, inputs: Dict[str, Any], config: Optional[dict] = None, **kwargs: Any) -> Dict[str, Any]:
+        query = str(inputs[self.input_key])
+        match = self.router.route(query)
+        if match is not None and match[0].tool in self.tools:
+            route, tool_input, confidence = match
+            try:
+                observation = self.tools[route.tool].invoke(tool_input, config)
+            except Exception:
+                self.router.record("tool_errors")  # Let the agent deal with it as usual
+            else:
+                self.router.record("routed", route.tool)
+                result = dict(inputs, output=route.template.format(input=tool_input, observation=observation),
+                              routed=True, confidence=confidence)
+                if getattr(self.agent_executor, "return_intermediate_steps", False):
+                    action = AgentAction(route.tool, tool_input, f"Routed to {route.tool} ({confidence:.2f})")
+                    result["intermediate_steps"] = [(action, observation)]
+                return result
+        self.router.record("fallthrough")
+        return dict(self.agent_executor.invoke(inputs, config, **kwargs), routed=False)
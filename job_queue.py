@@ -0,0 +1,275 @@
+# job_queue.py
+"""Bounded generation queue with backpressure, coalescing and pollable job status.
+
+Both Flask apps used to call the model inside the request handler, so every
+concurrent user held a server thread and an Ollama slot, and anyone beyond
+that waited with no feedback. Generations now go through a `JobQueue`:
+- at most `concurrency` jobs run at once, matched to `OLLAMA_NUM_PARALLEL`;
+- at most `max_queued` wait behind them. `submit` raises `QueueFull` beyond
+  that, and the apps answer 429 with the queue depth and a `Retry-After`
+  estimate;
+- a prompt identical to one still queued or running (same key: model, full
+  prompt, dataset) joins that job instead of starting another generation.
+
+A job's work is an iterator of `(event, data)` pairs, the same events
+`sse_stream.stream_events` produces. The queue records them, so clients can
+follow a job as Server-Sent Events (`/stream`), or submit it (`POST /jobs`)
+and poll `GET /jobs/<id>` without holding a connection open. Finished jobs are
+kept for `ttl` seconds.
+"""
+import hashlib
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# --- Configuration ---
+DEFAULT_CONCURRENCY = int(os.environ.get("OLLAMA_NUM_PARALLEL", "4"))  # Generations the backend serves at once
+DEFAULT_MAX_QUEUED = int(os.environ.get("MAX_QUEUED_JOBS", "32"))
+DEFAULT_TTL = 600.0  # Seconds a finished job stays pollable
+MAX_KEPT_JOBS = 1024  # Finished jobs kept at most, whatever their age
+MAX_POLL_WAIT = 30.0  # Longest `wait` a poll may ask for
+
+Event = Tuple[str, Any]
+Work = Callable[[], Iterable[Event]]
+
+
+class QueueFull(Exception):
+    """Raised by `JobQueue.submit` when `max_queued` jobs are already waiting."""
+
+    def __init__(self, queued: int, max_queued: int, retry_after: int):
+        super().__init__(f"Too many queued jobs ({queued}); retry in about {retry_after}s")
+        self.queued = queued
+        self.max_queued = max_queued
+        self.retry_after = retry_after
+
+
+def job_key(*parts: Any) -> str:
+    """Coalescing key: jobs with equal parts (model, full prompt, dataset, ...) share one generation."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class Job:
+    """One generation: its recorded events, accumulated text and final result."""
+
+    def __init__(self, job_id: str, key: str, work: Work):
+        self.id = job_id
+        self.key = key
+        self.work = work
+        self.status = "queued"  # queued -> running -> done | error
+        self.events: List[Event] = []
+        self.text = ""
+        self.result: Dict[str, Any] = {}  # Payloads of the non-token events, by event name
+        self.error: Optional[str] = None
+        self.subscribers = 1  # Requests that submitted (or joined) this job
+        self.created = time.monotonic()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.changed = threading.Condition()
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("done", "error")
+
+
+class JobQueue:
+    """Runs submitted jobs on `concurrency` threads, in order, behind a bounded queue."""
+
+    def __init__(self, concurrency: int = DEFAULT_CONCURRENCY, max_queued: int = DEFAULT_MAX_QUEUED,
+                 ttl: float = DEFAULT_TTL, name: str = "jobs"):
+        self.concurrency = concurrency
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._queue: "deque[Job]" = deque()
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._active: Dict[str, Job] = {}  # Key -> queued or running job, for coalescing
+        self._job_seconds = 0.0  # Moving average, for Retry-After
+        self._counters = {"submitted": 0, "coalesced": 0, "rejected": 0, "completed": 0, "failed": 0,
+                          "running": 0, "max_queued": 0}
+        for i in range(concurrency):
+            threading.Thread(target=self._worker, name=f"{name}-{i}", daemon=True).start()
+
+    # --- Submitting ---
+    def submit(self, key: str, work: Work) -> Tuple[Job, bool]:
+        """Queues `work` under `key`; returns (job, whether it joined an identical job)."""
+        with self._lock:
+            self._prune()
+            job = self._active.get(key)
+            if job is not None:
+                job.subscribers += 1
+                self._counters["coalesced"] += 1
+                return job, True
+            if len(self._queue) >= self.max_queued:
+                self._counters["rejected"] += 1
+                raise QueueFull(len(self._queue), self.max_queued, self._retry_after())
+            job = Job(secrets.token_urlsafe(12), key, work)
+            self._jobs[job.id] = job
+            self._active[key] = job
+            self._queue.append(job)
+            self._counters["submitted"] += 1
+            self._counters["max_queued"] = max(self._counters["max_queued"], len(self._queue))
+            self._ready.notify()
+            return job, False
+
+    def _retry_after(self) -> int:
+        """Seconds until a queue slot is likely free (caller holds the lock)."""
+        per_job = self._job_seconds or 5.0
+        return max(1, round(per_job * (len(self._queue) + 1) / self.concurrency))
+
+    def _prune(self):
+        """Forgets finished jobs past their TTL, or beyond MAX_KEPT_JOBS (caller holds the lock)."""
+        now = time.monotonic()
+        finished = [job for job in self._jobs.values() if job.done]
+        excess = len(finished) - MAX_KEPT_JOBS
+        for i, job in enumerate(finished):
+            if i < excess or now - job.finished > self.ttl:
+                del self._jobs[job.id]
+
+    # --- Running ---
+    def _worker(self):
+        while True:
+            with self._lock:
+                while not self._queue:
+                    self._ready.wait()
+                job = self._queue.popleft()
+                self._counters["running"] += 1
+            self._run(job)
+
+    def _run(self, job: Job):
+        with job.changed:
+            job.status = "running"
+            job.started = time.monotonic()
+            job.changed.notify_all()
+        try:
+            for event, data in job.work():
+                with job.changed:
+                    job.events.append((event, data))
+                    if event == "token":
+                        job.text += data["text"]
+                    else:
+                        job.result[event] = data
+                    if event == "error":
+                        job.error = data.get("error") if isinstance(data, dict) else str(data)
+                    job.changed.notify_all()
+        except Exception as e:
+            with job.changed:
+                job.error = f"{type(e).__name__}: {e}"
+                job.events.append(("error", {"error": job.error}))
+        with job.changed:
+            job.status = "error" if job.error else "done"
+            job.finished = time.monotonic()
+            job.changed.notify_all()
+        with self._lock:
+            self._active.pop(job.key, None)
+            self._counters["running"] -= 1
+            self._counters["failed" if job.error else "completed"] += 1
+            seconds = job.finished - job.started
+            self._job_seconds = seconds if not self._job_seconds else 0.8 * self._job_seconds + 0.2 * seconds
+
+    # --- Reading ---
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def position(self, job: Job) -> int:
+        """1-based place in the queue; 0 once the job has started."""
+        with self._lock:
+            try:
+                return self._queue.index(job) + 1
+            except ValueError:
+                return 0
+
+    def snapshot(self, job: Job, since: int = 0) -> Dict[str, Any]:
+        """Pollable state of `job`; `text` is the generated text from character `since` on."""
+        position = self.position(job)
+        with job.changed:
+            now = time.monotonic()
+            state = {"job_id": job.id, "status": job.status, "position": position,
+                     "text": job.text[since:], "text_length": len(job.text),
+                     "code": job.result.get("code", {}).get("code"),
+                     "output": job.result.get("result", {}).get("output"),
+                     "plots": job.result.get("result", {}).get("plots", []),
+                     "error": job.error, "subscribers": job.subscribers,
+                     "queued_seconds": (job.started or now) - job.created,
+                     "running_seconds": (job.finished or now) - job.started if job.started else 0.0}
+        return state
+
+    def wait(self, job: Job, since: int, timeout: float) -> None:
+        """Blocks until `job` has text beyond `since`, finishes, or `timeout` passes."""
+        deadline = time.monotonic() + min(timeout, MAX_POLL_WAIT)
+        with job.changed:
+            while not job.done and len(job.text) <= since:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                job.changed.wait(remaining)
+
+    def follow(self, job: Job) -> Iterator[Event]:
+        """Yields the job's events from the start as they arrive (for Server-Sent Events)."""
+        position = self.position(job)
+        if position:
+            yield "queued", {"job_id": job.id, "position": position}
+        seen = 0
+        while True:
+            with job.changed:
+                while seen == len(job.events) and not job.done:
+                    job.changed.wait()
+                events, done = job.events[seen:], job.done
+                seen += len(events)
+            yield from events
+            if done:
+                return
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._counters, queued=len(self._queue), jobs=len(self._jobs),
+                        avg_job_seconds=self._job_seconds)
+
+
+def queue_full_response(error: QueueFull):
+    """The Flask 429 response for a full queue, with `Retry-After`."""
+    from flask import jsonify
+    response = jsonify(error=str(error), queued=error.queued, max_queued=error.max_queued,
+                       retry_after=error.retry_after)
+    response.status_code = 429
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response
+
+
+def register_job_routes(app, jobs: JobQueue, prepare: Callable[[], Tuple[str, Work]]):
+    """Adds `POST /jobs` and `GET /jobs/<id>` to a Flask app.
+
+    `prepare()` runs in the request context and returns the coalescing key and
+    the job's work; everything it needs from the request must be read there.
+    """
+    from flask import jsonify, request, url_for
+
+    def submit():
+        key, work = prepare()
+        try:
+            job, coalesced = jobs.submit(key, work)
+        except QueueFull as e:
+            return queue_full_response(e)
+        status_url = url_for("job_status", job_id=job.id)
+        response = jsonify(dict(jobs.snapshot(job), coalesced=coalesced, status_url=status_url))
+        response.status_code = 202
+        response.headers["Location"] = status_url
+        return response
+
+    def job_status(job_id):
+        job = jobs.get(job_id)
+        if job is None:
+            return jsonify(error="unknown or expired job"), 404
+        since = request.args.get("since", 0, type=int)
+        wait = request.args.get("wait", 0.0, type=float)  # Long poll: return early on new text or completion
+        if wait > 0:
+            jobs.wait(job, since, wait)
+        return jsonify(jobs.snapshot(job, since))
+
+    app.add_url_rule("/jobs", "submit_job", submit, methods=["POST"])
+    app.add_url_rule("/jobs/<job_id>", "job_status", job_status)
@@ -1,26 +1,34 @@
 # conversational_agent_example.py
-from langchain_community.llms import Ollama
+import os
+from pooled_llm import PooledOllama
+from prefix_cache import get_context_store
+from react_stream import ReActStreamParser, StepMeter
 from langchain.chains import ConversationChain
 from langchain.memory import ConversationBufferMemory
 from langchain_core.prompts import PromptTemplate
 
 from langchain.agents import load_tools, Tool
-from langchain.tools import DuckDuckGoSearchResults
+from async_tools import ToolRunner, parallelize
+from search_tool import get_search_service, keyword_variants, make_search_tool
+from tracing import get_tracer
 
 from langchain.agents import AgentExecutor, create_react_agent
 
 if __name__ == "__main__":
     # --- Configuration ---
     OLLAMA_MODEL = "tinyllama"
-    OLLAMA_BASE_URL = "http://localhost:11434"
+    OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
 
     # --- Initialize Ollama LLM ---
+    step_meter = StepMeter() # Generated tokens and wall time per agent step
     try:
-        llm = Ollama(
+        llm = PooledOllama(
             model=OLLAMA_MODEL, 
             base_url=OLLAMA_BASE_URL,
             temperature=0.01, # Try a lower temperature
-            num_predict=512 # Equivalent to max_new_tokens in Ollama
+            num_predict=512, # Equivalent to max_new_tokens in Ollama
+            reuse_context=True, # Later ReAct steps only prefill the new scratchpad lines
+            callbacks=[step_meter]
         )
         print(f"Initialized Ollama LLM with model: {OLLAMA_MODEL}")
     except Exception as e:
@@ -38,6 +46,7 @@ if __name__ == "__main__":
             Thought: I need to use a tool to answer this question.
             Action: the action to take, should be one of [{tool_names}]
             Action Input: the input to the action
+            (to search for several things at once, write one Action/Action Input pair for each)
             Observation: the result of the action
             ... (this Thought/Action/Action Input/Observation can repeat if needed)
             Thought: I now know the final answer.
@@ -56,11 +65,15 @@ if __name__ == "__main__":
 
     
     # You can create the tool to pass to an agent
-    search = DuckDuckGoSearchResults()
-    search_tool = Tool(
+    # Searches are cached per normalized query, repeated in-flight searches are joined, and the
+    # model's query plus its keyword-only variant are searched concurrently.
+    # Set SEARCH_FIXTURES=fixtures.json to answer from canned results instead of the network.
+    search_service = get_search_service()
+    search_tool = make_search_tool(
+        search_service,
         name="duckduck",
         description="A web search engine. Use this to as a search engine for general queries.",
-        func=search.run,
+        variants=keyword_variants,
     )
 
     # Prepare tools
@@ -68,21 +81,32 @@ if __name__ == "__main__":
     tools=[search_tool]
 
     # Construct the ReAct agent
-    agent = create_react_agent(llm, tools, prompt)
-    agent_executor = AgentExecutor(
+    # Generation stops once a complete step has streamed; common format slips are repaired in place
+    react_parser = ReActStreamParser(tools, multi_action=True) # Several searches in one step run concurrently
+    agent = create_react_agent(llm.bind(early_stop=react_parser.find_end), tools, prompt, output_parser=react_parser)
+    tool_runner = ToolRunner(timeouts={"duckduck": 15}) # A hung search becomes an observation, not a stuck agent
+    agent_executor = parallelize(AgentExecutor(
         agent=agent, tools=tools, verbose=True, handle_parsing_errors=True, max_iterations=5 # Set a reasonable limit for the number of steps
 
-    )
+    ), tool_runner)
+    trace_config = {"callbacks": get_tracer().callbacks("llama_duckduckgo")} # Per-step spans with AGENT_TRACING=1
+    get_tracer().serve_metrics() # /metrics when METRICS_PORT is set
 
     # --- Test Cases ---
     print("\n--- Running Agent Example 1 ---")
     try:
-        agent_executor.invoke({"input": "What is the weather in Munich?"})
+        agent_executor.invoke({"input": "What is the weather in Munich?"}, trace_config)
     except Exception as e:
         print(f"Agent execution failed for 'What is the weather in Munich?': {e}")
 
     print("\n--- Running Agent Example 2 ---")
     try:
-        agent_executor.invoke({"input": "What is the capital of Germany?"})
+        agent_executor.invoke({"input": "What is the capital of Germany?"}, trace_config)
     except Exception as e:
-        print(f"Agent execution failed for 'What is the capital of Germany?': {e}")
\ No newline at end of file
+        print(f"Agent execution failed for 'What is the capital of Germany?': {e}")
+
+    print(f"\nKV context reuse: {get_context_store().stats()}")
+    print(f"Prefill tokens saved per step: {[step['tokens_saved'] for step in get_context_store().steps]}")
+    print(f"Agent steps: {step_meter.summary()}")
+    print(f"Search cache: {search_service.stats()}")
+    print(f"Tool calls: {tool_runner.stats()}")
@@ -0,0 +1,217 @@
+# mock_ollama_server.py
+"""A small local stand-in for the Ollama REST API.
+
+Speaks enough of `/api/generate`, `/api/chat`, `/api/embed`, `/api/embeddings` and
+`/api/tags` for the agents and `ollama_client.OllamaClient` to run without a real
+model. Responses are scripted (a fixed string, a list served round-robin, or a
+callable taking the prompt; chat messages are joined into one prompt), cut at the
+first `options.stop` sequence, and streamed word by word over a keep-alive
+connection. `prompt_token_delay` simulates prefill before the first token and
+`token_delay` decoding per token. Like Ollama, the final chunk
+carries a `context`; sending it back continues from that text, and only the new
+prompt counts towards `prompt_eval_count`. `forget_contexts()` invalidates them.
+
+Run standalone and point the agents at it:
+    python mock_ollama_server.py --port 11435
+    OLLAMA_BASE_URL=http://localhost:11435 python coding_assistant_tinyllama_webapp.py
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_RESPONSE = "Here is an example:\n```python\nprint('Hello from the mock model')\n```\n"
+EMBEDDING_DIM = 32
+MAX_CONTEXTS = 4096  # Oldest contexts are forgotten beyond this
+
+
+def tokenize(text: str):
+    """Splits text into word-ish tokens that keep their whitespace, like a real stream."""
+    return re.findall(r"\s*\S+|\s+", text)
+
+
+def fake_embedding(text: str, dim: int = EMBEDDING_DIM):
+    """Deterministic pseudo-embedding derived from a hash of the text."""
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    while len(digest) < dim:
+        digest += hashlib.sha256(digest).digest()
+    return [(b - 127.5) / 127.5 for b in digest[:dim]]
+
+
+class MockOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, so the client's pooling is exercised
+
+    def log_message(self, format, *args):
+        pass  # Keep test and benchmark output quiet
+
+    def handle(self):
+        try:
+            super().handle()
+        except ConnectionResetError:
+            pass  # The client dropped the connection, e.g. after stopping a stream early
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, data, status=200):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_chunk(self, data):
+        line = json.dumps(data).encode("utf-8") + b"\n"
+        self.wfile.write(f"{len(line):X}\r\n".encode("ascii") + line + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": self.server.model}]})
+        else:
+            self._send_json({"error": f"unknown endpoint {self.path}"}, status=404)
+
+    def do_POST(self):
+        payload = self._read_json()
+        self.server.record(self.path, payload)
+        if self.path == "/api/generate":
+            self._generate(payload)
+        elif self.path == "/api/chat":
+            self._chat(payload)
+        elif self.path == "/api/embed":
+            texts = payload.get("input", [])
+            texts = [texts] if isinstance(texts, str) else texts
+            self._send_json({"model": payload.get("model"),
+                             "embeddings": [fake_embedding(t) for t in texts]})
+        elif self.path == "/api/embeddings":  # Older single-text endpoint
+            self._send_json({"embedding": fake_embedding(payload.get("prompt", ""))})
+        else:
+            self._send_json({"error": f"unknown endpoint {self.path}"}, status=404)
+
+    def _generate(self, payload):
+        prompt = payload.get("prompt", "")
+        prefix = ""
+        if payload.get("context"):
+            prefix = self.server.resolve_context(payload["context"])
+            if prefix is None:
+                self._send_json({"error": "invalid context"}, status=400)
+                return
+        text = self._complete(payload, prefix + prompt, prefill=prompt)  # A context's text is already "in cache"
+        stats = {"done": True, "prompt_eval_count": len(tokenize(prompt)), "eval_count": len(tokenize(text)),
+                 "context": self.server.make_context(prefix + prompt + text)}
+        self._reply(payload, text, stats, lambda token: {"response": token})
+
+    def _chat(self, payload):
+        prompt = "".join(f"{m.get('role', 'user')}: {m.get('content', '')}\n" for m in payload.get("messages", []))
+        prompt += "assistant:"
+        text = self._complete(payload, prompt, prefill=prompt)
+        stats = {"done": True, "prompt_eval_count": len(tokenize(prompt)), "eval_count": len(tokenize(text))}
+        self._reply(payload, text, stats, lambda token: {"message": {"role": "assistant", "content": token}})
+
+    def _complete(self, payload, prompt: str, prefill: str) -> str:
+        time.sleep(self.server.prompt_token_delay * len(tokenize(prefill)))
+        text = self.server.respond(prompt)
+        for stop in payload.get("options", {}).get("stop") or []:
+            text = text.split(stop, 1)[0]
+        return text
+
+    def _reply(self, payload, text: str, stats: dict, body):
+        """Sends `text` whole or as an NDJSON stream; `body(token)` shapes the endpoint's chunks."""
+        model = payload.get("model")
+        tokens = tokenize(text)
+        if not payload.get("stream", True):
+            time.sleep(self.server.token_delay * len(tokens))
+            self._send_json({"model": model, **body(text), **stats})
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for token in tokens:
+                time.sleep(self.server.token_delay)
+                self._send_chunk({"model": model, **body(token), "done": False})
+            self._send_chunk({"model": model, **body(""), **stats})
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True  # Client stopped reading early
+
+
+class MockOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), responses=DEFAULT_RESPONSE,
+                 token_delay: float = 0.0, model: str = "tinyllama", prompt_token_delay: float = 0.0):
+        super().__init__(address, MockOllamaHandler)
+        self.model = model
+        self.token_delay = token_delay
+        self.prompt_token_delay = prompt_token_delay
+        self.requests = []  # (path, payload) of every request, for assertions
+        self._lock = threading.Lock()
+        self._contexts = {}  # First context "token" -> the text it stands for
+        self._context_ids = itertools.count(1)
+        if callable(responses):
+            self._respond = responses
+        elif isinstance(responses, str):
+            self._respond = lambda prompt: responses
+        else:
+            cycle = itertools.cycle(responses)
+            self._respond = lambda prompt: next(cycle)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def respond(self, prompt: str) -> str:
+        with self._lock:
+            return self._respond(prompt)
+
+    def make_context(self, text: str):
+        """A context with one fake token id per token; the first one identifies the text."""
+        with self._lock:
+            context_id = next(self._context_ids)
+            self._contexts[context_id] = text
+            if len(self._contexts) > MAX_CONTEXTS:
+                del self._contexts[next(iter(self._contexts))]
+        return [context_id] + [hash(token) % 32000 for token in tokenize(text)[1:]]
+
+    def resolve_context(self, context):
+        with self._lock:
+            return self._contexts.get(context[0])
+
+    def forget_contexts(self):
+        """Invalidates every context handed out so far (like a model reload)."""
+        with self._lock:
+            self._contexts.clear()
+
+    def record(self, path: str, payload: dict):
+        with self._lock:
+            self.requests.append((path, payload))
+
+
+def start_mock_server(port: int = 0, **kwargs) -> MockOllamaServer:
+    """Starts a mock server on a background thread and returns it (call `.shutdown()` to stop)."""
+    server = MockOllamaServer(("127.0.0.1", port), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the Ollama API.")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--token-delay", type=float, default=0.01, help="Seconds per streamed token")
+    parser.add_argument("--prompt-token-delay", type=float, default=0.0, help="Prefill seconds per prompt token")
+    parser.add_argument("--response", default=DEFAULT_RESPONSE, help="Text returned for every prompt")
+    args = parser.parse_args()
+
+    server = MockOllamaServer(("127.0.0.1", args.port), responses=args.response,
+                              token_delay=args.token_delay, prompt_token_delay=args.prompt_token_delay)
+    print(f"🧪 Mock Ollama running at {server.base_url}")
+    server.serve_forever()
@@ -0,0 +1,212 @@
+# ollama_client.py
+"""Shared, pooled HTTP client for the Ollama REST API.
+
+Every agent in this repository talks to the same local Ollama server. Instead of
+forking `ollama run` per request (or opening a fresh TCP connection per call),
+this module keeps a small pool of persistent HTTP/1.1 connections, passes
+`keep_alive` so the model stays loaded between requests, and exposes token
+streaming for `/api/generate`.
+"""
+import http.client
+import json
+import os
+import queue
+import threading
+import urllib.parse
+from typing import Dict, Iterator, List, Optional
+
+# --- Configuration ---
+OLLAMA_MODEL = os.environ.get("OLLAMA_MODEL", "tinyllama")
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
+DEFAULT_KEEP_ALIVE = "30m"  # How long Ollama keeps the model resident after a request
+DEFAULT_POOL_SIZE = 8
+DEFAULT_TIMEOUT = 300  # Seconds; CPU generation with TinyLlama can be slow
+
+# Errors that mean a pooled keep-alive connection went stale and the request can be retried
+_STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.CannotSendRequest,
+    BrokenPipeError,
+    ConnectionResetError,
+)
+
+
+class OllamaError(RuntimeError):
+    """Raised when the Ollama server returns an error or cannot be reached."""
+
+
+class OllamaClient:
+    """Thread-safe Ollama client backed by a pool of persistent connections."""
+
+    def __init__(self, base_url: str = OLLAMA_BASE_URL, model: str = OLLAMA_MODEL,
+                 keep_alive: Optional[str] = DEFAULT_KEEP_ALIVE,
+                 pool_size: int = DEFAULT_POOL_SIZE, timeout: float = DEFAULT_TIMEOUT):
+        parsed = urllib.parse.urlsplit(base_url)
+        self.base_url = base_url
+        self.model = model
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._scheme = parsed.scheme or "http"
+        self._host = parsed.hostname or "localhost"
+        self._port = parsed.port or (443 if self._scheme == "https" else 80)
+        self._base_path = parsed.path.rstrip("/")
+        # Idle connections; the semaphore caps how many are open at once
+        self._idle = queue.LifoQueue()
+        self._slots = threading.Semaphore(pool_size)
+        self._size_lock = threading.Lock()
+
+    # --- Connection pool ---
+    def _new_connection(self):
+        conn_cls = http.client.HTTPSConnection if self._scheme == "https" else http.client.HTTPConnection
+        return conn_cls(self._host, self._port, timeout=self.timeout)
+
+    def grow(self, pool_size: int):
+        """Raises the connection cap to `pool_size` (it never shrinks, so in-flight requests are safe)."""
+        with self._size_lock:
+            for _ in range(pool_size - self.pool_size):
+                self._slots.release()
+            self.pool_size = max(self.pool_size, pool_size)
+
+    def _acquire(self):
+        self._slots.acquire()
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            return self._new_connection(), False
+
+    def _release(self, conn, reusable: bool):
+        if reusable:
+            self._idle.put(conn)
+        else:
+            conn.close()
+        self._slots.release()
+
+    def close(self):
+        """Closes all idle connections."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def _request(self, method: str, path: str, payload: Optional[dict] = None):
+        """Sends a request on a pooled connection and returns (conn, response)."""
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        headers = {"Content-Type": "application/json", "Connection": "keep-alive"}
+        for attempt in range(2):
+            conn, was_pooled = self._acquire()
+            try:
+                conn.request(method, self._base_path + path, body=body, headers=headers)
+                response = conn.getresponse()
+            except _STALE_CONNECTION_ERRORS as e:
+                self._release(conn, reusable=False)
+                # Only a connection that sat idle in the pool is worth one retry
+                if was_pooled and attempt == 0:
+                    continue
+                raise OllamaError(f"Connection to Ollama at {self.base_url} failed: {e}") from e
+            except OSError as e:
+                self._release(conn, reusable=False)
+                raise OllamaError(f"Could not reach Ollama at {self.base_url}: {e}") from e
+            if response.status >= 400:
+                detail = response.read().decode("utf-8", "replace")
+                self._release(conn, reusable=not response.will_close)
+                raise OllamaError(f"Ollama returned HTTP {response.status} for {path}: {detail}")
+            return conn, response
+        raise OllamaError(f"Connection to Ollama at {self.base_url} failed")
+
+    def _post_json(self, path: str, payload: dict) -> dict:
+        conn, response = self._request("POST", path, payload)
+        try:
+            data = json.loads(response.read())
+        except Exception:
+            self._release(conn, reusable=False)
+            raise
+        self._release(conn, reusable=not response.will_close)
+        if "error" in data:
+            raise OllamaError(data["error"])
+        return data
+
+    def _post_stream(self, path: str, payload: dict) -> Iterator[dict]:
+        """Yields the newline-delimited JSON objects of a streaming response.
+
+        If the caller stops iterating early the connection is closed rather than
+        returned to the pool, since the rest of the body was never read.
+        """
+        conn, response = self._request("POST", path, payload)
+        finished = False
+        try:
+            for line in response:
+                line = line.strip()
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if "error" in chunk:
+                    raise OllamaError(chunk["error"])
+                yield chunk
+            finished = True
+        finally:
+            self._release(conn, reusable=finished and not response.will_close)
+
+    # --- Ollama API ---
+    def _generate_payload(self, prompt: str, model: Optional[str], options: Optional[dict],
+                          stream: bool, **extra) -> dict:
+        payload = {"model": model or self.model, "prompt": prompt, "stream": stream}
+        if options:
+            payload["options"] = options
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        payload.update({k: v for k, v in extra.items() if v is not None})
+        return payload
+
+    def stream(self, prompt: str, model: Optional[str] = None, options: Optional[dict] = None,
+               **extra) -> Iterator[dict]:
+        """Streams raw `/api/generate` chunks. The last chunk has `done=True` and the stats."""
+        payload = self._generate_payload(prompt, model, options, stream=True, **extra)
+        return self._post_stream("/api/generate", payload)
+
+    def generate_stream(self, prompt: str, model: Optional[str] = None,
+                        options: Optional[dict] = None, **extra) -> Iterator[str]:
+        """Streams the completion for `prompt` token by token."""
+        for chunk in self.stream(prompt, model=model, options=options, **extra):
+            if chunk.get("response"):
+                yield chunk["response"]
+
+    def generate(self, prompt: str, model: Optional[str] = None,
+                 options: Optional[dict] = None, **extra) -> str:
+        """Returns the full completion for `prompt`."""
+        payload = self._generate_payload(prompt, model, options, stream=False, **extra)
+        return self._post_json("/api/generate", payload).get("response", "")
+
+    def embed(self, texts: List[str], model: Optional[str] = None) -> List[List[float]]:
+        """Returns one embedding per input text using the batch `/api/embed` endpoint."""
+        payload = {"model": model or self.model, "input": list(texts)}
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        return self._post_json("/api/embed", payload)["embeddings"]
+
+
+# --- Shared clients ---
+# One pool per (base_url, model, keep_alive, timeout) so every agent in a process with the same
+# request settings reuses the same connections.
+_clients: Dict[tuple, OllamaClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(base_url: str = OLLAMA_BASE_URL, model: str = OLLAMA_MODEL,
+               keep_alive: Optional[str] = DEFAULT_KEEP_ALIVE, pool_size: int = DEFAULT_POOL_SIZE,
+               timeout: float = DEFAULT_TIMEOUT) -> OllamaClient:
+    """Returns the process-wide client for these settings, creating it on first use.
+
+    `keep_alive` and `timeout` change what requests send, so they pick a separate client;
+    a larger `pool_size` than the existing client's grows its pool.
+    """
+    key = (base_url, model, keep_alive, timeout)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = OllamaClient(base_url=base_url, model=model, keep_alive=keep_alive,
+                                                  pool_size=pool_size, timeout=timeout)
+        elif pool_size > client.pool_size:
+            client.grow(pool_size)
+        return client
@@ -0,0 +1,96 @@
+# plot_store.py
+"""Content-addressed storage for the charts LLM-generated code produces.
+
+The data app used to copy a job's files into `static/` under their own names,
+and the page always loaded `/static/plot.png`. So two users plotting at the
+same time overwrote each other's image, and the browser cache could show a
+stale one. Images are now stored under the SHA-256 of their bytes:
+- a job's chart gets a name nobody else's chart can take;
+- identical charts (the same question twice, or an execution-cache hit) share
+  one file and are written once;
+- a name never changes content, so `send_plot` serves it with a one-year
+  `immutable` cache header.
+
+Only raster images are published: SVG can carry script, so a chart opened at
+its own URL would run code from the job in the app's origin. `store` keeps
+PNG and JPEG only. `send_plot` serves any other file as a download, with a CSP
+that forbids script.
+
+Rendering stays off the web process: figures are drawn and encoded in the
+execution workers (`code_executor`), and this module only hashes and writes.
+"""
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from typing import Dict, List
+
+from execution_cache import PLOT_EXTENSIONS
+
+# --- Configuration ---
+PLOT_MAX_AGE = 365 * 24 * 3600  # Seconds browsers may cache a content-addressed plot
+INLINE_EXTENSIONS = (".png", ".jpg", ".jpeg")  # Served for display; everything else only as a download
+HASHED_NAME_RE = re.compile(r"^[0-9a-f]{32}\.(png|jpg|jpeg)$")
+
+
+def is_plot(name: str) -> bool:
+    return name.lower().endswith(PLOT_EXTENSIONS)
+
+
+class PlotStore:
+    """Images in `directory`, named by content hash; identical images are stored once."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._counters = {"stored": 0, "deduplicated": 0, "bytes_written": 0}
+
+    def put(self, data: bytes, extension: str) -> str:
+        """Stores one image; returns its file name."""
+        name = hashlib.sha256(data).hexdigest()[:32] + extension.lower()
+        path = os.path.join(self.directory, name)
+        if os.path.exists(path):
+            with self._lock:
+                self._counters["deduplicated"] += 1
+            return name
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)  # Readers see the whole file or none of it
+        with self._lock:
+            self._counters["stored"] += 1
+            self._counters["bytes_written"] += len(data)
+        return name
+
+    def store(self, artifacts: Dict[str, bytes]) -> List[str]:
+        """Stores the PNG/JPEG images among a job's artifacts, in order; other files are skipped."""
+        return [self.put(data, os.path.splitext(name)[1]) for name, data in artifacts.items()
+                if name.lower().endswith(INLINE_EXTENSIONS)]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters)
+
+
+def send_plot(directory: str, filename: str):
+    """Serves a file from `directory`; content-addressed plots get long-lived cache headers.
+
+    Files other than PNG/JPEG (e.g. an SVG left by an older version) are sent as
+    attachments with `script-src 'none'`, so they never run script in this origin.
+    """
+    from flask import send_from_directory
+
+    directory = os.path.abspath(directory)  # Flask resolves relative paths against the app, not the cwd
+    if HASHED_NAME_RE.match(filename):
+        response = send_from_directory(directory, filename, max_age=PLOT_MAX_AGE)
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+    elif filename.lower().endswith(INLINE_EXTENSIONS):
+        response = send_from_directory(directory, filename)
+    else:
+        response = send_from_directory(directory, filename, as_attachment=True)
+        response.headers["Content-Security-Policy"] = "script-src 'none'"
+    response.headers["X-Content-Type-Options"] = "nosniff"
+    return response
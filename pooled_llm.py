@@ -0,0 +1,87 @@
+# pooled_llm.py
+"""LangChain LLM backed by the shared pooled Ollama client.
+
+Drop-in replacement for `langchain_community.llms.Ollama` in the agents: it reuses
+the process-wide connection pool from `ollama_client`, keeps the model resident
+with `keep_alive`, supports token streaming through LangChain callbacks, and
+answers repeated prompts from the shared `completion_cache`. With
+`reuse_context=True`, ReAct steps that extend the previous prompt send only the
+new suffix plus Ollama's KV `context` (see `prefix_cache`). With `early_stop`,
+generation is cut as soon as a complete ReAct step has streamed (see `react_stream`).
+"""
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+from completion_cache import cached_stream, get_cache
+from ollama_client import DEFAULT_KEEP_ALIVE, OLLAMA_BASE_URL, OLLAMA_MODEL, OllamaClient, get_client
+from prefix_cache import get_context_store, stream_with_context
+from react_stream import cut_stream, early_stop_key
+
+
+class PooledOllama(LLM):
+    """Ollama completion model that streams over pooled keep-alive connections."""
+
+    model: str = OLLAMA_MODEL
+    base_url: str = OLLAMA_BASE_URL
+    keep_alive: Optional[str] = DEFAULT_KEEP_ALIVE
+    temperature: Optional[float] = None
+    num_predict: Optional[int] = None
+    stop: Optional[List[str]] = None
+    use_completion_cache: bool = True
+    cache_nondeterministic: bool = False  # Also cache completions sampled with temperature > 0
+    reuse_context: bool = False  # Continue from the session's KV context instead of re-prefilling the prompt
+    early_stop: Optional[Callable[[str], Optional[int]]] = None  # Text so far -> where a complete step ends
+
+    @property
+    def _llm_type(self) -> str:
+        return "pooled-ollama"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model": self.model, "base_url": self.base_url, **self._options()}
+
+    @property
+    def client(self) -> OllamaClient:
+        return get_client(self.base_url, self.model, keep_alive=self.keep_alive)
+
+    def _options(self, stop: Optional[List[str]] = None) -> Dict[str, Any]:
+        options = {"temperature": self.temperature, "num_predict": self.num_predict,
+                   "stop": stop or self.stop}
+        return {k: v for k, v in options.items() if v is not None}
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None,
+                **kwargs: Any) -> Iterator[GenerationChunk]:
+        options = self._options(stop)
+        if self.reuse_context:
+            tokens_for = lambda: stream_with_context(get_context_store(), self.client, prompt, self.model, options)
+            # The model sees the prompt as a continuation, so don't share cache entries with plain calls
+            key_options = dict(options, reuse_context=True)
+        else:
+            tokens_for = lambda: self.client.generate_stream(prompt, options=options)
+            key_options = options
+        early_stop = kwargs.get("early_stop", self.early_stop)  # Also accepted per call, e.g. via `llm.bind()`
+        if early_stop is not None:
+            tokens_for = lambda raw=tokens_for: cut_stream(raw(), early_stop)
+            # Stored completions are cut too, and where depends on the parser's configuration
+            key_options = dict(key_options, early_stop=early_stop_key(early_stop))
+        generated = []  # Stays empty when the completion comes from the cache
+        tokens = cached_stream(
+            get_cache() if self.use_completion_cache else None,
+            lambda: generated.append(True) or tokens_for(), self.model, prompt, key_options,
+            allow_nondeterministic=True if self.cache_nondeterministic else None, base_url=self.base_url,
+        )
+        for token in tokens:
+            # Callbacks (e.g. `tracing`) can tell a cached completion from a generated one
+            chunk = GenerationChunk(text=token, generation_info=None if generated else {"cache_hit": True})
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None,
+              run_manager: Optional[CallbackManagerForLLMRun] = None,
+              **kwargs: Any) -> str:
+        return "".join(chunk.text for chunk in self._stream(prompt, stop, run_manager, **kwargs))
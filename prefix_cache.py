@@ -0,0 +1,186 @@
+# prefix_cache.py
+"""Reuse of Ollama's KV `context` across ReAct steps (prefix caching).
+
+Each step of a ReAct agent resends the entire prompt: tool descriptions, format
+rules, schema and the growing scratchpad. Every one of those tokens is
+prefilled again on CPU. Ollama returns a `context` (the tokens of prompt plus
+completion) with each generation. When the next prompt starts with exactly that
+text, only the new suffix needs to be sent together with the context.
+
+`ContextStore` keeps the latest (text, rendered text, context) per session. `stream_with_context`
+sends just the suffix when the new prompt extends the stored text. It sends the
+full prompt otherwise: a new question, a trimmed history, or a context that
+would overflow `num_ctx`. If Ollama rejects a context, for example after a model
+reload, the request is retried once with the full prompt. Each step records how
+many prefill tokens it saved.
+
+Sessions are selected with `with prefix_session(key): ...` around an agent call;
+`PooledOllama(reuse_context=True)` uses the `"default"` session otherwise.
+
+Requests use `raw` mode, with the chat template (`PROMPT_TEMPLATE`) applied here
+once, at the start of a session's text. Otherwise Ollama would wrap every
+suffix in a fresh user/assistant turn, and a continuation would no longer
+match the full prompt. So the first step sends `template(prompt)`, and every
+later step continues that same text. A full resend, after a rejected context,
+or to a server that returns no `context` in raw mode, sends the same tokens,
+so the server's own prompt cache still matches them.
+"""
+import contextvars
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from ollama_client import OllamaClient, OllamaError
+
+# --- Configuration ---
+DEFAULT_NUM_CTX = 2048  # TinyLlama's context window
+DEFAULT_MAX_SESSIONS = 256
+MAX_STEP_RECORDS = 1000
+_CHARS_PER_TOKEN = 3.5  # For the overflow check only
+PROMPT_TEMPLATE = os.environ.get("OLLAMA_PROMPT_TEMPLATE", "<|user|>\n{prompt}</s>\n<|assistant|>\n")  # TinyLlama's
+
+_current_session: contextvars.ContextVar = contextvars.ContextVar("prefix_session", default="default")
+
+
+@contextmanager
+def prefix_session(key: str):
+    """Routes the generations made inside the block to the KV context of session `key`."""
+    token = _current_session.set(key)
+    try:
+        yield
+    finally:
+        _current_session.reset(token)
+
+
+def current_session() -> str:
+    return _current_session.get()
+
+
+class ContextStore:
+    """LRU of (text so far, rendered text, Ollama context) per (model, session), plus per-step savings."""
+
+    def __init__(self, max_sessions: int = DEFAULT_MAX_SESSIONS, num_ctx: int = DEFAULT_NUM_CTX,
+                 template: str = PROMPT_TEMPLATE):
+        self.max_sessions = max_sessions
+        self.num_ctx = num_ctx
+        self.template = template
+        self._states: "OrderedDict[Tuple[str, str], Tuple[str, str, Optional[List[int]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.steps: List[Dict] = []  # Most recent MAX_STEP_RECORDS steps
+        self._counters = {"steps": 0, "reused": 0, "fallbacks": 0, "tokens_saved": 0}
+
+    def get(self, model: str, session: str) -> Optional[Tuple[str, str, Optional[List[int]]]]:
+        with self._lock:
+            state = self._states.get((model, session))
+            if state is not None:
+                self._states.move_to_end((model, session))
+            return state
+
+    def put(self, model: str, session: str, text: str, rendered: str, context: Optional[List[int]]):
+        with self._lock:
+            self._states[(model, session)] = (text, rendered, context)
+            self._states.move_to_end((model, session))
+            while len(self._states) > self.max_sessions:
+                self._states.popitem(last=False)
+
+    def discard(self, model: str, session: str):
+        with self._lock:
+            self._states.pop((model, session), None)
+
+    def record(self, step: Dict):
+        with self._lock:
+            self._counters["steps"] += 1
+            self._counters["reused"] += bool(step["reused"])
+            self._counters["fallbacks"] += bool(step.get("fallback"))
+            self._counters["tokens_saved"] += step["tokens_saved"]
+            self.steps.append(step)
+            del self.steps[:-MAX_STEP_RECORDS]
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._counters, sessions=len(self._states))
+        stats["reuse_rate"] = stats["reused"] / stats["steps"] if stats["steps"] else 0.0
+        return stats
+
+    def render(self, prompt: str) -> str:
+        return self.template.replace("{prompt}", prompt)
+
+    def plan(self, model: str, session: str, prompt: str) -> Tuple[str, Optional[List[int]], str]:
+        """(raw text to send, context to send with it, full rendered prompt) for `prompt`."""
+        state = self.get(model, session)
+        if state is None:
+            rendered = self.render(prompt)
+            return rendered, None, rendered
+        text, rendered, context = state
+        if len(prompt) <= len(text) or not prompt.startswith(text):
+            rendered = self.render(prompt)
+            return rendered, None, rendered  # Not a continuation (new question, edited history, ...)
+        suffix = prompt[len(text):]
+        rendered += suffix
+        if len(rendered) / _CHARS_PER_TOKEN >= self.num_ctx:
+            rendered = self.render(prompt)
+            return rendered, None, rendered  # Ollama would truncate; start over from the full prompt
+        if context is None:
+            return rendered, None, rendered  # No KV context to continue from: resend the same tokens
+        return suffix, context, rendered
+
+
+def stream_with_context(store: ContextStore, client: OllamaClient, prompt: str, model: str,
+                        options: Optional[dict] = None, session: Optional[str] = None) -> Iterator[str]:
+    """Streams the completion of `prompt`, sending only the part beyond the session's context."""
+    session = session or current_session()
+    sent, context, rendered = store.plan(model, session, prompt)
+    fallback = False
+    while True:
+        parts: List[str] = []
+        final: Dict = {}
+        try:
+            for chunk in client.stream(sent, model=model, options=options, context=context, raw=True):
+                if chunk.get("response"):
+                    parts.append(chunk["response"])
+                    yield chunk["response"]
+                if chunk.get("done"):
+                    final = chunk
+        except OllamaError:
+            store.discard(model, session)
+            if context is None or parts:
+                raise
+            # The context was rejected (e.g. the model was reloaded): resend everything once
+            sent, context, fallback = rendered, None, True
+            continue
+        except GeneratorExit:
+            # Cut short (e.g. `react_stream.cut_stream`): no new context arrived, but the stored
+            # one still matches its text, so the next step can continue from there
+            _record(store, session, context, fallback, final)
+            raise
+        break
+    completion = "".join(parts)
+    # Without a returned context the rendering is still kept, so the next step resends identical tokens
+    store.put(model, session, prompt + completion, rendered + completion, final.get("context") or None)
+    _record(store, session, context, fallback, final)
+
+
+def _record(store: ContextStore, session: str, context: Optional[List[int]], fallback: bool, final: Dict):
+    store.record({
+        "session": session,
+        "reused": context is not None,
+        "fallback": fallback,
+        "tokens_saved": len(context) if context is not None else 0,
+        "prompt_eval_count": final.get("prompt_eval_count"),
+    })
+
+
+# --- Shared store ---
+_shared_store: Optional[ContextStore] = None
+_shared_lock = threading.Lock()
+
+
+def get_context_store() -> ContextStore:
+    """Returns the process-wide context store."""
+    global _shared_store
+    with _shared_lock:
+        if _shared_store is None:
+            _shared_store = ContextStore()
+        return _shared_store
@@ -1,21 +1,33 @@
 # rag_agent_example.py
-from langchain_community.llms import Ollama
-from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import OllamaEmbeddings
+import os
+from pooled_llm import PooledOllama
+from completion_cache import get_cache
+from embedding_pipeline import BatchedEmbeddings
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.chains import RetrievalQA
 from langchain_core.documents import Document
+from rag_index import DEFAULT_INDEX_DIR, PersistentVectorIndex
 
 # --- Configuration ---
 OLLAMA_MODEL = "tinyllama"
-OLLAMA_BASE_URL = "http://localhost:11434"
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
+INDEX_DIR = os.environ.get("RAG_INDEX_DIR", DEFAULT_INDEX_DIR)
+VECTOR_BACKEND = os.environ.get("RAG_VECTOR_BACKEND", "numpy") # "numpy" (in-process, hybrid BM25) or "chroma"
+INDEX_TYPE = os.environ.get("RAG_INDEX_TYPE", "exact") # "ivf" for approximate search over millions of chunks
+IVF_NPROBE = int(os.environ.get("RAG_IVF_NPROBE", "8")) # Cells scanned per query: higher = better recall, slower
+CORPUS_DIR = os.environ.get("RAG_CORPUS_DIR") # If set, ingest this directory instead of the built-in documents
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 0
+EMBED_BATCH_SIZE = 32 # Chunks per /api/embed request
+EMBED_CONCURRENCY = 4 # Embedding requests kept in flight
 
 
 def get_tinyllama_1b():
     """Initializes and returns the ChatOllama LLM."""
     try:
-        llm = Ollama(model=OLLAMA_MODEL, base_url=OLLAMA_BASE_URL)
-        embeddings = OllamaEmbeddings(model=OLLAMA_MODEL, base_url=OLLAMA_BASE_URL)
+        llm = PooledOllama(model=OLLAMA_MODEL, base_url=OLLAMA_BASE_URL, temperature=0) # Greedy, so repeated questions are cached
+        embeddings = BatchedEmbeddings(model=OLLAMA_MODEL, base_url=OLLAMA_BASE_URL,
+                                       batch_size=EMBED_BATCH_SIZE, max_concurrency=EMBED_CONCURRENCY)
         print(f"Initialized Ollama LLM and Embeddings with model: {OLLAMA_MODEL}")
     except Exception as e:
         print(f"Error connecting to Ollama or loading model '{OLLAMA_MODEL}': {e}")
@@ -34,25 +46,59 @@ def get_document():
     ]
     return documents
 
-if __name__ == "__main__":
-    llm, embeddings = get_tinyllama_1b()
-    documents = get_document()
+def get_index(embeddings):
+    """Opens the persistent vector index in INDEX_DIR (nothing is re-embedded on restart)."""
+    # Split documents into smaller chunks (optional for small docs, but good practice)
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    return PersistentVectorIndex(embeddings, persist_directory=os.path.join(INDEX_DIR, VECTOR_BACKEND),
+                                 text_splitter=text_splitter, backend=VECTOR_BACKEND,
+                                 store_kwargs={"index_type": INDEX_TYPE, "nprobe": IVF_NPROBE}
+                                 if VECTOR_BACKEND == "numpy" else None)
 
+def ingest_documents(index, documents, prune=True):
+    """Syncs the index with the full corpus: embeds new/changed chunks, drops deleted ones.
 
-    # Split documents into smaller chunks (optional for small docs, but good practice)
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=0)
-    splits = text_splitter.split_documents(documents)
+    With `prune=False`, sources not in `documents` are kept (see `load_corpus`).
+    """
+    stats = index.sync(documents) if prune else index.update(documents)
+    print(f"Index {'sync' if prune else 'update'}: {stats['added']} added, {stats['unchanged']} unchanged, "
+          f"{stats['removed']} removed ({stats['total']} chunks).")
+    embed_stats = index.embeddings.stats() if hasattr(index.embeddings, "stats") else None
+    if embed_stats:
+        print(f"Embedding: {embed_stats['embedded']} embedded, {embed_stats['cache_hits']} cache hits, "
+              f"{embed_stats['chunks_per_sec']:.1f} chunks/sec, max queue depth {embed_stats['max_queue_depth']}.")
+    return stats
+
+def update_documents(index, documents):
+    """Adds or replaces individual documents without touching the rest of the corpus."""
+    return index.update(documents)
+
+def load_corpus(index):
+    """Ingests RAG_CORPUS_DIR, or else adds the built-in documents.
 
-    # Create a vector store from the documents
-    vectorstore = Chroma.from_documents(documents=splits, embedding=embeddings)
-    print("Created in-memory vector store.")
+    The built-in documents are added, not synced, so they never wipe a corpus
+    that was ingested into the same index before.
+    """
+    if CORPUS_DIR:
+        from ingest import ingest_directory
+        stats = ingest_directory(CORPUS_DIR, index, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+        print(f"Ingested {stats['files_indexed']} files ({stats['files_skipped']} unchanged) from {CORPUS_DIR}.")
+        return stats
+    return ingest_documents(index, get_document(), prune=False)
+
+if __name__ == "__main__":
+    llm, embeddings = get_tinyllama_1b()
+
+    # Open the on-disk index and only embed what changed since the last run
+    index = get_index(embeddings)
+    load_corpus(index)
 
     # --- Create the RAG Chain ---
     # We use RetrievalQA chain to combine retrieval and LLM generation
     qa_chain = RetrievalQA.from_chain_type(
         llm=llm,
         chain_type="stuff", # "stuff" means simply stuffing all retrieved documents into the prompt
-        retriever=vectorstore.as_retriever(),
+        retriever=index.as_retriever(),
         return_source_documents=True # Optionally return the documents that were used
     )
 
@@ -75,4 +121,6 @@ if __name__ == "__main__":
     print(f"\nQuestion: {question3}")
     response = qa_chain.invoke({"query": question3})
     print(f"Answer: {response['result']}")
-    print(f"Source Documents: {[doc.page_content for doc in response['source_documents']]}")
\ No newline at end of file
+    print(f"Source Documents: {[doc.page_content for doc in response['source_documents']]}")
+
+    print(f"\nCompletion cache: {get_cache().stats()}")
@@ -0,0 +1,247 @@
+# rag_index.py
+"""Persistent, incrementally updated vector index for the RAG agent.
+
+Chunks are stored in an on-disk vector store (a Chroma collection, or the
+in-process `vector_store.NumpyVectorStore`) under their content hash, and a
+small manifest records which chunk hashes belong to which source document (and,
+for files ingested by `ingest.py`, the hash of the file they were split from and
+the directory it was found under). On
+restart the collection is simply opened (nothing is re-embedded), and
+re-ingesting a corpus only embeds chunks that are new or changed and deletes
+chunks that disappeared.
+
+Manifest changes are appended to `manifest.log`, one line per changed source.
+It is folded into `manifest.json` once it holds more entries than there are
+sources, so an update writes only what changed.
+"""
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, List, Optional
+
+from langchain_core.documents import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+# --- Configuration ---
+DEFAULT_INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "rag_index")
+COLLECTION_NAME = "rag_documents"
+BACKENDS = ("chroma", "numpy")
+MANIFEST_FILE = "manifest.json"
+MANIFEST_LOG = "manifest.log"  # Per-source changes since manifest.json was last written
+MIN_COMPACT_ENTRIES = 256  # Log entries always allowed before folding the log into the manifest
+
+
+def document_source(document: Document) -> str:
+    """Stable identifier of the document a chunk came from."""
+    source = document.metadata.get("source")
+    if source:
+        return str(source)
+    # Inline documents without a source are identified by their content
+    return "inline:" + hashlib.sha256(document.page_content.encode("utf-8")).hexdigest()[:16]
+
+
+def chunk_id(source: str, text: str) -> str:
+    """Content hash of a chunk; unchanged chunks keep their id across re-ingestion."""
+    return hashlib.sha256(f"{source}\0{text}".encode("utf-8")).hexdigest()
+
+
+def embedding_model_name(embeddings) -> str:
+    return str(getattr(embeddings, "model", type(embeddings).__name__))
+
+
+class PersistentVectorIndex:
+    """On-disk vector store plus a per-source manifest of chunk hashes."""
+
+    def __init__(self, embeddings, persist_directory: str = DEFAULT_INDEX_DIR,
+                 text_splitter=None, collection_name: str = COLLECTION_NAME,
+                 backend: str = "chroma", store_kwargs: Optional[dict] = None):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown vector store backend {backend!r}; expected one of {BACKENDS}")
+        self.embeddings = embeddings
+        self.persist_directory = persist_directory
+        self.collection_name = collection_name
+        self.backend = backend
+        self.store_kwargs = store_kwargs or {}  # e.g. index_type/nprobe for the NumPy store
+        self.text_splitter = text_splitter or RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=0)
+        os.makedirs(persist_directory, exist_ok=True)
+        self._manifest_path = os.path.join(persist_directory, MANIFEST_FILE)
+        self._log_path = os.path.join(persist_directory, MANIFEST_LOG)
+        self._log_entries = 0
+        self.manifest = self._load_manifest()
+        self.vectorstore = self._open_vectorstore()
+        # Vectors from a different embedding model or backend are not reusable; start over
+        model = embedding_model_name(embeddings)
+        if (self.manifest.get("embedding_model") not in (None, model)
+                or self.manifest.get("backend") not in (None, backend)):
+            self.vectorstore = self._open_vectorstore(reset=True)
+            self.manifest = {"sources": {}, "files": {}, "roots": {}}
+        self.manifest["embedding_model"] = model
+        self.manifest["backend"] = backend
+        self._save_manifest()  # Folds in the log, and records a reset before stale file hashes can be read
+        self._known = {cid for ids in self.sources.values() for cid in ids}  # Maintained by `_apply`
+
+    def _open_vectorstore(self, reset: bool = False):
+        if self.backend == "numpy":
+            from vector_store import NumpyVectorStore
+            store = NumpyVectorStore(self.embeddings, persist_directory=self.persist_directory,
+                                     **self.store_kwargs)
+            if reset and len(store):
+                store.delete(list(store.ids))
+            return store
+        # Imported lazily so the NumPy backend does not require chromadb
+        from langchain_community.vectorstores import Chroma
+        store = Chroma(collection_name=self.collection_name, embedding_function=self.embeddings,
+                       persist_directory=self.persist_directory)
+        if reset:
+            store.delete_collection()
+            store = Chroma(collection_name=self.collection_name, embedding_function=self.embeddings,
+                           persist_directory=self.persist_directory)
+        return store
+
+    # --- Manifest ---
+    def _load_manifest(self) -> dict:
+        manifest = {"sources": {}, "files": {}, "roots": {}}
+        if os.path.exists(self._manifest_path):
+            with open(self._manifest_path) as f:
+                manifest = json.load(f)
+            manifest.setdefault("files", {})
+            manifest.setdefault("roots", {})
+        if os.path.exists(self._log_path):
+            with open(self._log_path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:  # A torn last line from a crash during an append
+                        break
+                    self._replay(manifest, entry)
+                    self._log_entries += 1
+        return manifest
+
+    @staticmethod
+    def _replay(manifest: dict, entry: dict):
+        """Applies one log entry: a source's new chunk ids, file hash and root, or `ids: null` for removal."""
+        source = entry["source"]
+        manifest["files"].pop(source, None)
+        manifest["roots"].pop(source, None)
+        if entry["ids"] is None:
+            manifest["sources"].pop(source, None)
+            return
+        manifest["sources"][source] = entry["ids"]
+        if entry.get("file"):
+            manifest["files"][source] = entry["file"]
+        if entry.get("root"):
+            manifest["roots"][source] = entry["root"]
+
+    def _save_manifest(self):
+        """Writes the whole manifest and empties the log."""
+        tmp_path = self._manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_path, self._manifest_path)  # Atomic, so a crash never leaves half a manifest
+        # Entries replayed over the new manifest are idempotent, so a crash before this is harmless
+        if os.path.exists(self._log_path):
+            os.remove(self._log_path)
+        self._log_entries = 0
+
+    def _log_changes(self, entries: List[dict]):
+        """Appends per-source changes, or rewrites the manifest once the log outgrows it."""
+        if self._log_entries + len(entries) > max(MIN_COMPACT_ENTRIES, len(self.sources)):
+            self._save_manifest()
+            return
+        with open(self._log_path, "a") as f:
+            f.write("".join(json.dumps(entry) + "\n" for entry in entries))
+        self._log_entries += len(entries)
+
+    @property
+    def sources(self) -> Dict[str, List[str]]:
+        return self.manifest["sources"]
+
+    @property
+    def files(self) -> Dict[str, str]:
+        """Source -> hash of the file its chunks were split from; kept in step with `sources`."""
+        return self.manifest["files"]
+
+    @property
+    def roots(self) -> Dict[str, str]:
+        """Source -> directory `ingest.py` found its file under; kept in step with `sources`."""
+        return self.manifest["roots"]
+
+    def __len__(self) -> int:
+        return sum(len(ids) for ids in self.sources.values())
+
+    # --- Ingestion ---
+    def _chunk(self, documents: Iterable[Document]) -> Dict[str, Dict[str, Document]]:
+        """Splits documents and groups the chunks by source, keyed by chunk hash."""
+        chunks: Dict[str, Dict[str, Document]] = {}
+        for document in documents:
+            source = document_source(document)
+            per_source = chunks.setdefault(source, {})
+            for split in self.text_splitter.split_documents([document]):
+                split.metadata = {**split.metadata, "source": source}
+                per_source[chunk_id(source, split.page_content)] = split
+        return chunks
+
+    def _apply(self, chunks: Dict[str, Dict[str, Document]], removed_sources: Iterable[str],
+               file_hashes: Optional[Dict[str, str]] = None, root: Optional[str] = None) -> Dict[str, int]:
+        wanted = {cid for per_source in chunks.values() for cid in per_source}
+        stale = set()
+        for source in list(chunks) + list(removed_sources):
+            stale.update(self.sources.get(source, []))
+        stale -= wanted
+
+        new_ids, new_docs = [], []
+        for per_source in chunks.values():
+            for cid, doc in per_source.items():
+                if cid not in self._known:
+                    new_ids.append(cid)
+                    new_docs.append(doc)
+
+        if new_docs:
+            self.vectorstore.add_documents(new_docs, ids=new_ids)  # Only these are embedded
+        if stale:
+            self.vectorstore.delete(ids=sorted(stale))
+
+        self._known.update(new_ids)
+        self._known -= stale
+
+        # Replaced content drops its old file hash and root, which no longer describe it
+        file_hashes = file_hashes or {}
+        entries = [{"source": source, "ids": None} for source in removed_sources]
+        entries += [{"source": source, "ids": sorted(per_source), "file": file_hashes.get(source), "root": root}
+                    for source, per_source in chunks.items()]
+        for entry in entries:
+            self._replay(self.manifest, entry)
+        if entries:
+            self._log_changes(entries)
+        return {"added": len(new_ids), "removed": len(stale),
+                "unchanged": len(wanted) - len(new_ids), "total": len(self)}
+
+    def sync(self, documents: Iterable[Document]) -> Dict[str, int]:
+        """Makes the index match `documents` exactly: sources not in the corpus are dropped."""
+        chunks = self._chunk(documents)
+        return self._apply(chunks, removed_sources=[s for s in self.sources if s not in chunks])
+
+    def update(self, documents: Iterable[Document]) -> Dict[str, int]:
+        """Adds or replaces the given documents, leaving other sources untouched."""
+        return self._apply(self._chunk(documents), removed_sources=[])
+
+    def update_chunks(self, chunks: Dict[str, List[Document]], file_hashes: Optional[Dict[str, str]] = None,
+                      root: Optional[str] = None) -> Dict[str, int]:
+        """Like `update`, for documents that were already split (e.g. by `ingest.py` workers).
+
+        `file_hashes` (source -> file hash) and the `root` directory of the files are
+        recorded with the chunks in the same manifest write, so they are dropped
+        whenever the chunks are.
+        """
+        by_source = {
+            source: {chunk_id(source, doc.page_content): doc for doc in docs}
+            for source, docs in chunks.items()
+        }
+        return self._apply(by_source, removed_sources=[], file_hashes=file_hashes, root=root)
+
+    def remove(self, sources: Iterable[str]) -> Dict[str, int]:
+        """Deletes every chunk of the given sources."""
+        return self._apply({}, removed_sources=[s for s in sources if s in self.sources])
+
+    def as_retriever(self, **kwargs):
+        return self.vectorstore.as_retriever(**kwargs)
@@ -0,0 +1,309 @@
+# react_stream.py
+"""Streaming ReAct step parser that ends generation once a step is complete.
+
+LangChain's ReAct parsers look at the completion only after the model has
+stopped. TinyLlama often keeps going past a finished `Action Input`: it writes a
+made-up `Observation`, a second action or a new `Question`. All of that costs
+decode time, and sometimes the extra text makes the step unparseable, which
+takes another LLM round-trip to fix. `ReActStreamParser.find_end` reports where
+a well-formed step ends in the text streamed so far. `PooledOllama(early_stop=...)`
+uses it to close the stream at that point. The agent executor then runs the tool
+straight away.
+
+The same parser is the agent's output parser. Before giving up on a step it
+repairs the usual slips:
+- `Action: tool(args)` or `Action: tool: args` without an `Action Input`
+- tool names that are quoted, bracketed, differently cased or padded with words
+- inputs wrapped in quotes or code fences
+- an `Action` and a `Final Answer` in the same step (the first one wins)
+- a plain answer with no `Final Answer:` label that does not mention any tool
+
+`StepMeter` is a callback handler that records generated tokens (estimated from
+the returned text) and wall time for each LLM call, i.e. each agent step.
+"""
+import json
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+from langchain.agents.agent import AgentOutputParser
+from langchain_core.agents import AgentAction, AgentFinish
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.exceptions import OutputParserException
+
+from summary_memory import estimate_tokens
+
+# --- Configuration ---
+MAX_STEP_RECORDS = 1000
+
+# A line that starts a new part of a ReAct step, e.g. "Action Input:" or "Final Answer :"
+_MARKER_RE = re.compile(
+    r"^[ \t]*(Question|Thought|Action[ \t]*Input|Action|Observation|Final[ \t]*Answer)[ \t]*:", re.M | re.I)
+_FINAL_LABEL_RE = re.compile(r"^[ \t]*Final[ \t]*Answer\b[ \t]*:?", re.M | re.I)
+_FENCE_RE = re.compile(r"^```[\w+-]*[ \t]*\n?(.*?)\n?```", re.S)
+_CALL_RE = re.compile(r"^(?P<name>[\w.-]+)\s*(?:\((?P<paren>.*)\)|\[(?P<bracket>.*)\]|:\s*(?P<colon>.+))$", re.S)
+_NAME_STRIP = " \t`'\"*[]().,:;"
+_QUOTES = ("\"", "'", "`")
+
+
+def _kind(match: re.Match) -> str:
+    """Canonical marker name: "question", "thought", "actioninput", "action", "observation", "finalanswer"."""
+    return re.sub(r"\s+", "", match.group(1).lower())
+
+
+def _balanced_end(text: str, start: int) -> Optional[int]:
+    """Index just past the bracket closing the `{`/`[` at `start`, or None while it is still open."""
+    depth, quote, escaped = 0, None, False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if quote:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == quote:
+                quote = None
+        elif ch in "\"'":
+            quote = ch
+        elif ch in "{[":
+            depth += 1
+        elif ch in "}]":
+            depth -= 1
+            if depth == 0:
+                return i + 1
+    return None
+
+
+class ReActStreamParser(AgentOutputParser):
+    """Finds where a ReAct step ends in a partial completion and parses it, repairing common slips.
+
+    Inputs of `multiline_tools` (e.g. Python code) run until the next ReAct line or a
+    closing code fence; other tools take a single line (or one balanced JSON value).
+    With `multi_action`, consecutive actions form one step and `parse` returns them as a
+    list, which the agent executor's async path runs concurrently (see `async_tools`).
+    """
+
+    tool_names: List[str] = []
+    multiline_tools: List[str] = []
+    multi_action: bool = False  # Several Action/Action Input pairs in one step are returned together
+
+    def __init__(self, tools: Sequence[Any] = (), multiline_tools: Iterable[str] = (), **kwargs: Any):
+        names = [getattr(tool, "name", tool) for tool in tools]
+        super().__init__(tool_names=names, multiline_tools=list(multiline_tools), **kwargs)
+
+    @property
+    def _type(self) -> str:
+        return "react-stream"
+
+    def config_key(self) -> str:
+        """Everything that changes where `find_end` cuts, for completion-cache keys."""
+        return json.dumps({"tools": self.tool_names, "multiline": sorted(self.multiline_tools),
+                           "multi_action": self.multi_action}, sort_keys=True)
+
+    # --- Step boundaries ---
+    def find_end(self, text: str) -> Optional[int]:
+        """Index at which the first complete step in `text` ends, or None if it is still open."""
+        markers = list(_MARKER_RE.finditer(text))
+        first = next((i for i, m in enumerate(markers) if _kind(m) in ("action", "finalanswer")), None)
+        if first is None:
+            return None
+        if _kind(markers[first]) == "finalanswer":
+            # The answer runs until the model starts another part (usually a made-up next Question)
+            return markers[first + 1].start() if first + 1 < len(markers) else None
+        end = self._action_end(text, markers, first)
+        while self.multi_action and end is not None:
+            # Further Action lines right after this one belong to the same step
+            following = next((i for i, m in enumerate(markers) if m.start() >= end), None)
+            gap = text[end:markers[following].start()] if following is not None else text[end:]
+            if gap.strip():
+                if "\n" in gap.lstrip() or not "action:".startswith(re.sub(r"\s+", "", gap.lower())):
+                    return end  # Something other than another action follows
+                return None  # The next line may still turn into "Action:"
+            if following is None:
+                return None
+            if _kind(markers[following]) != "action":
+                return end
+            end = self._action_end(text, markers, following)
+        return end
+
+    def _action_end(self, text: str, markers: List[re.Match], index: int) -> Optional[int]:
+        """End of the action whose `Action:` line is `markers[index]`, or None while it is still open."""
+        head, rest = markers[index], markers[index + 1:]
+        if not rest or _kind(rest[0]) != "actioninput":
+            if rest:
+                return rest[0].start()  # Moved on without an Action Input; let `parse` repair it
+            line_end = text.find("\n", head.end())
+            if line_end != -1 and _CALL_RE.match(text[head.end():line_end].strip(_NAME_STRIP[:3])):
+                return line_end  # `Action: tool(args)` on one line
+            return None
+        action_input, following = rest[0], rest[1:]
+        tool = self._match_tool(text[head.end():action_input.start()].strip())
+        limit = following[0].start() if following else len(text)
+        body_start = action_input.end()
+        while body_start < limit and text[body_start].isspace():
+            body_start += 1
+        if body_start < limit:
+            if text.startswith("```", body_start):
+                close = text.find("```", body_start + 3, limit)
+                if close != -1:
+                    return close + 3
+            elif text[body_start] in "{[" and tool not in self.multiline_tools:
+                end = _balanced_end(text, body_start)
+                if end is not None and end <= limit:
+                    return end
+            elif tool not in self.multiline_tools:
+                line_end = text.find("\n", body_start)
+                if line_end != -1 and line_end < limit:
+                    return line_end
+        return following[0].start() if following else None
+
+    # --- Parsing ---
+    def _match_tool(self, raw: str) -> str:
+        name = raw.strip().splitlines()[0].strip(_NAME_STRIP) if raw.strip() else ""
+        if not self.tool_names or name in self.tool_names:
+            return name
+        lowered = name.lower()
+        for candidate in self.tool_names:
+            if candidate.lower() == lowered:
+                return candidate
+        for candidate in self.tool_names:  # "use the get_weather tool", "get_weather function"
+            if re.search(rf"(?<![\w]){re.escape(candidate.lower())}(?![\w])", lowered):
+                return candidate
+        return name
+
+    def _clean_input(self, tool: str, raw: str) -> str:
+        value = raw.strip()
+        fenced = _FENCE_RE.match(value)
+        if fenced:
+            value = fenced.group(1).strip()
+        elif tool not in self.multiline_tools:
+            if value[:1] not in "{[":
+                value = value.splitlines()[0].strip() if value else ""
+            if len(value) >= 2 and value[0] == value[-1] and value[0] in _QUOTES:
+                value = value[1:-1].strip()
+        return value
+
+    def parse(self, text: str) -> Union[AgentAction, List[AgentAction], AgentFinish]:
+        end = self.find_end(text)
+        step = text if end is None else text[:end]  # Anything after a complete step is rambling
+        markers = list(_MARKER_RE.finditer(step))
+        final_label = _FINAL_LABEL_RE.search(step)
+        actions = [m for m in markers if _kind(m) == "action"]
+        if not actions or (final_label and final_label.start() < actions[0].start()):
+            if final_label:
+                return AgentFinish({"output": step[final_label.end():].strip()}, step)
+            answer = re.sub(r"^\s*Thought\s*:", "", step, flags=re.I).strip()
+            mentions_tool = any(name.lower() in answer.lower() for name in self.tool_names)
+            if answer and not markers and not mentions_tool:
+                return AgentFinish({"output": answer}, step)  # Answered without the label
+            raise OutputParserException(
+                f"Could not parse LLM output: `{text}`", observation=(
+                    "Invalid Format: write 'Action:' and 'Action Input:' lines, or 'Final Answer:'."),
+                llm_output=text, send_to_llm=True)
+        if not self.multi_action:
+            return self._parse_action(text, step, actions[0].start())
+        # One action per segment; each log is its own segment, so the scratchpad reads in order
+        bounds = [0] + [m.start() for m in actions[1:]] + [len(step)]
+        parsed = [self._parse_action(text, step[a:b], 0 if i == 0 else None)
+                  for i, (a, b) in enumerate(zip(bounds, bounds[1:]))]
+        return parsed if len(parsed) > 1 else parsed[0]
+
+    def _parse_action(self, text: str, segment: str, at: Optional[int] = None) -> AgentAction:
+        """The first action in `segment` (starting at `at` when known); `text` is for error messages."""
+        markers = [m for m in _MARKER_RE.finditer(segment) if at is None or m.start() >= at]
+        kinds = [_kind(m) for m in markers]
+        index = kinds.index("action")
+        action_at = markers[index]
+        following = markers[index + 1] if index + 1 < len(markers) else None
+        action_line = segment[action_at.end():following.start() if following else len(segment)]
+        if following is not None and kinds[index + 1] == "actioninput":
+            after = markers[index + 2].start() if index + 2 < len(markers) else len(segment)
+            tool = self._match_tool(action_line)
+            return AgentAction(tool, self._clean_input(tool, segment[following.end():after]), segment)
+        # No Action Input: `tool(args)`, `tool[args]`, `tool: args`, or the input on the next line
+        first_line, _, remainder = action_line.strip().partition("\n")
+        call = _CALL_RE.match(first_line.strip(_NAME_STRIP[:3]))
+        if call:
+            tool = self._match_tool(call.group("name"))
+            if tool in self.tool_names or not self.tool_names:
+                raw = next(g for g in (call.group("paren"), call.group("bracket"), call.group("colon")) if g is not None)
+                return AgentAction(tool, self._clean_input(tool, raw), segment)
+        tool = self._match_tool(first_line)
+        if remainder.strip():
+            return AgentAction(tool, self._clean_input(tool, remainder), segment)
+        raise OutputParserException(
+            f"Could not parse LLM output: `{text}`",
+            observation="Invalid Format: Missing 'Action Input:' after 'Action:'",
+            llm_output=text, send_to_llm=True)
+
+
+def cut_stream(tokens: Iterable[str], find_end: Callable[[str], Optional[int]]) -> Iterator[str]:
+    """Yields `tokens` until `find_end` reports a complete step, then closes the source.
+
+    The current partial line is held back: a step can end at the start of a line
+    that has not finished streaming yet (e.g. "Observation:").
+    """
+    tokens = iter(tokens)
+    text, sent = "", 0
+    try:
+        for token in tokens:
+            text += token
+            end = find_end(text)
+            if end is not None:
+                if end > sent:
+                    yield text[sent:end]
+                return
+            line_start = text.rfind("\n") + 1
+            if line_start > sent:
+                yield text[sent:line_start]
+                sent = line_start
+        if len(text) > sent:
+            yield text[sent:]
+    finally:
+        close = getattr(tokens, "close", None)
+        if close is not None:
+            close()  # Drops the HTTP stream, so Ollama stops decoding
+
+
+def early_stop_key(find_end: Callable[[str], Optional[int]]) -> str:
+    """Identifies an early-stop function in cache keys: a parser's configuration, or the function's name."""
+    parser = getattr(find_end, "__self__", None)
+    if isinstance(parser, ReActStreamParser):
+        return "react-stream:" + parser.config_key()
+    return f"{getattr(find_end, '__module__', '')}.{getattr(find_end, '__qualname__', repr(find_end))}"
+
+
+class StepMeter(BaseCallbackHandler):
+    """Callback handler recording generated tokens and wall time of every LLM call (agent step)."""
+
+    def __init__(self):
+        self.steps: List[Dict[str, float]] = []  # Most recent MAX_STEP_RECORDS steps
+        self._open: Dict[Any, float] = {}  # run_id -> start time
+        self._lock = threading.Lock()
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id, **kwargs: Any) -> None:
+        with self._lock:
+            self._open[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs: Any) -> None:
+        with self._lock:
+            started = self._open.pop(run_id, None)
+            if started is None:
+                return
+            text = "".join(g.text for gens in response.generations for g in gens)
+            self.steps.append({"tokens": estimate_tokens(text), "seconds": time.perf_counter() - started})
+            del self.steps[:-MAX_STEP_RECORDS]
+
+    def on_llm_error(self, error: BaseException, *, run_id, **kwargs: Any) -> None:
+        with self._lock:
+            self._open.pop(run_id, None)
+
+    def summary(self) -> Dict[str, float]:
+        with self._lock:
+            steps = list(self.steps)
+        if not steps:
+            return {"steps": 0, "tokens_per_step": 0.0, "seconds_per_step": 0.0}
+        return {"steps": len(steps),
+                "tokens_per_step": sum(s["tokens"] for s in steps) / len(steps),
+                "seconds_per_step": sum(s["seconds"] for s in steps) / len(steps)}
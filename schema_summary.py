@@ -0,0 +1,233 @@
+# schema_summary.py
+"""Token-budgeted dataset context for data-analysis prompts.
+
+The prompts used to carry `df.describe(include="all")` and a 5-row preview of
+every column. For a table with hundreds of columns that alone overflows
+TinyLlama's context, and prefill dominates latency. Instead, a dataset is
+reduced once to a *schema*: one catalog line per column (name, dtype, null %,
+cardinality, and its top values or range), plus a few sample values.
+`summarize_schema` then fits the schema into `SCHEMA_TOKEN_BUDGET` tokens:
+
+- columns are ranked by lexical relevance to the question. A column scores if
+  the question names it or shares words with its name, or mentions one of its
+  top values (so "sales in London" finds `City`);
+- catalog lines go in, most relevant first, while they fit. The remaining
+  columns are listed by name only, then a preview of the kept columns is
+  added if there is room.
+
+Schemas are computed when a dataset is stored (`dataset_store` keeps them in
+the profile JSON) or on first use. `SchemaCache` keeps them in memory by
+dataset hash, so a schema is built once per dataset, not once per question.
+"""
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+import pandas as pd
+
+from summary_memory import estimate_tokens
+
+# --- Configuration ---
+SCHEMA_TOKEN_BUDGET = int(os.environ.get("SCHEMA_TOKEN_BUDGET", "512"))  # Dataset context per prompt
+TOP_VALUES = 3  # Most frequent values shown per text column
+PREVIEW_ROWS = 5
+MAX_VALUE_CHARS = 24  # Longer values are cut in catalog lines and previews
+DEFAULT_CACHE_ENTRIES = 64
+
+_WORD_RE = re.compile(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|\d+")  # Also splits camelCase and snake_case
+
+
+# --- Building ---
+def _short(value: Any) -> str:
+    text = str(value)
+    return text if len(text) <= MAX_VALUE_CHARS else text[:MAX_VALUE_CHARS - 1] + "…"
+
+
+def _scalar(value: Any) -> Any:
+    return value.item() if hasattr(value, "item") else value
+
+
+def _number(value: Any) -> str:
+    if isinstance(value, float) and 1e4 <= abs(value) < 1e15 or isinstance(value, float) and value.is_integer():
+        return f"{value:.0f}"
+    return f"{value:.4g}" if isinstance(value, float) else str(value)
+
+
+def column_entry(name: str, dtype: str, rows: int, nulls: int, unique: Optional[int],
+                 top: List[tuple], low: Any = None, high: Any = None, mean: Optional[float] = None) -> dict:
+    """One catalog line; `top` is [(value, count)] and `low`/`high` the range of numeric or date columns."""
+    null_pct = 100.0 * nulls / rows if rows else 0.0
+    cardinality = f"{unique} unique" if unique is not None else "many unique"
+    line = f"- {name} ({dtype}, {null_pct:.0f}% null, {cardinality})"
+    if low is not None:
+        line += f": {_number(low)} .. {_number(high)}"
+        if mean is not None:
+            line += f", mean {_number(mean)}"
+    elif top:
+        non_null = (rows - nulls) or 1
+        if top[0][1] > 1:
+            line += ": top " + ", ".join(f"{_short(v)!r} {100.0 * c / non_null:.0f}%" for v, c in top)
+        else:  # Every value distinct (IDs, names, free text)
+            line += ": e.g. " + ", ".join(repr(_short(v)) for v, _ in top)
+    return {"name": name, "line": line, "tokens": estimate_tokens(line), "values": [str(v) for v, _ in top]}
+
+
+def schema_from_dataframe(df: pd.DataFrame) -> dict:
+    """The schema of an in-memory DataFrame (one pass per column)."""
+    rows = len(df)
+    columns = []
+    for name in df.columns:
+        series = df[name]
+        nulls = int(series.isna().sum())
+        values = series.dropna()
+        unique = int(values.nunique())
+        if not values.empty and (pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)):
+            mean = float(values.mean())
+            columns.append(column_entry(str(name), str(series.dtype), rows, nulls, unique, [],
+                                        _scalar(values.min()), _scalar(values.max()), mean))
+        elif not values.empty and pd.api.types.is_datetime64_any_dtype(series):
+            columns.append(column_entry(str(name), str(series.dtype), rows, nulls, unique, [],
+                                        values.min(), values.max()))
+        else:
+            top = list(values.astype(str).value_counts().head(TOP_VALUES).items())
+            columns.append(column_entry(str(name), str(series.dtype), rows, nulls, unique, top))
+    return {"rows": rows, "columns": columns, "sample": _sample(df.head(PREVIEW_ROWS))}
+
+
+def schema_from_scan(scan) -> dict:
+    """The schema of a `csv_ingest.CsvScan`, from its incremental statistics and sample."""
+    columns = []
+    for (name, stats), dtype in zip(scan.columns.items(), scan.dtypes.values()):
+        dtype = "category" if isinstance(dtype, pd.CategoricalDtype) else getattr(dtype, "__name__", str(dtype))
+        rows = stats.count + stats.nulls
+        if stats.kind in ("int", "float") and stats.min is not None:
+            columns.append(column_entry(str(name), dtype, rows, stats.nulls, stats.unique, [],
+                                        stats.min, stats.max, stats.mean))
+        else:
+            if stats.value_counts:
+                top = stats.value_counts.most_common(TOP_VALUES)
+            else:  # Too many distinct values to count exactly: take them from the sample
+                top = list(scan.sample[name].dropna().astype(str).value_counts().head(TOP_VALUES).items())
+            columns.append(column_entry(str(name), dtype, rows, stats.nulls, stats.unique, top))
+    return {"rows": scan.rows, "columns": columns, "sample": _sample(scan.sample.head(PREVIEW_ROWS))}
+
+
+def _sample(head: pd.DataFrame) -> Dict[str, List[str]]:
+    return {str(name): [_short(v) for v in head[name].astype(str)] for name in head.columns}
+
+
+# --- Ranking and rendering ---
+def _terms(text: str) -> set:
+    """Lower-cased words, a trailing plural "s" dropped, so "orders" matches `order_id`."""
+    words = (w.lower() for w in _WORD_RE.findall(text))
+    return {w[:-1] if len(w) > 3 and w.endswith("s") else w for w in words}
+
+
+def rank_columns(columns: List[dict], question: str) -> List[dict]:
+    """Columns by lexical relevance to `question`, ties (and no question) in table order."""
+    if not question.strip():
+        return list(columns)
+    asked = _terms(question)
+
+    def score(column: dict) -> float:
+        name_terms = _terms(column["name"])
+        value = 4.0 if name_terms and name_terms <= asked else 0.0  # Named in full
+        value += 2.0 * len(name_terms & asked)
+        value += sum(1.0 for v in column["values"] if _terms(v) and _terms(v) <= asked)
+        return value
+
+    scores = [score(column) for column in columns]
+    order = sorted(range(len(columns)), key=lambda i: -scores[i])
+    return [columns[i] for i in order]
+
+
+def summarize_schema(schema: dict, question: str = "", budget: int = SCHEMA_TOKEN_BUDGET) -> str:
+    """The dataset context for one prompt, within about `budget` tokens."""
+    columns = rank_columns(schema["columns"], question)
+    header = f"{schema['rows']} rows, {len(columns)} columns" + (", most relevant first" if question else "")
+    lines = [header + ":"]
+    left = budget - estimate_tokens(header)
+    if sum(column["tokens"] for column in columns) > left:
+        left -= left // 4  # Keep room to at least name the columns that get no catalog line
+    reserve = budget - estimate_tokens(header) - left
+    kept = []
+    for column in columns:
+        if column["tokens"] > left:
+            break
+        lines.append(column["line"])
+        kept.append(column["name"])
+        left -= column["tokens"]
+    rest = [column["name"] for column in columns[len(kept):]]
+    if rest:
+        left += reserve - 8  # Less the "Other columns: ... (+N more)" frame
+        listed = []
+        for name in rest:
+            cost = estimate_tokens(name) + 1
+            if cost > left:
+                break
+            listed.append(name)
+            left -= cost
+        more = f" (+{len(rest) - len(listed)} more)" if len(listed) < len(rest) else ""
+        lines.append(f"Other columns: {', '.join(listed)}{more}" if listed else f"{len(rest)} more columns not shown")
+        return "\n".join(lines)
+    preview = _preview(schema["sample"], kept, left)
+    if preview:
+        lines.append("\nFirst rows:\n" + preview)
+    return "\n".join(lines)
+
+
+def _preview(sample: Dict[str, List[str]], names: List[str], budget: int) -> str:
+    """The sample rows of `names`, dropping the least relevant columns until it fits `budget`."""
+    names = [name for name in names if name in sample]
+    while names:
+        text = pd.DataFrame({name: sample[name] for name in names}).to_string(index=False)
+        if estimate_tokens(text) <= budget:
+            return text
+        names.pop()
+    return ""
+
+
+class SchemaCache:
+    """LRU of dataset schemas keyed by dataset hash."""
+
+    def __init__(self, max_entries: int = DEFAULT_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0}
+
+    def get(self, key: str, build: Callable[[], dict]) -> dict:
+        """The schema stored under `key`, calling `build()` on a miss."""
+        with self._lock:
+            schema = self._entries.get(key)
+            if schema is not None:
+                self._entries.move_to_end(key)
+                self._counters["hits"] += 1
+                return schema
+            self._counters["misses"] += 1
+        schema = build()  # Outside the lock: a first build over a wide table can take a while
+        with self._lock:
+            self._entries[key] = schema
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return schema
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._counters, entries=len(self._entries))
+
+
+# --- Shared cache ---
+_shared_cache: Optional[SchemaCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_schema_cache() -> SchemaCache:
+    """Returns the process-wide schema cache."""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = SchemaCache()
+        return _shared_cache
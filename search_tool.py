@@ -0,0 +1,216 @@
+# search_tool.py
+"""Cached, de-duplicated and concurrent web search for the agents.
+
+`llama_duckduckgo.py` used to call `DuckDuckGoSearchResults().run` on every agent
+iteration. Each call was a fresh, blocking network round-trip, even when TinyLlama
+repeated the query with different casing or punctuation. `SearchService` sits
+between the tool and a pluggable backend:
+- results are cached for `ttl` seconds, keyed on the normalized query;
+- identical searches already in flight are joined (single-flight), not repeated;
+- `search_many` fans several query variants out over a thread pool and merges
+  the results, dropping duplicate links. A query that fails costs only its own
+  results.
+
+Backends are callables `(query, max_results) -> [{"snippet", "title", "link"}, ...]`.
+`DuckDuckGoBackend` goes to the network. `FixtureBackend` answers from a JSON
+file or dict, so the agent can run offline: set `SEARCH_FIXTURES=path.json` for
+the shared service.
+"""
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from langchain_core.tools import Tool
+
+# --- Configuration ---
+DEFAULT_TTL = 3600.0  # Seconds a result stays fresh
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_MAX_RESULTS = 4
+DEFAULT_WORKERS = 4
+SEARCH_FIXTURES = os.environ.get("SEARCH_FIXTURES")  # JSON fixture file for offline runs
+NO_RESULTS = "No good DuckDuckGo Search Result was found"
+_QUERY_SEPARATOR_RE = re.compile(r"\s*(?:\||\n)\s*")
+_FILLER_WORDS = {"what", "whats", "is", "are", "was", "the", "a", "an", "of", "in", "me", "tell", "please",
+                 "who", "how", "does", "do", "can", "you", "find", "search", "for", "about", "current"}
+
+Result = Dict[str, str]
+Backend = Callable[[str, int], List[Result]]
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase words only, so `"Weather in Munich?"` and `weather  in munich` share a cache entry.
+
+    Trailing `+` and `#` stay part of a word, so "C++", "C#" and "C" remain different queries.
+    """
+    return " ".join(re.findall(r"\w+[+#]*", query.lower()))
+
+
+def keyword_variants(query: str) -> List[str]:
+    """The query without question filler (`"What is the capital of Germany?"` -> `"capital germany"`)."""
+    words = normalize_query(query).split()
+    keywords = [w for w in words if w not in _FILLER_WORDS]
+    return [" ".join(keywords)] if keywords and len(keywords) < len(words) else []
+
+
+def format_results(results: Sequence[Result]) -> str:
+    """The `DuckDuckGoSearchResults` string format the agent prompt was written for."""
+    if not results:
+        return NO_RESULTS
+    return ", ".join(", ".join(f"{k}: {v}" for k, v in result.items()) for result in results)
+
+
+class DuckDuckGoBackend:
+    """Live DuckDuckGo text search (needs the `duckduckgo-search` package)."""
+
+    def __init__(self, source: str = "text"):
+        from langchain_community.utilities import DuckDuckGoSearchAPIWrapper
+        self.wrapper = DuckDuckGoSearchAPIWrapper()
+        self.source = source
+
+    def __call__(self, query: str, max_results: int) -> List[Result]:
+        return self.wrapper.results(query, max_results, source=self.source)
+
+
+class FixtureBackend:
+    """Canned results keyed by normalized query; unknown queries return nothing."""
+
+    def __init__(self, fixtures: Union[str, Dict[str, List[Result]]]):
+        if isinstance(fixtures, str):
+            with open(fixtures, encoding="utf-8") as f:
+                fixtures = json.load(f)
+        self.fixtures = {normalize_query(query): results for query, results in fixtures.items()}
+        self.calls: List[str] = []  # Queries that reached the backend, for assertions
+
+    def __call__(self, query: str, max_results: int) -> List[Result]:
+        self.calls.append(query)
+        return list(self.fixtures.get(normalize_query(query), []))[:max_results]
+
+
+class SearchService:
+    """TTL cache plus single-flight de-duplication in front of a search backend."""
+
+    def __init__(self, backend: Backend, ttl: float = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_results: int = DEFAULT_MAX_RESULTS, workers: int = DEFAULT_WORKERS):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_results = max_results
+        self._entries: "OrderedDict[str, Tuple[float, List[Result]]]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="search")
+        self._counters = {"hits": 0, "misses": 0, "coalesced": 0, "errors": 0, "expired": 0}
+
+    def search(self, query: str) -> List[Result]:
+        """Results for `query`: cached, joined to an identical running search, or fetched."""
+        key = normalize_query(query)
+        if not key:
+            return []
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if time.monotonic() - entry[0] < self.ttl:
+                    self._entries.move_to_end(key)
+                    self._counters["hits"] += 1
+                    return list(entry[1])
+                del self._entries[key]
+                self._counters["expired"] += 1
+            future = self._inflight.get(key)
+            if future is not None:
+                self._counters["coalesced"] += 1
+                leader = False
+            else:
+                future = self._inflight[key] = Future()
+                self._counters["misses"] += 1
+                leader = True
+        if not leader:
+            return list(future.result())
+        try:
+            results = self.backend(query, self.max_results)
+        except Exception as e:
+            with self._lock:
+                self._counters["errors"] += 1
+                del self._inflight[key]
+            future.set_exception(e)  # Failures reach every waiter but are not cached
+            raise
+        with self._lock:
+            self._entries[key] = (time.monotonic(), list(results))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            del self._inflight[key]
+        future.set_result(results)
+        return list(results)
+
+    def _search_or_error(self, query: str) -> Tuple[List[Result], Optional[Exception]]:
+        try:
+            return self.search(query), None
+        except Exception as e:
+            return [], e
+
+    def search_many(self, queries: Sequence[str]) -> List[Result]:
+        """Searches the distinct `queries` concurrently; results in query order, duplicate links dropped.
+
+        Queries that fail are skipped; only when every one fails is the first error raised.
+        """
+        distinct = list(OrderedDict((normalize_query(q), q) for q in queries if normalize_query(q)).values())
+        if len(distinct) <= 1:
+            return self.search(distinct[0]) if distinct else []
+        outcomes = list(self._pool.map(self._search_or_error, distinct))
+        errors = [error for _, error in outcomes if error is not None]
+        if len(errors) == len(outcomes):
+            raise errors[0]
+        merged, seen = [], set()
+        for results, _ in outcomes:
+            for result in results:
+                link = result.get("link") or json.dumps(result, sort_keys=True)
+                if link not in seen:
+                    seen.add(link)
+                    merged.append(result)
+        return merged
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._counters, entries=len(self._entries), inflight=len(self._inflight))
+        lookups = stats["hits"] + stats["misses"] + stats["coalesced"]
+        stats["hit_rate"] = (stats["hits"] + stats["coalesced"]) / lookups if lookups else 0.0
+        return stats
+
+
+def make_search_tool(service: SearchService, name: str = "duckduck",
+                     description: str = "A web search engine. Use this to as a search engine for general queries.",
+                     variants: Optional[Callable[[str], List[str]]] = None) -> Tool:
+    """Agent tool over `service`. Inputs with several queries ("a | b", one per line) fan out
+    concurrently, as do the extra queries `variants(query)` returns."""
+    def search(query: str) -> str:
+        queries = [q for q in _QUERY_SEPARATOR_RE.split(query.strip().strip("\"'")) if q]
+        if variants is not None:
+            queries += [v for q in list(queries) for v in variants(q)]
+        try:
+            return format_results(service.search_many(queries))
+        except Exception as e:  # An observation the agent can react to, not a crashed run
+            return f"Search failed: {type(e).__name__}: {e}"
+    return Tool(name=name, func=search, description=description)
+
+
+# --- Shared service ---
+_shared_service: Optional[SearchService] = None
+_shared_lock = threading.Lock()
+
+
+def get_search_service() -> SearchService:
+    """Returns the process-wide service (DuckDuckGo, or `SEARCH_FIXTURES` when set)."""
+    global _shared_service
+    with _shared_lock:
+        if _shared_service is None:
+            backend = FixtureBackend(SEARCH_FIXTURES) if SEARCH_FIXTURES else DuckDuckGoBackend()
+            _shared_service = SearchService(backend)
+        return _shared_service
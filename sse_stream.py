@@ -0,0 +1,77 @@
+# sse_stream.py
+"""Server-Sent Events helpers shared by the Flask web apps.
+
+`stream_events` turns an LLM token stream into a sequence of events: every token
+is forwarded as it arrives, and as soon as the closing fence of the first code
+block has streamed the code is handed to an executor, so execution overlaps with
+the rest of the generation instead of waiting for the full completion.
+"""
+import json
+import re
+from concurrent.futures import Executor
+from typing import Callable, Iterable, Iterator, Optional, Tuple, Union
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",  # Stop reverse proxies (nginx) from buffering the stream
+}
+
+
+def sse_event(event: str, data) -> str:
+    """Formats one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class CodeBlockWatcher:
+    """Detects the first complete fenced code block in an incrementally growing text."""
+
+    def __init__(self, pattern: str):
+        self.pattern = re.compile(pattern, re.DOTALL)
+        self.text = ""
+        self.code: Optional[str] = None
+
+    def feed(self, token: str) -> Optional[str]:
+        """Appends `token`; returns the code the first time a block becomes complete."""
+        self.text += token
+        # A block can only complete on a token that contains part of a fence
+        if self.code is None and "`" in token:
+            match = self.pattern.search(self.text)
+            if match:
+                self.code = match.group(1)
+                return self.code
+        return None
+
+
+def _result_payload(result: Union[str, dict]) -> dict:
+    return dict(result) if isinstance(result, dict) else {"output": result}
+
+
+def stream_events(tokens: Iterable[str], code_pattern: str, run_code: Callable[[str], Union[str, dict]],
+                  executor: Executor, no_code_message: str) -> Iterator[Tuple[str, dict]]:
+    """Yields `(event, payload)` pairs for a streamed completion.
+
+    Events: `token` per streamed token, `code` when the first code block closes,
+    `result` when its execution finishes, and a final `done` with the full
+    response, code and execution output. `run_code` returns the output text, or
+    a dict with `output` and extra fields (e.g. `plots`) that `result` and
+    `done` carry too.
+    """
+    watcher = CodeBlockWatcher(code_pattern)
+    future = None
+    result = None
+    for token in tokens:
+        yield "token", {"text": token}
+        code = watcher.feed(token)
+        if code is not None:
+            yield "code", {"code": code}
+            future = executor.submit(run_code, code)
+        if future is not None and result is None and future.done():
+            result = _result_payload(future.result())
+            yield "result", result
+    if future is None:
+        result = {"output": no_code_message}
+        yield "result", result
+    elif result is None:
+        result = _result_payload(future.result())
+        yield "result", result
+    yield "done", {"response": watcher.text, "code": watcher.code or "", **result}
@@ -0,0 +1,245 @@
+# summary_memory.py
+"""Token-budgeted conversation memory with a rolling summary.
+
+`ConversationBufferMemory` pastes every earlier turn into `{history}`, so the
+prompt, and with it prefill time, grows each turn until TinyLlama's 2k context
+overflows. `RollingSummaryMemory` keeps the last `keep_turns` turns verbatim.
+Older turns are folded into a running summary by the LLM on a background thread,
+off the request path. The rendered history never exceeds `max_tokens`: until a
+summary update lands, turns waiting to be summarized are shown only as far as
+the budget allows. Each turn's token counts are recorded in `turn_stats`.
+
+It is a drop-in replacement for `ConversationBufferMemory` in `ConversationChain`
+and agents (`memory_key`, `return_messages`, `human_prefix`/`ai_prefix`,
+`input_key`/`output_key`).
+"""
+import math
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.language_models import BaseLanguageModel
+from langchain_core.memory import BaseMemory
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from pydantic import PrivateAttr
+
+# --- Configuration ---
+DEFAULT_MAX_TOKENS = 512  # Budget of the whole {history} block
+DEFAULT_KEEP_TURNS = 3
+DEFAULT_SUMMARY_TOKENS = 160
+SUMMARY_PROMPT = """Progressively summarize the conversation, adding onto the previous summary.
+Keep names, numbers and facts the human stated. Reply with the new summary only, in at most {words} words.
+
+Current summary:
+{summary}
+
+New lines of conversation:
+{lines}
+
+New summary:"""
+
+SUMMARY_LABEL = "Summary of the earlier conversation: "
+
+_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate Llama (SentencePiece) token count: words split into ~4-character pieces."""
+    return sum(math.ceil(len(piece) / 4) for piece in _PIECE_RE.findall(text))
+
+
+def truncate_tokens(text: str, budget: int, keep_end: bool = False) -> str:
+    """Cuts `text` to about `budget` tokens at a piece boundary, keeping the start (or the end)."""
+    if budget <= 0:
+        return ""
+    if estimate_tokens(text) <= budget:
+        return text
+    pieces = list(_PIECE_RE.finditer(text))
+    if keep_end:
+        pieces.reverse()
+    budget -= 1  # Room for the "…" marking the cut
+    used = 0
+    for i, match in enumerate(pieces):
+        used += math.ceil(len(match.group()) / 4)
+        if used > budget:
+            if keep_end:
+                return "…" + text[pieces[i - 1].start():] if i else ""
+            return text[:match.start()].rstrip() + "…"
+    return text
+
+
+class RollingSummaryMemory(BaseMemory):
+    """Last `keep_turns` turns verbatim plus a background-updated summary, within `max_tokens`."""
+
+    llm: Optional[BaseLanguageModel] = None  # Summarizer; without it older turns are clipped extractively
+    max_tokens: int = DEFAULT_MAX_TOKENS
+    keep_turns: int = DEFAULT_KEEP_TURNS
+    summary_tokens: int = DEFAULT_SUMMARY_TOKENS
+    memory_key: str = "history"
+    return_messages: bool = False
+    human_prefix: str = "Human"
+    ai_prefix: str = "AI"
+    input_key: Optional[str] = None
+    output_key: Optional[str] = None
+    token_counter: Callable[[str], int] = estimate_tokens
+    turn_stats: List[Dict[str, int]] = []  # Most recent `max_turn_stats` turns
+    max_turn_stats: int = 1000
+
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _summarizer: ThreadPoolExecutor = PrivateAttr(
+        default_factory=lambda: ThreadPoolExecutor(max_workers=1, thread_name_prefix="memory-summary"))
+    _summary: str = PrivateAttr(default="")
+    _pending: List[Tuple[str, str]] = PrivateAttr(default_factory=list)  # Waiting to be summarized
+    _turns: List[Tuple[str, str]] = PrivateAttr(default_factory=list)  # Verbatim
+    _future: Optional[Future] = PrivateAttr(default=None)
+    _running: bool = PrivateAttr(default=False)  # A summary job is queued or running
+    _summarized_turns: int = PrivateAttr(default=0)
+    _loads: int = PrivateAttr(default=0)
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    @property
+    def summary(self) -> str:
+        return self._summary
+
+    def _format(self, turns: List[Tuple[str, str]]) -> str:
+        return "\n".join(f"{self.human_prefix}: {human}\n{self.ai_prefix}: {ai}" for human, ai in turns)
+
+    # --- Reading ---
+    def _fit(self) -> Tuple[str, List[Tuple[str, str]], str]:
+        """(summary, verbatim turns, not-yet-summarized lines) trimmed to `max_tokens` in total."""
+        with self._lock:
+            summary, pending, turns = self._summary, list(self._pending), list(self._turns)
+        count = self.token_counter
+        summary = truncate_tokens(summary, min(self.summary_tokens, self.max_tokens))
+        budget = self.max_tokens - (count(SUMMARY_LABEL + summary) if summary else 0)
+        # The newest turns matter most: fit them first, oldest verbatim turns go first
+        kept: List[Tuple[str, str]] = []
+        for turn in reversed(turns):
+            cost = count(self._format([turn]))
+            if cost > budget:
+                if not kept:  # Always keep (part of) the latest turn
+                    human = truncate_tokens(turn[0], budget // 2)
+                    room = budget - count(self._format([(human, "")]))
+                    kept.append((human, truncate_tokens(turn[1], room)))
+                    budget = 0
+                break
+            kept.append(turn)
+            budget -= cost
+        kept.reverse()
+        # Turns still being summarized fill whatever is left, newest first
+        backlog = truncate_tokens(self._format(pending), budget, keep_end=True) if pending and budget > 0 else ""
+        return summary, kept, backlog
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        summary, turns, backlog = self._fit()
+        if self.return_messages:
+            history: Any = []
+            if summary or backlog:
+                history.append(SystemMessage(content="\n".join(p for p in (summary, backlog) if p)))
+            for human, ai in turns:
+                history += [HumanMessage(content=human), AIMessage(content=ai)]
+            text = "\n".join(str(m.content) for m in history)
+        else:
+            parts = []
+            if summary:
+                parts.append(SUMMARY_LABEL + summary)
+            if backlog:
+                parts.append(backlog)
+            if turns:
+                parts.append(self._format(turns))
+            history = text = "\n".join(parts)
+        user_input = inputs.get(self.input_key) if self.input_key else next(
+            (v for k, v in inputs.items() if k not in (self.memory_key, "stop") and isinstance(v, str)), "")
+        self._loads += 1
+        self.turn_stats.append({
+            "turn": self._loads,
+            "history_tokens": self.token_counter(text),
+            "input_tokens": self.token_counter(user_input or ""),
+            "summary_tokens": self.token_counter(summary),
+            "verbatim_turns": len(turns),
+            "summarized_turns": self._summarized_turns,
+        })
+        del self.turn_stats[:-self.max_turn_stats]
+        return {self.memory_key: history}
+
+    # --- Writing ---
+    def _input_output(self, inputs: Dict[str, Any], outputs: Dict[str, Any]) -> Tuple[str, str]:
+        if self.input_key is None:
+            keys = [k for k in inputs if k not in (self.memory_key, "stop")]
+            if len(keys) != 1:
+                raise ValueError(f"One input key expected got {keys}")
+            input_key = keys[0]
+        else:
+            input_key = self.input_key
+        if self.output_key is None:
+            if len(outputs) == 1:
+                output_key = next(iter(outputs))
+            elif "output" in outputs:
+                output_key = "output"
+            else:
+                raise ValueError(f"Got multiple output keys: {outputs.keys()}, please set 'output_key'.")
+        else:
+            output_key = self.output_key
+        return str(inputs[input_key]), str(outputs[output_key])
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        turn = self._input_output(inputs, outputs)
+        with self._lock:
+            self._turns.append(turn)
+            overflow = len(self._turns) - self.keep_turns
+            if overflow > 0:
+                self._pending += self._turns[:overflow]
+                del self._turns[:overflow]
+            if self._pending and not self._running:
+                self._running = True
+                self._future = self._summarizer.submit(self._summarize)
+
+    def _summarize(self):
+        """Background: folds the pending turns into the summary until none are left."""
+        while True:
+            with self._lock:
+                batch, summary = list(self._pending), self._summary
+                if not batch:
+                    self._running = False
+                    return
+            try:
+                new_summary = self._fold(summary, batch)
+            except Exception:
+                new_summary = self._fold_extractive(summary, batch)  # Never lose turns over a failed call
+            with self._lock:
+                self._summary = truncate_tokens(new_summary.strip(), self.summary_tokens, keep_end=self.llm is None)
+                del self._pending[:len(batch)]
+                self._summarized_turns += len(batch)
+
+    def _fold(self, summary: str, batch: List[Tuple[str, str]]) -> str:
+        if self.llm is None:
+            return self._fold_extractive(summary, batch)
+        prompt = SUMMARY_PROMPT.format(words=int(self.summary_tokens * 0.7), summary=summary or "(none)",
+                                       lines=self._format(batch))
+        result = self.llm.invoke(prompt)
+        return getattr(result, "content", result)
+
+    def _fold_extractive(self, summary: str, batch: List[Tuple[str, str]]) -> str:
+        lines = [f"{self.human_prefix} said: {truncate_tokens(human, 24)} "
+                 f"{self.ai_prefix} replied: {truncate_tokens(ai, 16)}" for human, ai in batch]
+        return " ".join([summary] + lines if summary else lines)
+
+    def wait(self, timeout: Optional[float] = None):
+        """Blocks until the background summary has caught up (for tests and shutdown)."""
+        future = self._future
+        if future is not None:
+            future.result(timeout)
+
+    def clear(self) -> None:
+        self.wait()
+        with self._lock:
+            self._summary = ""
+            self._pending.clear()
+            self._turns.clear()
+            self._summarized_turns = 0
+        self.turn_stats.clear()
+        self._loads = 0
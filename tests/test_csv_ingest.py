@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+from csv_ingest import read_csv_bounded, scan_csv
+
+
+def test_floats_are_narrowed_only_without_loss(tmp_path):
+    path = tmp_path / "data.csv"
+    pd.DataFrame({
+        "price": [19.99, 5.5, 100.25],
+        "latitude": [51.50735091, 40.7127753, 48.856614],
+        "account": [1234567890.0, 2345678901.5, 3456789012.25],
+    }).to_csv(path, index=False)
+
+    dtypes = scan_csv(str(path)).dtypes
+    assert dtypes["price"] == np.float32
+    assert dtypes["latitude"] == np.float64
+    assert dtypes["account"] == np.float64
+
+    df, _ = read_csv_bounded(str(path), memory_budget=1024 * 1024)
+    assert df["latitude"].tolist() == [51.50735091, 40.7127753, 48.856614]
+    assert df["account"].iloc[0] == 1234567890.0
@@ -0,0 +1,40 @@
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from embedding_pipeline import BatchedEmbeddings, EmbeddingCache
+
+
+class FakeClient:
+    def __init__(self):
+        self.calls = 0
+
+    def embed(self, texts, model=None):
+        self.calls += 1
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+def count_rows(cache):
+    return cache._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+def test_queries_stay_out_of_the_persistent_cache(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite"))
+    embeddings = BatchedEmbeddings(cache=cache, query_cache_size=2)
+    embeddings.client = FakeClient()
+
+    embeddings.embed_documents(["indexed chunk"])
+    assert count_rows(cache) == 1
+
+    assert embeddings.embed_query("a one-off question") == [18.0, 1.0]
+    assert embeddings.embed_query("a one-off question") == [18.0, 1.0]
+    assert embeddings.client.calls == 2  # The repeat came from memory
+    assert count_rows(cache) == 1
+
+    # A query that matches an indexed chunk is read from disk
+    embeddings.embed_query("indexed chunk")
+    assert embeddings.client.calls == 2
+
+    # The in-memory tier is bounded
+    embeddings.embed_query("another question")
+    assert len(embeddings._query_cache) == 2
@@ -0,0 +1,45 @@
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("pyarrow")
+
+from code_executor import ExecutionService, share_dataframe
+from execution_cache import ExecutionCache, cached_run
+
+
+@pytest.fixture(scope="module")
+def executor():
+    service = ExecutionService(workers=2)
+    yield service
+    service.shutdown()
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    return share_dataframe(pd.DataFrame({"Age": [20, 40, 60]}), directory=str(tmp_path))
+
+
+def test_session_that_reassigned_df_bypasses_the_cache(executor, dataset):
+    cache = ExecutionCache()
+    read = "print(df['Age'].mean())"
+
+    first = cached_run(cache, executor, read, dataset_path=dataset, session="A")
+    assert first["stdout"].strip() == "40.0"
+
+    cached_run(cache, executor, "df = df[df.Age > 30]", dataset_path=dataset, session="B")
+    second = cached_run(cache, executor, read, dataset_path=dataset, session="B")
+    assert second["stdout"].strip() == "50.0"
+    assert not second.get("cached")
+
+    # A clean session still gets the memoized result
+    third = cached_run(cache, executor, read, dataset_path=dataset, session="C")
+    assert third["stdout"].strip() == "40.0"
+    assert third.get("cached")
+
+
+def test_forgotten_session_uses_the_cache_again(dataset):
+    cache = ExecutionCache()
+    cache.mark_dirty("A")
+    assert cache.is_dirty("A")
+    cache.forget_session("A")
+    assert not cache.is_dirty("A")
@@ -0,0 +1,46 @@
+import hashlib
+
+import pytest
+
+pytest.importorskip("langchain")
+
+from ingest import ingest_directory
+from rag_index import PersistentVectorIndex
+
+
+class HashEmbeddings:
+    """Deterministic embeddings, so no model is needed."""
+
+    model = "hash"
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return [byte / 255 for byte in digest[:16]]
+
+
+def write_corpus(root, files):
+    root.mkdir()
+    for name, text in files.items():
+        (root / name).write_text(text)
+    return str(root)
+
+
+def test_second_root_does_not_prune_the_first(tmp_path):
+    index = PersistentVectorIndex(HashEmbeddings(), persist_directory=str(tmp_path / "index"), backend="numpy")
+    first = write_corpus(tmp_path / "first", {"a.txt": "Alpha document.", "b.txt": "Bravo document."})
+    second = write_corpus(tmp_path / "second", {"c.txt": "Charlie document."})
+
+    ingest_directory(first, index, workers=1)
+    stats = ingest_directory(second, index, workers=1)
+
+    assert stats["removed"] == 0
+    assert sorted(index.sources) == ["a.txt", "b.txt", "c.txt"]
+
+    # Pruning still removes files that disappeared from the root being ingested
+    (tmp_path / "first" / "b.txt").unlink()
+    stats = ingest_directory(first, index, workers=1)
+    assert stats["files_skipped"] == 1
+    assert sorted(index.sources) == ["a.txt", "c.txt"]
@@ -0,0 +1,35 @@
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from weather_routes import make_router
+
+
+@pytest.fixture(scope="module")
+def router():
+    return make_router()
+
+
+@pytest.mark.parametrize("query", [
+    "Is it true that Paris is in France?",
+    "Is it safe in Rome?",
+    "How old is it in Rome?",
+    "Is it sunny in Rome? Who was Caesar?",
+    "Is it cold in Stockholm and who lives there?",
+    "What is the temperature at which water boils?",
+    "Write a poem about the rain in Paris.",
+])
+def test_near_misses_reach_the_llm(router, query):
+    assert router.route(query) is None
+
+
+@pytest.mark.parametrize("query, city", [
+    ("What is the weather like in London?", "London"),
+    ("Do I need an umbrella in Berlin?", "Berlin"),
+    ("Is it foggy in San Francisco?", "San Francisco"),
+])
+def test_weather_questions_are_routed(router, query, city):
+    route, tool_input, confidence = router.route(query)
+    assert route.tool == "get_weather"
+    assert tool_input == city
+    assert confidence >= router.threshold
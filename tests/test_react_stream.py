@@ -0,0 +1,130 @@
+import pytest
+
+pytest.importorskip("langchain")
+
+from langchain_core.agents import AgentAction, AgentFinish
+from langchain_core.exceptions import OutputParserException
+
+from react_stream import ReActStreamParser, cut_stream, early_stop_key
+
+TOOLS = ["get_weather", "python_repl"]
+
+
+@pytest.fixture
+def parser():
+    return ReActStreamParser(TOOLS, multiline_tools=["python_repl"])
+
+
+def action(result):
+    assert isinstance(result, AgentAction)
+    return result.tool, result.tool_input
+
+
+# --- Slips `parse` repairs ---
+@pytest.mark.parametrize("text", [
+    "Thought: check\nAction: get_weather(Paris)",
+    "Thought: check\nAction: get_weather[Paris]",
+    "Thought: check\nAction: get_weather: Paris",
+])
+def test_call_syntax_without_action_input(parser, text):
+    assert action(parser.parse(text)) == ("get_weather", "Paris")
+
+
+@pytest.mark.parametrize("name", [
+    "`get_weather`", "\"get_weather\"", "[get_weather]", "Get_Weather", "use the get_weather tool",
+])
+def test_tool_name_variants(parser, name):
+    assert action(parser.parse(f"Action: {name}\nAction Input: Paris")) == ("get_weather", "Paris")
+
+
+@pytest.mark.parametrize("raw", ["\"Paris\"", "'Paris'", "`Paris`", "```\nParis\n```"])
+def test_wrapped_inputs(parser, raw):
+    assert action(parser.parse(f"Action: get_weather\nAction Input: {raw}")) == ("get_weather", "Paris")
+
+
+def test_fenced_code_input_keeps_all_lines(parser):
+    text = "Action: python_repl\nAction Input: ```python\nx = 1\nprint(x)\n```"
+    assert action(parser.parse(text)) == ("python_repl", "x = 1\nprint(x)")
+
+
+def test_action_before_final_answer_wins(parser):
+    text = "Action: get_weather\nAction Input: Paris\nFinal Answer: sunny"
+    assert action(parser.parse(text)) == ("get_weather", "Paris")
+
+
+def test_final_answer_before_action_wins(parser):
+    result = parser.parse("Final Answer: sunny\nAction: get_weather\nAction Input: Paris")
+    assert isinstance(result, AgentFinish)
+    assert result.return_values["output"] == "sunny"
+
+
+def test_unlabelled_answer_is_final(parser):
+    result = parser.parse("Paris is the capital of France.")
+    assert isinstance(result, AgentFinish)
+    assert result.return_values["output"] == "Paris is the capital of France."
+
+
+def test_unlabelled_text_mentioning_a_tool_is_an_error(parser):
+    with pytest.raises(OutputParserException):
+        parser.parse("I should call get_weather for this.")
+
+
+def test_made_up_observation_is_ignored(parser):
+    text = "Action: get_weather\nAction Input: Paris\nObservation: sunny\nFinal Answer: sunny"
+    assert action(parser.parse(text)) == ("get_weather", "Paris")
+
+
+def test_multi_action_step_returns_every_action():
+    parser = ReActStreamParser(TOOLS, multi_action=True)
+    result = parser.parse("Action: get_weather\nAction Input: Paris\nAction: get_weather\nAction Input: Rome\n"
+                          "Observation: made up")
+    assert [(a.tool, a.tool_input) for a in result] == [("get_weather", "Paris"), ("get_weather", "Rome")]
+
+
+# --- Step boundaries ---
+def test_find_end_waits_for_the_input_line(parser):
+    assert parser.find_end("Action: get_weather\nAction Input: Par") is None
+    text = "Action: get_weather\nAction Input: Paris\nObservation: made up"
+    assert text[:parser.find_end(text)] == "Action: get_weather\nAction Input: Paris"
+
+
+def test_find_end_multiline_input_runs_to_the_next_marker(parser):
+    text = "Action: python_repl\nAction Input: x = 1\nprint(x)\n"
+    assert parser.find_end(text) is None
+    end = parser.find_end(text + "Observation: 1")
+    assert end == len(text)
+
+
+def test_find_end_for_final_answer(parser):
+    assert parser.find_end("Final Answer: sunny") is None
+    text = "Final Answer: sunny\nQuestion: next"
+    assert text[:parser.find_end(text)] == "Final Answer: sunny\n"
+
+
+def test_find_end_balanced_json_input(parser):
+    text = 'Action: get_weather\nAction Input: {"city": "Paris"}'
+    assert parser.find_end(text) == len(text)
+
+
+def test_cut_stream_stops_after_the_step(parser):
+    closed = []
+
+    def tokens():
+        try:
+            yield from ["Action: get_weather\n", "Action Input: Paris\n", "Observation: made up\n", "more"]
+        finally:
+            closed.append(True)
+
+    assert "".join(cut_stream(tokens(), parser.find_end)) == "Action: get_weather\nAction Input: Paris"
+    assert closed
+
+
+# --- Cache keys ---
+def test_early_stop_key_depends_on_parser_configuration():
+    single = ReActStreamParser(TOOLS, multiline_tools=["python_repl"])
+    multi = ReActStreamParser(TOOLS, multiline_tools=["python_repl"], multi_action=True)
+    plain = ReActStreamParser(TOOLS)
+    keys = {early_stop_key(p.find_end) for p in (single, multi, plain)}
+    assert len(keys) == 3
+    assert early_stop_key(single.find_end) == early_stop_key(
+        ReActStreamParser(TOOLS, multiline_tools=["python_repl"]).find_end)
@@ -0,0 +1,465 @@
+# tracing.py
+"""Per-step traces and Prometheus metrics for the agents, LLM calls, tools and web apps.
+
+`verbose=True` shows what an agent did but not where a slow query spent its
+time. With `AGENT_TRACING=1`, `TracingHandler` follows every LangChain run of a
+query and records one span per agent step: an LLM call plus the tool calls its
+action triggered. Each step span carries:
+- estimated prompt and completion tokens;
+- LLM latency, split into time to first token and decode time;
+- whether the completion came from the completion cache;
+- every tool call with its latency and error;
+- whether the step failed to parse.
+
+When the query finishes, its step spans and one trace summary are appended to
+`AGENT_TRACE_FILE` as JSONL. The same numbers feed counters and histograms,
+which `render()` prints in the Prometheus text format. The Flask apps serve it
+on `/metrics` (`instrument_flask`). Command-line agents can expose it with
+`METRICS_PORT=9100`. `code_executor` and `execution_cache` report job, queue
+wait and cache-hit metrics.
+
+Tracing is off by default. In that case `callbacks()` returns no handler, so
+LangChain has nothing extra to call, `trace_stream` returns the stream
+unchanged, and the other hooks return after checking `enabled`.
+"""
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from summary_memory import estimate_tokens
+
+# --- Configuration ---
+TRACING_ENABLED = os.environ.get("AGENT_TRACING", "") not in ("", "0", "false")
+TRACE_FILE = os.environ.get("AGENT_TRACE_FILE", "traces.jsonl")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))  # 0: no standalone /metrics server
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+MAX_LOGGED_CHARS = 500  # Queries, tool inputs and errors are cut to this in the trace file
+
+# name -> (type, help); every metric the hooks record
+METRICS = {
+    "agent_queries_total": ("counter", "Agent queries by outcome."),
+    "agent_query_seconds": ("histogram", "End-to-end agent query latency."),
+    "agent_steps_total": ("counter", "Agent steps (LLM calls within a query)."),
+    "agent_parse_errors_total": ("counter", "Agent steps whose output could not be parsed."),
+    "llm_calls_total": ("counter", "LLM calls by completion-cache outcome."),
+    "llm_prompt_tokens_total": ("counter", "Estimated prompt tokens sent to the LLM."),
+    "llm_completion_tokens_total": ("counter", "Estimated completion tokens received."),
+    "llm_first_token_seconds": ("histogram", "Time from LLM call to first token (queueing and prefill)."),
+    "llm_decode_seconds": ("histogram", "Time from first to last token."),
+    "tool_calls_total": ("counter", "Tool calls by outcome."),
+    "tool_seconds": ("histogram", "Tool call latency."),
+    "code_exec_total": ("counter", "Code executions by outcome."),
+    "code_exec_seconds": ("histogram", "Code execution time."),
+    "code_exec_wait_seconds": ("histogram", "Time a job waited for a free execution worker."),
+    "code_exec_cache_hits_total": ("counter", "Code executions answered from the execution cache."),
+    "http_requests_total": ("counter", "HTTP requests by endpoint and status."),
+    "http_request_seconds": ("histogram", "HTTP request latency, to the end of the streamed body."),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _clip(value: Any) -> str:
+    text = str(value)
+    return text if len(text) <= MAX_LOGGED_CHARS else text[:MAX_LOGGED_CHARS] + "..."
+
+
+def _format_labels(labels: Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Metrics:
+    """Thread-safe counters and histograms with Prometheus text exposition."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], List[float]] = {}  # Bucket counts, then sum and count
+        self._collectors: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels: str):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: str):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            counts = self._histograms.get(key)
+            if counts is None:
+                counts = self._histograms[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def add_collector(self, prefix: str, stats: Callable[[], Dict[str, Any]]):
+        """Exports the numeric values of `stats()` (e.g. a cache's `stats`) as `<prefix>_<key>` gauges."""
+        with self._lock:
+            self._collectors[prefix] = stats
+
+    def render(self) -> str:
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: list(counts) for key, counts in self._histograms.items()}
+            collectors = dict(self._collectors)
+        lines = []
+        for name in sorted({name for name, _ in counters} | {name for name, _ in histograms}):
+            kind, help_text = METRICS.get(name, ("untyped", name))
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(labels)} {value:g}")
+            for (metric, labels), counts in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, count in zip(self.buckets, counts):
+                    lines.append(f"{name}_bucket{_format_labels(labels, (('le', f'{bound:g}'),))} {count:g}")
+                lines.append(f"{name}_bucket{_format_labels(labels, (('le', '+Inf'),))} {counts[-1]:g}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {counts[-2]:.6f}")
+                lines.append(f"{name}_count{_format_labels(labels)} {counts[-1]:g}")
+        for prefix, stats in sorted(collectors.items()):
+            for key, value in sorted(stats().items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines += [f"# TYPE {prefix}_{key} gauge", f"{prefix}_{key} {value:g}"]
+        return "\n".join(lines) + "\n"
+
+
+class TracingHandler(BaseCallbackHandler):
+    """Builds per-step spans for every query it sees; one handler can serve concurrent queries."""
+
+    run_inline = True  # Async agents: keep events in order and on the calling thread
+
+    def __init__(self, tracer: "Tracer", agent: str):
+        self.tracer = tracer
+        self.agent = agent
+        self._lock = threading.Lock()
+        self._roots: Dict[UUID, UUID] = {}  # Run -> root run of its query
+        self._traces: Dict[UUID, dict] = {}  # Root run -> trace being built
+        self._llm_steps: Dict[UUID, dict] = {}  # LLM run -> its step
+        self._tools: Dict[UUID, dict] = {}  # Tool run -> its span
+
+    # --- Run tree ---
+    def _enter(self, run_id: UUID, parent_run_id: Optional[UUID], kind: str, name: str, inputs: Any) -> dict:
+        """Registers a run; returns its query's trace (a new one for a root run)."""
+        with self._lock:
+            # A run whose parent we never saw (the handler was attached below the top) starts its own trace
+            root = self._roots.get(parent_run_id, run_id) if parent_run_id else run_id
+            self._roots[run_id] = root
+            trace = self._traces.get(root)
+            if trace is None:
+                trace = self._traces[root] = {
+                    "trace_id": str(root), "agent": self.agent, "root": kind, "name": name,
+                    "input": _clip(inputs), "start": time.time(), "started": time.perf_counter(),
+                    "steps": [], "parse_errors": 0}
+            return trace
+
+    def _exit(self, run_id: UUID, error: Optional[BaseException] = None):
+        with self._lock:
+            root = self._roots.pop(run_id, None)
+            trace = self._traces.pop(run_id, None) if root == run_id else None
+            if trace is not None:
+                self._roots = {run: r for run, r in self._roots.items() if r != run_id}
+        if trace is not None:
+            self.tracer.finish_trace(trace, error)
+
+    @staticmethod
+    def _name(serialized: Optional[Dict[str, Any]], kwargs: Dict[str, Any], default: str) -> str:
+        return kwargs.get("name") or (serialized or {}).get("name") or default
+
+    # --- Chains ---
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs: Any) -> None:
+        self._enter(run_id, parent_run_id, "chain", self._name(serialized, kwargs, "chain"),
+                    inputs.get("input", inputs) if isinstance(inputs, dict) else inputs)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs: Any) -> None:
+        self._exit(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs: Any) -> None:
+        self._exit(run_id, error)
+
+    # --- LLM calls: each one starts an agent step ---
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs: Any) -> None:
+        trace = self._enter(run_id, parent_run_id, "llm", self._name(serialized, kwargs, "llm"), prompts[0][-200:])
+        step = {"step": len(trace["steps"]), "start": time.time(), "started": time.perf_counter(),
+                "prompt_tokens": sum(estimate_tokens(p) for p in prompts), "completion_tokens": 0,
+                "first_token_seconds": None, "decode_seconds": None, "llm_seconds": None,
+                "cache_hit": False, "actions": [], "tools": [], "parse_error": False, "_text": []}
+        with self._lock:
+            trace["steps"].append(step)
+            self._llm_steps[run_id] = step
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs: Any) -> None:
+        prompts = ["\n".join(str(m.content) for m in batch) for batch in messages]
+        self.on_llm_start(serialized, prompts, run_id=run_id, parent_run_id=parent_run_id, **kwargs)
+
+    def on_llm_new_token(self, token: str, *, run_id, chunk=None, **kwargs: Any) -> None:
+        step = self._llm_steps.get(run_id)
+        if step is None:
+            return
+        if step["first_token_seconds"] is None:
+            step["first_token_seconds"] = time.perf_counter() - step["started"]
+            info = getattr(chunk, "generation_info", None) or {}
+            step["cache_hit"] = bool(info.get("cache_hit"))
+        step["_text"].append(token)
+
+    def on_llm_end(self, response, *, run_id, **kwargs: Any) -> None:
+        self._end_llm(run_id, response)
+
+    def on_llm_error(self, error, *, run_id, **kwargs: Any) -> None:
+        with self._lock:
+            step = self._llm_steps.get(run_id)
+        if step is not None:
+            step["error"] = _clip(f"{type(error).__name__}: {error}")
+        self._end_llm(run_id, None, error)
+
+    def _end_llm(self, run_id: UUID, response, error: Optional[BaseException] = None):
+        with self._lock:
+            step = self._llm_steps.pop(run_id, None)
+        if step is not None:
+            elapsed = time.perf_counter() - step["started"]
+            text = "".join(step.pop("_text"))
+            if not text and response is not None:
+                text = "".join(g.text for gens in response.generations for g in gens)
+            step["llm_seconds"] = elapsed
+            step["completion_tokens"] = estimate_tokens(text)
+            if step["first_token_seconds"] is not None:
+                step["decode_seconds"] = elapsed - step["first_token_seconds"]
+            self.tracer.observe_llm(self.agent, step)
+        self._exit(run_id, error)
+
+    # --- Agent actions and tools ---
+    def on_agent_action(self, action, *, run_id, **kwargs: Any) -> None:
+        with self._lock:
+            trace = self._traces.get(self._roots.get(run_id, run_id))
+            if trace is None or not trace["steps"]:
+                return
+            step = trace["steps"][-1]
+            step["actions"].append(action.tool)
+            if action.tool == "_Exception" and not step["parse_error"]:
+                step["parse_error"] = True
+                trace["parse_errors"] += 1
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs: Any) -> None:
+        name = self._name(serialized, kwargs, "tool")
+        trace = self._enter(run_id, parent_run_id, "tool", name, input_str)
+        span = {"tool": name, "input": _clip(input_str), "started": time.perf_counter(),
+                "seconds": None, "error": None}
+        with self._lock:
+            self._tools[run_id] = span
+            if trace["steps"]:
+                trace["steps"][-1]["tools"].append(span)
+            else:  # A tool called without an LLM step, e.g. a routed query
+                trace.setdefault("tools", []).append(span)
+
+    def on_tool_end(self, output, *, run_id, **kwargs: Any) -> None:
+        self._end_tool(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs: Any) -> None:
+        self._end_tool(run_id, error)
+
+    def _end_tool(self, run_id: UUID, error: Optional[BaseException] = None):
+        with self._lock:
+            span = self._tools.pop(run_id, None)
+        if span is not None:
+            span["seconds"] = time.perf_counter() - span.pop("started")
+            if error is not None:
+                span["error"] = _clip(f"{type(error).__name__}: {error}")
+            self.tracer.observe_tool(span)
+        self._exit(run_id, error)
+
+
+class Tracer:
+    """Process-wide switch, metrics registry and trace-file writer."""
+
+    def __init__(self, enabled: bool = TRACING_ENABLED, trace_file: Optional[str] = TRACE_FILE):
+        self.enabled = enabled
+        self.trace_file = trace_file
+        self.metrics = Metrics()
+        self._handlers: Dict[str, TracingHandler] = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def callbacks(self, agent: str) -> List[BaseCallbackHandler]:
+        """Callbacks to pass in `config={"callbacks": ...}` of a query; empty when tracing is off."""
+        if not self.enabled:
+            return []
+        with self._lock:
+            handler = self._handlers.get(agent)
+            if handler is None:
+                handler = self._handlers[agent] = TracingHandler(self, agent)
+            return [handler]
+
+    # --- Recording ---
+    def observe_llm(self, agent: str, step: dict):
+        m = self.metrics
+        m.inc("llm_calls_total", agent=agent, cache="hit" if step["cache_hit"] else "miss")
+        m.inc("llm_prompt_tokens_total", step["prompt_tokens"], agent=agent)
+        m.inc("llm_completion_tokens_total", step["completion_tokens"], agent=agent)
+        if step["cache_hit"]:
+            return  # A cached completion arrives at once; keep it out of the latency split
+        if step["first_token_seconds"] is not None:
+            m.observe("llm_first_token_seconds", step["first_token_seconds"], agent=agent)
+        if step["decode_seconds"] is not None:
+            m.observe("llm_decode_seconds", step["decode_seconds"], agent=agent)
+
+    def observe_tool(self, span: dict):
+        self.metrics.inc("tool_calls_total", tool=span["tool"], status="error" if span["error"] else "ok")
+        self.metrics.observe("tool_seconds", span["seconds"], tool=span["tool"])
+
+    def finish_trace(self, trace: dict, error: Optional[BaseException] = None):
+        """Records a finished query and appends its step spans and summary to the trace file."""
+        ended = time.perf_counter()
+        agent, steps = trace["agent"], trace["steps"]
+        seconds = ended - trace.pop("started")
+        status = "error" if error is not None else "ok"
+        self.metrics.inc("agent_queries_total", agent=agent, status=status)
+        self.metrics.observe("agent_query_seconds", seconds, agent=agent)
+        self.metrics.inc("agent_steps_total", len(steps), agent=agent)
+        if trace["parse_errors"]:
+            self.metrics.inc("agent_parse_errors_total", trace["parse_errors"], agent=agent)
+        if not self.trace_file:
+            return
+        records = []
+        for i, step in enumerate(steps):
+            step_end = steps[i + 1]["started"] if i + 1 < len(steps) else ended
+            records.append(dict({k: v for k, v in step.items() if k != "started" and not k.startswith("_")},
+                                type="step", trace_id=trace["trace_id"], agent=agent,
+                                seconds=step_end - step["started"],
+                                tool_seconds=sum(t["seconds"] or 0 for t in step["tools"])))
+        records.append(dict({k: v for k, v in trace.items() if k != "steps"}, type="trace", status=status,
+                            error=_clip(f"{type(error).__name__}: {error}") if error is not None else None,
+                            seconds=seconds, steps=len(steps),
+                            prompt_tokens=sum(s["prompt_tokens"] for s in steps),
+                            completion_tokens=sum(s["completion_tokens"] for s in steps),
+                            cache_hits=sum(bool(s["cache_hit"]) for s in steps)))
+        self._write(records)
+
+    def _write(self, records: List[dict]):
+        lines = "".join(json.dumps(r, default=str, ensure_ascii=False) + "\n" for r in records)
+        with self._write_lock, open(self.trace_file, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+    def trace_stream(self, tokens: Iterable[str], prompt: str, agent: str) -> Iterator[str]:
+        """Wraps an LLM token stream that bypasses LangChain, recording it as a one-step trace."""
+        if not self.enabled:
+            return iter(tokens)
+        return self._traced_stream(tokens, prompt, agent)
+
+    def _traced_stream(self, tokens: Iterable[str], prompt: str, agent: str) -> Iterator[str]:
+        started = time.perf_counter()
+        step = {"step": 0, "start": time.time(), "started": started, "prompt_tokens": estimate_tokens(prompt),
+                "completion_tokens": 0, "first_token_seconds": None, "decode_seconds": None,
+                "llm_seconds": None, "cache_hit": None, "actions": [], "tools": [], "parse_error": False}
+        trace = {"trace_id": f"{agent}-{id(step):x}-{time.time_ns():x}", "agent": agent, "root": "stream",
+                 "name": "generate", "input": _clip(prompt[-200:]), "start": step["start"], "started": started,
+                 "steps": [step], "parse_errors": 0}
+        parts, error = [], None
+        try:
+            for token in tokens:
+                if step["first_token_seconds"] is None:
+                    step["first_token_seconds"] = time.perf_counter() - started
+                parts.append(token)
+                yield token
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            step["llm_seconds"] = time.perf_counter() - started
+            step["completion_tokens"] = estimate_tokens("".join(parts))
+            if step["first_token_seconds"] is not None:
+                step["decode_seconds"] = step["llm_seconds"] - step["first_token_seconds"]
+            self.observe_llm(agent, dict(step, cache_hit=False))
+            self.finish_trace(trace, error if not isinstance(error, GeneratorExit) else None)
+
+    def observe_exec(self, seconds: float, wait: float, outcome: str):
+        if self.enabled:
+            self.metrics.inc("code_exec_total", outcome=outcome)
+            self.metrics.observe("code_exec_seconds", seconds)
+            self.metrics.observe("code_exec_wait_seconds", wait)
+
+    def observe_exec_cache_hit(self):
+        if self.enabled:
+            self.metrics.inc("code_exec_cache_hits_total")
+
+    def render(self) -> str:
+        return self.metrics.render()
+
+    # --- Exporters ---
+    def instrument_flask(self, app, name: str, collectors: Optional[Dict[str, Callable[[], Dict[str, Any]]]] = None):
+        """Adds `/metrics` to a Flask app and, when tracing is on, request count and latency metrics."""
+        from flask import Response, g, request
+
+        for prefix, stats in (collectors or {}).items():
+            self.metrics.add_collector(prefix, stats)
+        app.add_url_rule("/metrics", "metrics",
+                         lambda: Response(self.render(), mimetype="text/plain; version=0.0.4"))
+        if not self.enabled:
+            return
+
+        @app.before_request
+        def _start_timer():
+            g.request_started = time.perf_counter()
+
+        @app.after_request
+        def _record_request(response):
+            started = g.get("request_started", time.perf_counter())
+            endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+
+            def record():  # On close, so streamed responses are timed to their last event
+                self.metrics.inc("http_requests_total", app=name, endpoint=endpoint,
+                                 status=str(response.status_code))
+                self.metrics.observe("http_request_seconds", time.perf_counter() - started,
+                                     app=name, endpoint=endpoint)
+            response.call_on_close(record)
+            return response
+
+    def serve_metrics(self, port: int = METRICS_PORT) -> Optional[ThreadingHTTPServer]:
+        """Serves `/metrics` on a background thread (for the command-line agents); no-op for port 0."""
+        if not port or self._server is not None:
+            return self._server
+        tracer = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                body = tracer.render().encode("utf-8") if self.path == "/metrics" else b"not found\n"
+                self.send_response(200 if self.path == "/metrics" else 404)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self._server
+
+
+# --- Shared tracer ---
+_shared_tracer: Optional[Tracer] = None
+_shared_lock = threading.Lock()
+
+
+def get_tracer() -> Tracer:
+    """Returns the process-wide tracer (on with `AGENT_TRACING=1`)."""
+    global _shared_tracer
+    with _shared_lock:
+        if _shared_tracer is None:
+            _shared_tracer = Tracer()
+        return _shared_tracer
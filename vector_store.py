@@ -0,0 +1,342 @@
+# vector_store.py
+"""In-process NumPy vector store with hybrid BM25 + cosine retrieval.
+
+For small and medium corpora this replaces Chroma: all chunk embeddings live in
+one contiguous, L2-normalized float32 matrix (memory-mapped from `vectors.npy`
+when loaded from disk), dense search is a single matrix-vector product with
+`argpartition` for top-k, and a BM25 inverted index over the same chunks adds
+exact-term matching. `HybridRetriever` plugs into `RetrievalQA.from_chain_type`.
+
+With `index_type="ivf"` the dense stage uses the approximate `ann_index.IVFIndex`
+once the store holds `ann_min_size` chunks, so retrieval scales to millions.
+
+Additions are append-only on disk: new rows go to `vectors.log` and new chunks
+are appended to `chunks.jsonl`. In memory they are kept as blocks that are
+merged on the first search. So ingesting a corpus batch by batch costs I/O
+proportional to the new chunks, not to the store. Once the log outgrows
+`vectors.npy`, or on a delete, the store is compacted back into a single file.
+"""
+import json
+import math
+import os
+import re
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+VECTORS_FILE = "vectors.npy"
+VECTORS_LOG = "vectors.log"  # Raw float32 rows appended after `vectors.npy`
+CHUNKS_FILE = "chunks.jsonl"
+ANN_DIR = "ivf"
+INDEX_TYPES = ("exact", "ivf")
+DEFAULT_ANN_MIN_SIZE = 20_000  # Below this, exact search is already fast enough
+RETRAIN_GROWTH = 4  # Retrain IVF centroids once the store is this many times its training size
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the `k` largest scores, best first, in O(n + k log k)."""
+    if k <= 0 or scores.size == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < scores.size:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(scores.size)
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed list of texts, stored as per-term posting arrays."""
+
+    def __init__(self, texts: List[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.size = len(texts)
+        postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        lengths = np.zeros(self.size, dtype=np.float32)
+        for doc_id, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lengths[doc_id] = sum(counts.values())
+            for term, tf in counts.items():
+                docs, tfs = postings.setdefault(term, ([], []))
+                docs.append(doc_id)
+                tfs.append(tf)
+        self.postings = {term: (np.asarray(docs, dtype=np.int64), np.asarray(tfs, dtype=np.float32))
+                         for term, (docs, tfs) in postings.items()}
+        avg_length = float(lengths.mean()) if self.size else 1.0
+        # Per-document length normalization is query independent, so precompute it
+        self._length_norm = k1 * (1 - b + b * lengths / max(avg_length, 1e-9))
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            docs, tfs = posting
+            idf = math.log(1 + (self.size - docs.size + 0.5) / (docs.size + 0.5))
+            scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + self._length_norm[docs])
+        return scores
+
+
+class NumpyVectorStore:
+    """Chunks plus a contiguous float32 embedding matrix, persisted as `.npy` + JSONL."""
+
+    def __init__(self, embedding_function, persist_directory: Optional[str] = None,
+                 index_type: str = "exact", nprobe: Optional[int] = None,
+                 ann_min_size: int = DEFAULT_ANN_MIN_SIZE):
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type {index_type!r}; expected one of {INDEX_TYPES}")
+        self.embedding_function = embedding_function
+        self.persist_directory = persist_directory
+        self.index_type = index_type
+        self.nprobe = nprobe
+        self.ann_min_size = ann_min_size
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.metadatas: List[dict] = []
+        self._id_set = set()
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._pending: List[np.ndarray] = []  # Added rows not yet merged into `_vectors`
+        self._base_rows = 0  # Rows in `vectors.npy`; the rest of the persisted rows are in the log
+        self._clean = False  # Whether the files match memory, so additions can be appended
+        self._bm25: Optional[BM25Index] = None
+        self._ann = None
+        if persist_directory and os.path.exists(os.path.join(persist_directory, VECTORS_FILE)):
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """The embedding matrix; blocks added since the last search are merged here, once."""
+        if self._pending:
+            blocks = self._pending if not len(self._vectors) else [np.asarray(self._vectors)] + self._pending
+            self._vectors = np.concatenate(blocks) if len(blocks) > 1 else blocks[0]
+            self._pending = []
+        return self._vectors
+
+    @vectors.setter
+    def vectors(self, value: np.ndarray):
+        self._vectors = value
+        self._pending = []
+
+    # --- Persistence ---
+    def _path(self, name: str) -> str:
+        return os.path.join(self.persist_directory, name)
+
+    def load(self):
+        """Memory-maps the vectors, so opening a large store costs almost nothing."""
+        self.vectors = np.load(self._path(VECTORS_FILE), mmap_mode="r")
+        self._base_rows = len(self._vectors)
+        if os.path.exists(self._path(VECTORS_LOG)) and self._base_rows:
+            logged = np.fromfile(self._path(VECTORS_LOG), dtype=np.float32)
+            dim = self._vectors.shape[1]
+            if logged.size >= dim:
+                self._pending = [logged[:logged.size // dim * dim].reshape(-1, dim)]
+        self.ids, self.texts, self.metadatas = [], [], []
+        with open(self._path(CHUNKS_FILE)) as f:
+            for line in f:
+                try:
+                    chunk = json.loads(line)
+                except ValueError:  # A torn last line from a crash during an append
+                    break
+                self.ids.append(chunk["id"])
+                self.texts.append(chunk["text"])
+                self.metadatas.append(chunk["metadata"])
+        rows = self._base_rows + sum(len(block) for block in self._pending)
+        # After a crash between the two appends, keep the rows both files have and rewrite on the next change
+        self._clean = rows == len(self.ids)
+        if not self._clean:
+            size = min(rows, len(self.ids))
+            self.vectors = np.asarray(self.vectors)[:size]
+            del self.ids[size:], self.texts[size:], self.metadatas[size:]
+        self._id_set = set(self.ids)
+        self._bm25 = None
+        ann_dir = self._path(ANN_DIR)
+        if self.index_type == "ivf" and os.path.exists(ann_dir):
+            from ann_index import IVFIndex
+            self._ann = IVFIndex.load(ann_dir)
+            if self.nprobe:
+                self._ann.nprobe = self.nprobe
+            indexed = len(self._ann)
+            if indexed < len(self.ids):  # Rows appended since the IVF index was last saved
+                self._ann.add(np.asarray(self.vectors[indexed:]), np.arange(indexed, len(self.ids)))
+
+    def save(self):
+        """Rewrites the store as one `vectors.npy` + `chunks.jsonl` (compacting the append log)."""
+        os.makedirs(self.persist_directory, exist_ok=True)
+        vectors_path = self._path(VECTORS_FILE)
+        chunks_path = self._path(CHUNKS_FILE)
+        # Write to temp files and swap, so a reader never sees a half-written store
+        with open(vectors_path + ".tmp", "wb") as f:
+            np.save(f, np.ascontiguousarray(self.vectors, dtype=np.float32))
+        with open(chunks_path + ".tmp", "w") as f:
+            for cid, text, metadata in zip(self.ids, self.texts, self.metadatas):
+                f.write(json.dumps({"id": cid, "text": text, "metadata": metadata}) + "\n")
+        os.replace(vectors_path + ".tmp", vectors_path)
+        os.replace(chunks_path + ".tmp", chunks_path)
+        if os.path.exists(self._path(VECTORS_LOG)):
+            os.remove(self._path(VECTORS_LOG))
+        self._base_rows = len(self.ids)
+        self._clean = True
+        if self._ann is not None:
+            self._ann.save(self._path(ANN_DIR))
+
+    def _append(self, embeddings: np.ndarray, start: int):
+        """Persists rows `start:` (just added) by appending to the log and the chunks file."""
+        with open(self._path(VECTORS_LOG), "ab") as f:
+            f.write(np.ascontiguousarray(embeddings, dtype=np.float32).tobytes())
+        with open(self._path(CHUNKS_FILE), "a") as f:
+            for cid, text, metadata in zip(self.ids[start:], self.texts[start:], self.metadatas[start:]):
+                f.write(json.dumps({"id": cid, "text": text, "metadata": metadata}) + "\n")
+
+    # --- Updates ---
+    def add_documents(self, documents: List[Document], ids: List[str]):
+        """Adds chunks under `ids`; ids already in the store (or repeated in the batch) are skipped.
+
+        Ids are content hashes, so a re-add after a crash between saving the store and
+        the caller's manifest never leaves duplicate rows.
+        """
+        fresh = {}
+        for cid, doc in zip(ids, documents):
+            if cid not in self._id_set:
+                fresh.setdefault(cid, doc)
+        if not fresh:
+            return
+        ids, documents = list(fresh), list(fresh.values())
+        embeddings = np.asarray(self.embedding_function.embed_documents(
+            [doc.page_content for doc in documents]), dtype=np.float32)
+        embeddings = normalize_rows(embeddings)
+        first_row = len(self.ids)
+        if first_row:
+            self._pending.append(embeddings)
+        else:
+            self.vectors = embeddings
+        self.ids.extend(ids)
+        self._id_set.update(ids)
+        self.texts.extend(doc.page_content for doc in documents)
+        self.metadatas.extend(dict(doc.metadata) for doc in documents)
+        self._bm25 = None
+        retrained = self._update_ann(embeddings, np.arange(first_row, len(self.ids)))
+        if not self.persist_directory:
+            return
+        # Append while the log is smaller than the base file; compacting then keeps total I/O linear
+        if self._clean and first_row and not retrained and len(self.ids) <= 2 * self._base_rows:
+            self._append(embeddings, first_row)
+        else:
+            self.save()
+
+    def delete(self, ids: Iterable[str]):
+        drop = set(ids)
+        old_size = len(self.ids)
+        keep = [i for i, cid in enumerate(self.ids) if cid not in drop]
+        self.vectors = np.asarray(self.vectors)[keep]
+        self.ids = [self.ids[i] for i in keep]
+        self._id_set = set(self.ids)
+        self.texts = [self.texts[i] for i in keep]
+        self.metadatas = [self.metadatas[i] for i in keep]
+        self._bm25 = None
+        if self._ann is not None:
+            mapping = np.full(old_size, -1, dtype=np.int64)
+            mapping[keep] = np.arange(len(keep))
+            self._ann.remap(mapping)
+        if self.persist_directory:
+            self.save()
+
+    def _update_ann(self, embeddings: np.ndarray, rows: np.ndarray) -> bool:
+        """Inserts new rows into the IVF index, building or retraining it when needed.
+
+        Returns whether it was (re)built; appended rows are otherwise re-added on `load`.
+        """
+        if self.index_type != "ivf" or len(self.ids) < self.ann_min_size:
+            return False
+        if self._ann is None or len(self.ids) > RETRAIN_GROWTH * self._ann.trained_size:
+            self.rebuild_ann()
+            return True
+        self._ann.add(embeddings, rows)
+        return False
+
+    def rebuild_ann(self):
+        """Retrains the IVF centroids on the current vectors."""
+        from ann_index import DEFAULT_NPROBE, IVFIndex
+        self._ann = IVFIndex.build(self.vectors, nprobe=self.nprobe or DEFAULT_NPROBE)
+
+    # --- Search ---
+    @property
+    def bm25(self) -> BM25Index:
+        if self._bm25 is None:
+            self._bm25 = BM25Index(self.texts)
+        return self._bm25
+
+    def _document(self, i: int) -> Document:
+        return Document(page_content=self.texts[i], metadata=self.metadatas[i])
+
+    def dense_top_k(self, query_vector: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(rows, cosine scores) of the `k` nearest chunks, via IVF when it is built."""
+        if self._ann is not None:
+            return self._ann.search(query_vector, k)
+        scores = self.vectors @ query_vector
+        rows = top_k_indices(scores, k)
+        return rows, scores[rows]
+
+    def _embed_query(self, query: str) -> np.ndarray:
+        return normalize_rows(np.asarray(self.embedding_function.embed_query(query), dtype=np.float32))
+
+    def similarity_search_with_score(self, query: str, k: int = 4) -> List[Tuple[Document, float]]:
+        if not self.ids:
+            return []
+        rows, scores = self.dense_top_k(self._embed_query(query), k)
+        return [(self._document(int(i)), float(s)) for i, s in zip(rows, scores)]
+
+    def hybrid_search(self, query: str, k: int = 4, alpha: float = 0.5,
+                      fetch_k: Optional[int] = None) -> List[Tuple[Document, float]]:
+        """Fuses cosine similarity with BM25.
+
+        The top `fetch_k` candidates of each ranking are rescored as
+        `alpha * cosine + (1 - alpha) * bm25 / max(bm25)` and the best `k` returned.
+        """
+        if not self.ids:
+            return []
+        fetch_k = fetch_k or max(4 * k, 20)
+        query_vector = self._embed_query(query)
+        sparse = self.bm25.scores(query)
+        candidates = set(self.dense_top_k(query_vector, fetch_k)[0].tolist())
+        sparse_max = float(sparse.max())
+        if sparse_max > 0:
+            candidates.update(i for i in top_k_indices(sparse, fetch_k).tolist() if sparse[i] > 0)
+        candidates = np.sort(np.fromiter(candidates, dtype=np.int64))
+        # Cosine for the (few) candidates only, so the IVF path never scans the full matrix
+        dense = np.asarray(self.vectors[candidates]) @ query_vector
+        sparse_part = sparse[candidates] / sparse_max if sparse_max > 0 else 0.0
+        fused = alpha * dense + (1 - alpha) * sparse_part
+        return [(self._document(int(candidates[i])), float(fused[i])) for i in top_k_indices(fused, k)]
+
+    def as_retriever(self, k: int = 4, alpha: float = 0.5, **kwargs) -> "HybridRetriever":
+        return HybridRetriever(store=self, k=k, alpha=alpha, **kwargs)
+
+
+class HybridRetriever(BaseRetriever):
+    """LangChain retriever over a `NumpyVectorStore` using hybrid BM25 + cosine ranking."""
+
+    store: Any
+    k: int = 4
+    alpha: float = 0.5  # 1.0 = pure embedding similarity, 0.0 = pure BM25
+
+    def _get_relevant_documents(self, query: str, *,
+                                run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return [doc for doc, _ in self.store.hybrid_search(query, k=self.k, alpha=self.alpha)]
@@ -1,6 +1,13 @@
 # Import necessary components from LangChain and Ollama
 
-from langchain_community.llms import Ollama
+from pooled_llm import PooledOllama
+from completion_cache import get_cache
+from prefix_cache import get_context_store
+from react_stream import ReActStreamParser, StepMeter
+from intent_router import RoutedAgent
+from weather_routes import make_router
+from async_tools import ToolRunner, parallelize
+from tracing import get_tracer
 from langchain.agents import AgentExecutor, Tool, create_react_agent
 from langchain_core.prompts import PromptTemplate
 import os
@@ -9,13 +16,16 @@ import os
 # Ensure Ollama is running and 'tinyllama' model is pulled.
 # You can pull the model using: ollama pull tinyllama
 OLLAMA_MODEL = "tinyllama"
-OLLAMA_BASE_URL = "http://localhost:11434" # Default Ollama server address
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434") # Default Ollama server address
 
 # --- Initialize Ollama LLM ---
-# The Ollama class allows LangChain to interact with the Ollama server.
+# PooledOllama talks to the Ollama server over shared keep-alive connections.
 # We specify the model and the base URL of the Ollama server.
 try:
-    llm = Ollama(model=OLLAMA_MODEL, base_url=OLLAMA_BASE_URL)
+    step_meter = StepMeter() # Generated tokens and wall time per agent step
+    llm = PooledOllama(model=OLLAMA_MODEL, base_url=OLLAMA_BASE_URL, temperature=0, # Greedy, so repeated steps are cached
+                       reuse_context=True, # Later ReAct steps only prefill the new scratchpad lines
+                       callbacks=[step_meter])
     print(f"Successfully initialized Ollama with model: {OLLAMA_MODEL}")
 except Exception as e:
     print(f"Error initializing Ollama: {e}")
@@ -67,6 +77,7 @@ Action: the action to take, should be one of [{tool_names}]
 Action Input: the input to the action
 Observation: the result of the action
 ... (this Thought/Action/Action Input/Observation can repeat N times)
+To look up several things at once, write one Action/Action Input pair for each before the Observation.
 Thought: I now know the final answer
 Final Answer: the final answer to the original input question
 
@@ -79,18 +90,38 @@ Thought:{agent_scratchpad}
 # --- Create the Agent ---
 # `create_react_agent` constructs an agent that uses the ReAct pattern.
 # It requires the LLM, the list of tools, and the prompt template.
-agent = create_react_agent(llm, tools, prompt_template)
+# The streaming parser stops generation as soon as a complete Action/Action Input or
+# Final Answer has been produced, and repairs common format slips instead of re-asking the model.
+# With multi_action, several Action/Action Input pairs in one step are returned together.
+react_parser = ReActStreamParser(tools, multi_action=True)
+agent = create_react_agent(llm.bind(early_stop=react_parser.find_end), tools, prompt_template,
+                           output_parser=react_parser)
 
 # --- Create the Agent Executor ---
 # The AgentExecutor is responsible for running the agent.
 # It takes the agent and the tools, and can be configured with verbosity
 # to see the agent's thought process.
-agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True, handle_parsing_errors=True)
+# parallelize() runs the actions of one step concurrently (sync tools on a thread pool, each with a
+# timeout) and merges the observations in action order before the next LLM call.
+tool_runner = ToolRunner(timeouts={"get_weather": 10})
+agent_executor = parallelize(AgentExecutor(agent=agent, tools=tools, verbose=True, handle_parsing_errors=True),
+                             tool_runner)
+
+# --- Route tool-only questions around the LLM ---
+# "What is the weather like in London?" needs no reasoning: a confident match calls the tool
+# directly and the observation is the answer. Everything else still goes through the ReAct loop.
+router = make_router()
+routed_agent = RoutedAgent(router, agent_executor)
+
+# --- Tracing ---
+# With AGENT_TRACING=1, every query appends per-step spans to traces.jsonl; METRICS_PORT serves /metrics.
+trace_config = {"callbacks": get_tracer().callbacks("weather_agent")}
+get_tracer().serve_metrics()
 
 # --- Run the Agent ---
 # print("\n--- Running Agent with a question about weather ---")
 # try:
-#     result = agent_executor.invoke({"input": "What is the weather like in London?"})
+#     result = routed_agent.invoke({"input": "What is the weather like in London?"}, trace_config)
 #     print("\nAgent's Final Answer:")
 #     print(result["output"])
 # except Exception as e:
@@ -98,7 +129,7 @@ agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True, handle_pa
 
 # print("\n--- Running Agent with a question about an unknown location ---")
 # try:
-#     result = agent_executor.invoke({"input": "What is the weather like in Tokyo?"})
+#     result = routed_agent.invoke({"input": "What is the weather like in Tokyo?"}, trace_config)
 #     print("\nAgent's Final Answer:")
 #     print(result["output"])
 # except Exception as e:
@@ -106,8 +137,15 @@ agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True, handle_pa
 
 print("\n--- Running Agent with a general question (should not use tool) ---")
 try:
-    result = agent_executor.invoke({"input": "Tell me a fun fact about cats."})
+    result = routed_agent.invoke({"input": "Tell me a fun fact about cats."}, trace_config)
     print("\nAgent's Final Answer:")
     print(result["output"])
 except Exception as e:
     print(f"\nAn error occurred during agent execution: {e}")
+
+print(f"\nCompletion cache: {get_cache().stats()}")
+print(f"KV context reuse: {get_context_store().stats()}")
+print(f"Agent steps: {step_meter.summary()}")
+print(f"Intent router: {router.stats()}")
+print(f"Tool calls: {tool_runner.stats()}")
+print(f"Prefill tokens saved per step: {[step['tokens_saved'] for step in get_context_store().steps]}")
@@ -0,0 +1,46 @@
+# weather_routes.py
+"""`intent_router` routes for the weather agent's `get_weather` tool.
+
+Kept apart from `weather_agent.py`, which starts the LLM and runs queries on
+import, so the routing decisions can be tested on their own.
+"""
+import re
+from typing import Optional
+
+from intent_router import IntentRouter, Route
+
+# --- Configuration ---
+# A classifier match must also mention the weather: "Is it safe in Rome?" is phrased like "Is it sunny in Rome?"
+WEATHER_TERMS = ("weather", "temperature", "forecast", "rain", "raining", "rainy", "snow", "snowing", "snowy",
+                 "sunny", "sunshine", "cloudy", "windy", "wind", "storm", "stormy", "foggy", "humid", "humidity",
+                 "hot", "cold", "warm", "chilly", "freezing", "degrees", "umbrella")
+NEGATIVES = [
+    "Tell me a fun fact about cats.", "What is the capital of Germany?", "Write a poem about the rain.",
+    "Explain how weather forecasts work.", "Who are you?", "Describe the weather in a novel.",
+    "What is the temperature at which water boils?",
+]
+
+
+def extract_city(query: str) -> Optional[str]:
+    cities = re.findall(r"\b(?:in|at|for|and)\s+([A-Z][\w'-]*(?:\s+[A-Z][\w'-]*)*)", query)
+    return cities[0] if len(cities) == 1 else None  # Several cities: let the agent look them up in parallel
+
+
+# The pattern must match the whole question, and the place must be capitalized (as in `extract_city`),
+# so "What is the temperature at which water boils?" and "Describe the weather in ..." reach the LLM
+weather_route = Route(
+    "get_weather",
+    patterns=[r"(?:(?:what|how)(?:'s|\s+is)\s+the\s+|(?:tell|show|give)\s+me\s+the\s+)?"
+              r"(?:weather|temperature|forecast)(?:\s+like)?(?:\s+(?:today|now|right now))?\s+(?:in|for)\s+"
+              r"(?P<input>(?-i:[A-Z])[\w.'-]*(?:\s+(?-i:[A-Z])[\w.'-]*){0,2})(?:\s+(?:today|now|right now))?\s*[?.!]*"],
+    examples=["Is it raining in Paris?", "How hot is it in Madrid?", "Do I need an umbrella in Berlin today?",
+              "How cold is it in Oslo right now?", "Is it sunny in Rome?", "Is it cold in Stockholm?",
+              "Is it windy in Dublin?", "Is it snowing in Vienna?", "Is it warm in Lisbon?", "Is it foggy in London?",
+              "Will it rain in Prague today?"],
+    extract=extract_city,
+    keywords=WEATHER_TERMS,
+)
+
+
+def make_router() -> IntentRouter:
+    return IntentRouter([weather_route], negatives=NEGATIVES)
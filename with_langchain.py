@@ -1,36 +1,45 @@
 from langchain.agents import initialize_agent, AgentType
 from langchain.tools import Tool
-from langchain.tools.python.tool import PythonREPLTool
-from langchain_community.llms import Ollama
-from langchain.memory import ConversationBufferMemory
+from code_executor import get_executor, save_artifacts
+from pooled_llm import PooledOllama
+from summary_memory import RollingSummaryMemory
+from react_stream import ReActStreamParser
+from async_tools import parallelize
 
 
 # 🧠 Use TinyLLaMA via Ollama
-llm = Ollama(model="tinyllama")
+llm = PooledOllama(model="tinyllama")
 
-# 🛠 Python tool to execute code
-python_tool = PythonREPLTool()
+# 🛠 Python tool to execute code in a pre-warmed worker process
+def run_python(code: str) -> str:
+    result = get_executor().run(code)
+    save_artifacts(result)  # Keep the plots the code wrote (under .cache/artifacts)
+    return result["stdout"] + (f"{result['error']}\n" if result["error"] else "")
 
 # 🔌 Wrap the tool as a LangChain Tool
 tools = [
     Tool.from_function(
-        func=python_tool._run,
+        func=run_python,
         name="PythonREPL",
         description="Executes Python code and returns the result."
     )
 ]
 
-# 🧠 Add memory so it remembers the conversation
-memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+# 🧠 Add memory so it remembers the conversation (token-budgeted, older turns summarized in the background)
+memory = RollingSummaryMemory(llm=llm, memory_key="chat_history", return_messages=True)
 
-# 🤖 Create the agent
-agent = initialize_agent(
+# 🧩 Parse steps as they stream; several code actions in one step are returned together
+react_parser = ReActStreamParser(tools, multiline_tools=["PythonREPL"], multi_action=True)
+
+# 🤖 Create the agent (its actions within a step run concurrently, each in its own worker process)
+agent = parallelize(initialize_agent(
     tools=tools,
-    llm=llm,
+    llm=llm.bind(early_stop=react_parser.find_end),
     agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
+    agent_kwargs={"output_parser": react_parser},
     memory=memory,
     verbose=True
-)
+))
 
 # 🧪 Example interaction
 response = agent.run("What is 5*12? Then plot a simple matplotlib chart.")